@@ -0,0 +1,242 @@
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from llm_scheduler import priority_lane
+
+# 未指定 --query-field 时依次尝试的字段
+DEFAULT_QUERY_FIELDS = ("query", "prompt", "body", "content")
+# 透传到输出结果中的标识字段
+ID_FIELDS = ("id", "request_id")
+
+
+class BatchRunner:
+    """非交互式批量运行器
+
+    从 JSONL 文件流式读取查询，在共享会话上以有限并发运行多个 process_query，
+    结果按完成顺序或输入顺序写入 JSONL 文件。运行过程中定期写检查点，
+    崩溃后可以从检查点继续：检查点之后写出的结果会被截掉并重新执行，输出中不会出现重复行。
+    """
+
+    def __init__(self, client, input_path: str, output_path: str, concurrency: int = 8,
+                 ordered: bool = False, resume: bool = False, query_field: Optional[str] = None,
+                 checkpoint_every: int = 100, checkpoint_interval: float = 5.0):
+        """
+        Args:
+            client: 已连接服务器的 MCPClient
+            input_path: 输入 JSONL 文件
+            output_path: 输出 JSONL 文件
+            concurrency: 同时运行的查询数
+            ordered: True 时按输入顺序写出结果，否则按完成顺序
+            resume: 从检查点继续上次未完成的运行
+            query_field: 查询文本所在字段，不指定时自动识别
+            checkpoint_every: 每完成多少条写一次检查点
+            checkpoint_interval: 距上次写检查点超过多少秒时写一次检查点
+        """
+        self.client = client
+        self.input_path = input_path
+        self.output_path = output_path
+        self.checkpoint_path = output_path + ".ckpt"
+        self.concurrency = max(1, concurrency)
+        self.ordered = ordered
+        self.resume = resume
+        self.query_field = query_field
+        self.checkpoint_every = max(1, checkpoint_every)
+        self.checkpoint_interval = checkpoint_interval
+
+        # 检查点状态: offset 之前的行全部完成，done 记录 offset 之后已完成的行
+        self.offset = 0
+        self.done = set()
+        # 按输入顺序输出时，等待前序结果的已完成记录
+        self.buffered: Dict[int, Dict[str, Any]] = {}
+        # 最多领先 offset 的行数，防止缓冲区和 done 集合在某一行卡住时无限增长
+        self.window = self.concurrency * 4
+        # 检查点对应的输出文件长度，恢复时截掉之后写出的内容
+        self.output_bytes = 0
+
+        self.completed = 0
+        self.failed = 0
+        self._output = None
+        self._progress = asyncio.Condition()
+        self._unsaved = 0
+        self._last_save = time.monotonic()
+
+    def load_checkpoint(self):
+        """读取检查点"""
+        if not os.path.exists(self.checkpoint_path):
+            return
+        with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        self.offset = checkpoint.get("offset", 0)
+        self.done = set(checkpoint.get("done", []))
+        self.output_bytes = checkpoint.get("output_bytes", 0)
+
+    def open_output(self):
+        """打开输出文件，恢复时截掉检查点之后写出的结果（这些行会重新执行）"""
+        if self.resume and os.path.exists(self.output_path):
+            self._output = open(self.output_path, 'r+', encoding='utf-8')
+            self._output.truncate(self.output_bytes)
+            self._output.seek(self.output_bytes)
+        else:
+            self._output = open(self.output_path, 'w', encoding='utf-8')
+
+    def save_checkpoint(self):
+        """原子地写入检查点，写入前先刷新输出文件，保证检查点不会超前于结果"""
+        self._output.flush()
+        os.fsync(self._output.fileno())
+        self.output_bytes = self._output.tell()
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"offset": self.offset, "done": sorted(self.done),
+                       "output_bytes": self.output_bytes}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+        self._unsaved = 0
+        self._last_save = time.monotonic()
+
+    def maybe_save_checkpoint(self):
+        """按条数或时间间隔写检查点，避免每条结果都 fsync"""
+        self._unsaved += 1
+        if self._unsaved >= self.checkpoint_every or \
+                time.monotonic() - self._last_save >= self.checkpoint_interval:
+            self.save_checkpoint()
+
+    def iter_queries(self) -> Iterator[Tuple[int, str]]:
+        """逐行读取输入，跳过空行和检查点中已完成的行，返回行号和原始文本"""
+        with open(self.input_path, 'r', encoding='utf-8') as f:
+            for index, line in enumerate(f):
+                if index < self.offset or index in self.done:
+                    continue
+                if not line.strip():
+                    # 空行视为已完成，避免阻塞 offset 前进
+                    self.done.add(index)
+                    self.drain()
+                    continue
+                yield index, line
+
+    def extract_query(self, item: Any) -> str:
+        """从输入记录中取出查询文本"""
+        if isinstance(item, str):
+            return item
+        if self.query_field:
+            return str(item[self.query_field])
+        for field in DEFAULT_QUERY_FIELDS:
+            if field in item:
+                return str(item[field])
+        raise ValueError(f"输入记录中缺少查询字段，可用 --query-field 指定: {list(item)}")
+
+    async def run_one(self, index: int, line: str) -> Dict[str, Any]:
+        """运行单个查询，任何异常（包括无效的 JSON 行）都记录到结果中而不会中断整个批次"""
+        record: Dict[str, Any] = {"index": index}
+        start = time.perf_counter()
+        try:
+            item = json.loads(line)
+            if isinstance(item, dict):
+                for field in ID_FIELDS:
+                    if field in item:
+                        record[field] = item[field]
+
+            query = self.extract_query(item)
+            record["query"] = query
+            # raise_errors 使失败的查询抛出异常，而不是返回错误文本
+            # 批量查询走 batch 优先级通道，让交互式请求优先获得上游配额
+            with priority_lane("batch"):
+                record["response"] = await self.client.process_query(query, raise_errors=True)
+        except Exception as e:
+            record["error"] = str(e)
+        record["elapsed"] = round(time.perf_counter() - start, 3)
+        return record
+
+    def write_record(self, record: Dict[str, Any]):
+        self._output.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def drain(self):
+        """写出可以输出的缓冲结果，并把 offset 推进到第一个未完成的行"""
+        while self.offset in self.buffered or self.offset in self.done:
+            if self.offset in self.buffered:
+                self.write_record(self.buffered.pop(self.offset))
+            self.done.discard(self.offset)
+            self.offset += 1
+
+    async def finish(self, index: int, record: Dict[str, Any]):
+        """记录一个已完成的查询并更新检查点"""
+        self.completed += 1
+        if "error" in record:
+            self.failed += 1
+
+        if self.ordered:
+            # 等到前序结果全部写出后再按顺序输出
+            self.buffered[index] = record
+        else:
+            self.write_record(record)
+            self.done.add(index)
+        self.drain()
+
+        self.maybe_save_checkpoint()
+        if self.completed % 100 == 0:
+            print(f"[batch] 已完成 {self.completed} 条，失败 {self.failed} 条", file=sys.stderr)
+
+        async with self._progress:
+            self._progress.notify_all()
+
+    async def run(self) -> Dict[str, int]:
+        """运行整个批次
+
+        Returns:
+            包含 completed 和 failed 计数的字典
+        """
+        if self.resume:
+            self.load_checkpoint()
+        elif os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+        self.open_output()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks: List[asyncio.Task] = []
+        failures: List[BaseException] = []
+
+        async def worker(index: int, line: str):
+            try:
+                record = await self.run_one(index, line)
+                await self.finish(index, record)
+            except Exception as e:
+                # run_one 已把查询本身的错误写入结果，这里是写结果或检查点失败：该行不会完成，
+                # offset 无法前进，记录后终止批次（已写入检查点的进度可以用 --resume 继续）
+                print(f"[batch] 第 {index} 行的结果写出失败: {e!r}", file=sys.stderr)
+                failures.append(e)
+                async with self._progress:
+                    self._progress.notify_all()
+                raise
+            finally:
+                semaphore.release()
+
+        def reap(tasks: List[asyncio.Task]) -> List[asyncio.Task]:
+            # 取出已结束任务的异常并重新抛出，只保留仍在运行的任务
+            running = []
+            for task in tasks:
+                if not task.done():
+                    running.append(task)
+                elif not task.cancelled() and task.exception() is not None:
+                    raise task.exception()
+            return running
+
+        try:
+            for index, line in self.iter_queries():
+                # 限制领先于第一个未完成行的行数
+                async with self._progress:
+                    await self._progress.wait_for(lambda: failures or index - self.offset < self.window)
+                tasks = reap(tasks)
+                await semaphore.acquire()
+                tasks.append(asyncio.create_task(worker(index, line)))
+            await asyncio.gather(*tasks)
+            self.save_checkpoint()
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._output.close()
+
+        print(f"[batch] 完成，共 {self.completed} 条，失败 {self.failed} 条，结果写入 {self.output_path}",
+              file=sys.stderr)
+        return {"completed": self.completed, "failed": self.failed}
@@ -0,0 +1,86 @@
+"""对比每次新建 httpx.AsyncClient 与共享连接池调用 LLM 的单次耗时
+
+用法:
+    python benchmarks/bench_http_pool.py --requests 200
+    # 测量 TLS 握手开销（需要自签名证书）
+    python benchmarks/bench_http_pool.py --ssl-certfile cert.pem --ssl-keyfile key.pem
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from typing import List
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mcp_client import MCPClient
+from stub_llm import start_stub_server
+
+MESSAGES = [{"role": "user", "content": "ping"}]
+
+
+def summarize(name: str, samples: List[float]) -> None:
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{name:<12} 平均 {statistics.mean(samples) * 1000:7.2f} ms  "
+          f"p50 {statistics.median(samples) * 1000:7.2f} ms  p95 {p95 * 1000:7.2f} ms")
+
+
+async def bench_per_call_client(base_url: str, n: int, verify: bool) -> List[float]:
+    """旧实现：每次调用都新建客户端（每次都要 TCP/TLS 握手）"""
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        async with httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=30.0), verify=verify) as client:
+            response = await client.post(f"{base_url}/chat/completions",
+                                         json={"model": "stub", "messages": MESSAGES})
+            response.json()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def bench_pooled_client(base_url: str, n: int, verify: bool) -> List[float]:
+    """新实现：MCPClient.call_qwen_api 复用共享连接池"""
+    client = MCPClient(config_file=None, api_base=base_url, api_key="stub", http2=False)
+    if not verify:
+        client.http_client = httpx.AsyncClient(verify=False)
+        client.exit_stack.push_async_callback(client.http_client.aclose)
+    samples = []
+    try:
+        for _ in range(n):
+            start = time.perf_counter()
+            await client.call_qwen_api(MESSAGES)
+            samples.append(time.perf_counter() - start)
+    finally:
+        await client.cleanup()
+    return samples
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="连接池基准测试")
+    parser.add_argument("--requests", type=int, default=200, help="每种模式的请求数")
+    parser.add_argument("--ssl-certfile", help="TLS 证书文件")
+    parser.add_argument("--ssl-keyfile", help="TLS 私钥文件")
+    args = parser.parse_args()
+
+    stub = await start_stub_server(ssl_certfile=args.ssl_certfile, ssl_keyfile=args.ssl_keyfile)
+    verify = not args.ssl_certfile
+    try:
+        per_call = await bench_per_call_client(stub["base_url"], args.requests, verify)
+        pooled = await bench_pooled_client(stub["base_url"], args.requests, verify)
+    finally:
+        stub["server"].should_exit = True
+        await stub["task"]
+
+    print(f"桩服务器: {stub['base_url']}，每种模式 {args.requests} 次请求")
+    summarize("每次新建", per_call)
+    summarize("共享连接池", pooled)
+    saving = statistics.median(per_call) - statistics.median(pooled)
+    print(f"每次调用节省 (p50): {saving * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,211 @@
+"""MCP 负载生成器：离线测量吞吐量、延迟分位数和内存占用
+
+两种负载：
+    query  经 MCPClient.process_query 运行完整的链式调用（LLM 由本地桩服务器按脚本模拟）
+    tool   直接调用服务器工具（call_tool），不经过 LLM
+
+用法:
+    python benchmarks/load_gen.py --transport stdio --workload tool --requests 1000 --concurrency 32
+    python benchmarks/load_gen.py --transport sse --workload query --requests 200 --latency 0.05 --token-rate 200
+    python benchmarks/load_gen.py --transport sse --sse-workers 4 --workload tool --json report.json
+
+服务器端 LLM 工具（summarize_text 等）使用 config.json 中的 api_base，离线测试时请指向桩服务器或改用
+calculate、get_weather 等不依赖上游的工具。
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from mcp import StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from mcp_client import MCPClient
+from stub_llm import load_script, start_stub_server
+from tracing import Histogram
+
+# 默认的 query 脚本：两跳工具调用后给出回答
+DEFAULT_SCRIPT = [
+    {"tool_calls": [{"name": "calculate", "arguments": {"expression": "sqrt(3**2 + 4**2)"}}]},
+    {"tool_calls": [{"name": "get_weather", "arguments": {"city": "北京"}}]},
+    {"content": "结果是 5，北京晴"},
+]
+
+
+def rss_kb(pid: int) -> Dict[str, int]:
+    """读取进程当前和峰值常驻内存（KB），进程不存在时返回 0"""
+    result = {"rss_kb": 0, "peak_rss_kb": 0}
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    result["rss_kb"] = int(line.split()[1])
+                elif line.startswith("VmHWM:"):
+                    result["peak_rss_kb"] = int(line.split()[1])
+    except OSError:
+        pass
+    return result
+
+
+def child_pids(pid: int) -> List[int]:
+    """递归列出子进程"""
+    children = []
+    for path in glob.glob(f"/proc/{pid}/task/*/children"):
+        try:
+            with open(path, "r") as f:
+                children.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return children + [grandchild for child in children for grandchild in child_pids(child)]
+
+
+def server_rss(pids: List[int]) -> Dict[str, int]:
+    """服务器进程（及其 worker/工作进程）的内存合计"""
+    total = {"rss_kb": 0, "peak_rss_kb": 0, "processes": 0}
+    for pid in pids:
+        usage = rss_kb(pid)
+        if usage["rss_kb"]:
+            total["rss_kb"] += usage["rss_kb"]
+            total["peak_rss_kb"] += usage["peak_rss_kb"]
+            total["processes"] += 1
+    return total
+
+
+async def wait_for_port(host: str, port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"服务器 {host}:{port} 未在 {timeout} 秒内启动")
+
+
+async def run_load(requests: int, concurrency: int, call) -> Dict[str, Any]:
+    """以固定并发执行 requests 次调用，返回吞吐量和延迟分布"""
+    histogram = Histogram()
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for index in remaining:
+            start = time.perf_counter()
+            try:
+                await call(index)
+            except Exception:
+                errors += 1
+            histogram.record(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    elapsed = time.perf_counter() - started
+    stats = histogram.summary()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {key: round(stats[key] * 1000, 2) for key in ("mean", "p50", "p95", "p99", "max")},
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="MCP 负载生成器")
+    parser.add_argument("--transport", choices=["stdio", "sse"], default="stdio")
+    parser.add_argument("--workload", choices=["query", "tool"], default="tool")
+    parser.add_argument("--server", default=os.path.join(ROOT, "testsever", "main.py"), help="服务器脚本")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=10, help="不计入统计的预热请求数")
+    parser.add_argument("--replicas", type=int, default=1, help="客户端打开的会话数")
+    parser.add_argument("--sse-port", type=int, default=8765)
+    parser.add_argument("--sse-workers", type=int, default=1, help="SSE 服务器的 worker 进程数")
+    parser.add_argument("--tool", default="calculate", help="tool 负载调用的工具")
+    parser.add_argument("--tool-args", default='{"expression": "2 ** 10 + sqrt(16)"}', help="工具参数 (JSON)")
+    parser.add_argument("--query", default="计算 3 和 4 为直角边的斜边长度，并查询北京天气", help="query 负载的查询")
+    parser.add_argument("--script", help="桩服务器的脚本化响应（JSON 文件），默认两跳工具调用")
+    parser.add_argument("--latency", type=float, default=0.0, help="桩服务器首个 token 前的延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="桩服务器输出速度（token/秒）")
+    parser.add_argument("--stream", action="store_true", help="以流式方式请求 LLM")
+    parser.add_argument("--json", help="把报告写入该 JSON 文件，便于比较回归")
+    args = parser.parse_args()
+
+    stub = await start_stub_server(latency=args.latency, script=load_script(args.script) or DEFAULT_SCRIPT,
+                                   token_rate=args.token_rate)
+    client = MCPClient(None, api_base=stub["base_url"], api_key="stub", http2=False, stream=args.stream)
+    server_process: Optional[subprocess.Popen] = None
+    try:
+        if args.transport == "stdio":
+            params = StdioServerParameters(command=sys.executable, args=[args.server])
+            await client._connect_group("bench", lambda: stdio_client(params), args.replicas)
+            server_pids = child_pids(os.getpid())
+        else:
+            server_process = subprocess.Popen(
+                [sys.executable, args.server, "--mode", "http", "--port", str(args.sse_port),
+                 "--workers", str(args.sse_workers)],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            await wait_for_port("127.0.0.1", args.sse_port)
+            await client.connect_to_sse_server(f"http://127.0.0.1:{args.sse_port}/sse", replicas=args.replicas)
+            server_pids = [server_process.pid] + child_pids(server_process.pid)
+
+        tool_args = json.loads(args.tool_args)
+
+        async def call_tool(_):
+            result = await client.servers.call_tool(args.tool, tool_args)
+            if result.isError:
+                raise RuntimeError(str(result.content))
+
+        async def query(_):
+            await client.process_query(args.query, raise_errors=True)
+
+        call = call_tool if args.workload == "tool" else query
+        if args.warmup:
+            await run_load(args.warmup, min(args.warmup, args.concurrency), call)
+        report = await run_load(args.requests, args.concurrency, call)
+        # 运行期间可能有新的工作进程启动，重新收集
+        if server_process is not None:
+            server_pids = [server_process.pid] + child_pids(server_process.pid)
+        else:
+            server_pids = child_pids(os.getpid())
+        report.update({
+            "transport": args.transport,
+            "workload": args.workload,
+            "concurrency": args.concurrency,
+            "client_memory": rss_kb(os.getpid()),
+            "server_memory": server_rss(server_pids),
+        })
+    finally:
+        await client.cleanup()
+        if server_process is not None:
+            server_process.terminate()
+            server_process.wait()
+        stub["server"].should_exit = True
+        await stub["task"]
+
+    latency = report["latency_ms"]
+    print(f"\n{args.transport}/{args.workload}: {report['requests']} 次请求，并发 {args.concurrency}，"
+          f"失败 {report['errors']}")
+    print(f"吞吐量 {report['throughput_rps']} 次/秒，耗时 {report['duration_s']} 秒")
+    print(f"延迟 p50 {latency['p50']} ms，p95 {latency['p95']} ms，p99 {latency['p99']} ms，最大 {latency['max']} ms")
+    print(f"客户端 RSS {report['client_memory']['rss_kb'] / 1024:.1f} MB"
+          f"（峰值 {report['client_memory']['peak_rss_kb'] / 1024:.1f} MB），"
+          f"服务器 RSS {report['server_memory']['rss_kb'] / 1024:.1f} MB"
+          f"（{report['server_memory']['processes']} 个进程）")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,188 @@
+"""本地 OpenAI 兼容的 /chat/completions 桩服务器，用于离线基准测试
+
+脚本文件（--script）是一个 JSON 数组，按链式调用的跳数依次给出响应：
+    [
+        {"tool_calls": [{"name": "calculate", "arguments": {"expression": "2+3"}}]},
+        {"tool_calls": [{"name": "get_weather", "arguments": {"city": "北京"}}]},
+        {"content": "计算结果是 5，北京晴"}
+    ]
+跳数由请求中最后一条用户消息之后的 tool 消息组数决定；超出脚本长度时返回普通文本。
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+# 未使用脚本或超出脚本时的默认回复
+DEFAULT_CONTENT = "ok"
+
+
+def current_hop(messages: List[Dict[str, Any]]) -> int:
+    """当前是本轮第几跳：最后一条用户消息之后出现过几次带 tool_calls 的助手消息"""
+    hop = 0
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            break
+        if message.get("role") == "assistant" and message.get("tool_calls"):
+            hop += 1
+    return hop
+
+
+def scripted_message(script: Optional[List[Dict[str, Any]]], hop: int, output_tokens: int) -> Dict[str, Any]:
+    """按脚本生成本跳的助手消息"""
+    step = script[hop] if script and hop < len(script) else {}
+    if step.get("tool_calls"):
+        return {"role": "assistant", "content": "", "tool_calls": [{
+            "id": f"call_{uuid.uuid4().hex[:12]}",
+            "type": "function",
+            "function": {"name": call["name"], "arguments": json.dumps(call.get("arguments", {}),
+                                                                        ensure_ascii=False)},
+        } for call in step["tool_calls"]]}
+    content = step.get("content") or (" ".join([DEFAULT_CONTENT] * output_tokens) if output_tokens > 1
+                                      else DEFAULT_CONTENT)
+    return {"role": "assistant", "content": content}
+
+
+def count_tokens(message: Dict[str, Any]) -> int:
+    """粗略的输出 token 数：文本按空格切分，工具调用按参数长度/4"""
+    tokens = len(message.get("content", "").split())
+    for call in message.get("tool_calls", []):
+        tokens += max(1, len(call["function"]["arguments"]) // 4)
+    return max(1, tokens)
+
+
+def stream_pieces(message: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """把助手消息拆成流式增量，每个增量约为一个 token"""
+    pieces: List[Dict[str, Any]] = [{"role": "assistant"}]
+    words = message.get("content", "").split(" ")
+    for i, word in enumerate(words):
+        if word:
+            pieces.append({"content": word if i == 0 else f" {word}"})
+    for index, call in enumerate(message.get("tool_calls", [])):
+        pieces.append({"tool_calls": [{"index": index, "id": call["id"], "type": "function",
+                                       "function": {"name": call["function"]["name"], "arguments": ""}}]})
+        arguments = call["function"]["arguments"]
+        for start in range(0, len(arguments), 4):
+            pieces.append({"tool_calls": [{"index": index,
+                                           "function": {"arguments": arguments[start:start + 4]}}]})
+    return pieces
+
+
+def create_app(latency: float = 0.0, script: Optional[List[Dict[str, Any]]] = None,
+               token_rate: float = 0.0, output_tokens: int = 1) -> Starlette:
+    """创建桩服务器应用
+
+    Args:
+        latency: 每个请求在输出第一个 token 前的模拟延迟（秒）
+        script: 按跳数给出的脚本化响应，见模块说明
+        token_rate: 输出速度（token/秒），0 表示立即输出全部内容
+        output_tokens: 非脚本回复的 token 数
+    """
+    async def chat_completions(request: Request):
+        body = await request.json()
+        if latency > 0:
+            await asyncio.sleep(latency)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        message = scripted_message(script, current_hop(body.get("messages", [])), output_tokens)
+        finish_reason = "tool_calls" if message.get("tool_calls") else "stop"
+        completion_tokens = count_tokens(message)
+        usage = {
+            "prompt_tokens": len(json.dumps(body.get("messages", []), ensure_ascii=False)) // 4,
+            "completion_tokens": completion_tokens,
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + completion_tokens
+
+        if body.get("stream"):
+            pieces = stream_pieces(message)
+            delay = 1.0 / token_rate if token_rate > 0 else 0.0
+
+            async def events():
+                for piece in pieces:
+                    if delay and ("content" in piece or "tool_calls" in piece):
+                        await asyncio.sleep(delay)
+                    yield "data: " + json.dumps({
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "choices": [{"index": 0, "delta": piece, "finish_reason": None}],
+                    }, ensure_ascii=False) + "\n\n"
+                yield "data: " + json.dumps({
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}],
+                }) + "\n\n"
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    yield "data: " + json.dumps({"id": completion_id, "object": "chat.completion.chunk",
+                                                 "choices": [], "usage": usage}) + "\n\n"
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        if token_rate > 0:
+            await asyncio.sleep(completion_tokens / token_rate)
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": finish_reason,
+            }],
+            "usage": usage,
+        })
+
+    return Starlette(routes=[Route("/chat/completions", chat_completions, methods=["POST"])])
+
+
+def load_script(path: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+    """读取脚本文件，未指定时返回 None"""
+    if not path:
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+async def start_stub_server(host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                            ssl_certfile: Optional[str] = None,
+                            ssl_keyfile: Optional[str] = None,
+                            script: Optional[List[Dict[str, Any]]] = None,
+                            token_rate: float = 0.0, output_tokens: int = 1) -> Dict[str, Any]:
+    """在当前事件循环中后台启动桩服务器
+
+    Returns:
+        包含 base_url、server 和 task 的字典，结束时设置 server.should_exit = True
+    """
+    config = uvicorn.Config(create_app(latency, script, token_rate, output_tokens), host=host, port=port,
+                            log_level="warning", ssl_certfile=ssl_certfile, ssl_keyfile=ssl_keyfile)
+    server = uvicorn.Server(config)
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    bound_port = server.servers[0].sockets[0].getsockname()[1]
+    scheme = "https" if ssl_certfile else "http"
+    return {"base_url": f"{scheme}://{host}:{bound_port}", "server": server, "task": task}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地 LLM 桩服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.0, help="首个 token 前的模拟延迟（秒）")
+    parser.add_argument("--script", help="脚本化响应的 JSON 文件")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="输出速度（token/秒），0 表示不限速")
+    parser.add_argument("--output-tokens", type=int, default=1, help="非脚本回复的 token 数")
+    parser.add_argument("--ssl-certfile", help="TLS 证书文件（用于测量 TLS 握手开销）")
+    parser.add_argument("--ssl-keyfile", help="TLS 私钥文件")
+    args = parser.parse_args()
+
+    print(f"启动 LLM 桩服务器: http://{args.host}:{args.port}/chat/completions")
+    uvicorn.run(create_app(args.latency, load_script(args.script), args.token_rate, args.output_tokens),
+                host=args.host, port=args.port, ssl_certfile=args.ssl_certfile, ssl_keyfile=args.ssl_keyfile)
@@ -1,6 +1,7 @@
 import os
 import json
-from typing import Dict, Any, Optional
+import tempfile
+from typing import Dict, Any, Optional, List
 
 class Config:
     def __init__(self, config_file: Optional[str] = None, **kwargs):
@@ -10,6 +11,86 @@ class Config:
         self.model = 'qwen-max-latest'
         self.max_tokens = 2000
         self.temperature = 0.7
+        self.stream = False  # 以流式 (SSE) 方式请求 LLM，实时输出生成内容
+        self.prompt_cache_control = False  # 在最后一条消息上添加 cache_control 显式缓存标记（需模型支持）
+        # 上游 HTTP 连接池配置（客户端复用连接调用 LLM API）
+        self.http_max_connections = 20
+        self.http_max_keepalive_connections = 10
+        self.http_keepalive_expiry = 30.0
+        self.http2 = True
+        self.http_timeout = 60.0
+        self.http_connect_timeout = 30.0
+        # 服务器 fetch 工具的连接池配置（与上游 LLM 连接池相互独立）
+        self.fetch_max_connections = 50
+        self.fetch_max_keepalive_connections = 20
+        self.fetch_max_connections_per_host = 6  # 同一主机同时进行的请求数上限
+        self.fetch_keepalive_expiry = 30.0
+        self.fetch_timeout = 30.0
+        self.fetch_max_bytes = 5 * 1024 * 1024  # 单次 fetch 最多下载的字节数
+        self.fetch_cache_enabled = True  # 按 HTTP 缓存语义缓存 fetch 结果
+        self.fetch_cache_max_bytes = 16 * 1024 * 1024
+        self.dns_cache_ttl = 300.0  # 服务器连接池的 DNS 缓存时间（秒）
+        # 服务器工具执行配置（@mcp.tool(execution="thread"/"process") 的工具使用）
+        self.server_thread_workers = 4
+        self.server_process_workers = 2
+        self.server_tool_queue_size = 64  # 每种执行策略最多排队的调用数，超过时拒绝
+        self.calculate_timeout = 2.0  # calculate 单次执行的时间上限（秒）
+        self.tool_coalescing = True  # 参数相同的并发工具调用合并为一次执行
+        self.tool_coalescing_exclude = []  # 不参与合并的工具名（有副作用、不幂等的工具）
+        # 服务器 HTTP (SSE) 模式配置
+        self.sse_workers = 1  # worker 进程数，大于 1 时共享监听端口并按会话路由消息
+        self.sse_graceful_timeout = 30.0  # 停止时等待进行中的连接完成的最长时间（秒）
+        self.streamable_http_stateless = True  # streamable-http 模式不保存会话，可任意负载均衡
+        self.streamable_http_json_response = False  # streamable-http 模式直接返回 JSON 而不是 SSE 流
+        # 上游 LLM 调度配置（客户端与服务器的 LLM 请求共用）
+        self.rate_limit_rpm = 0  # 每分钟请求数上限，0 表示不限制
+        self.rate_limit_tpm = 0  # 每分钟 token 数上限，0 表示不限制
+        self.llm_min_concurrency = 1
+        self.llm_max_concurrency = 16  # 自适应并发的上限，遇到 429 时减半，成功时逐步恢复
+        self.llm_latency_target = 0.0  # 单次请求延迟目标（秒），超过时降低并发，0 表示只根据 429 调整
+        self.llm_max_retries = 3
+        self.llm_retry_base_delay = 0.5
+        self.llm_retry_max_delay = 20.0
+        # 服务器端 LLM 工具结果缓存（摘要、翻译、情感分析）
+        self.llm_cache_enabled = True
+        self.llm_cache_max_bytes = 32 * 1024 * 1024  # 内存层大小上限
+        self.llm_cache_ttl = 3600.0  # 过期时间（秒），0 表示不过期
+        self.llm_cache_path = ""  # sqlite 磁盘层文件路径，为空时只使用内存层
+        self.llm_cache_disk_max_bytes = 256 * 1024 * 1024  # 磁盘层大小上限，0 表示不限制
+        # 服务器文本工具的微批处理（并发的单条摘要、翻译、情感分析合并为一次上游请求）
+        self.text_batching = False
+        self.text_batch_window = 0.02  # 第一条请求到达后等待同批请求的时间（秒）
+        self.text_batch_max_items = 16  # 每批最多的文本条数
+        self.text_batch_max_tokens = 3000  # 每批输入文本的 token 预算
+        # 工具调用并发配置
+        self.parallel_tool_calls = True  # 同一轮的多个工具调用并发执行
+        self.tool_concurrency = 4  # 每轮最多同时执行的工具调用数
+        self.tool_failure_policy = "isolate"  # isolate: 失败互不影响; cancel: 任一失败即取消剩余调用
+        # 推测执行配置：LLM 请求进行中提前执行可预测的只读幂等工具（服务器标注 readOnlyHint/idempotentHint）
+        self.speculative_tools = False
+        self.speculation_max_calls = 4  # 每跳最多推测执行的调用数
+        self.speculation_ttl = 30.0  # 推测结果的有效期（秒）
+        # 延迟控制配置：端到端截止时间、对冲请求和临近截止时改用的较便宜模型
+        self.query_deadline = 0.0  # 每次查询的截止时间（秒），0 表示不限制
+        self.hedge_requests = False  # 非流式 LLM 请求超过延迟分位数时发送对冲请求
+        self.hedge_percentile = 95.0  # 对冲延迟取历史请求延迟的第几百分位
+        self.hedge_initial_delay = 2.0  # 延迟样本不足时的对冲延迟（秒）
+        self.fallback_model = ""  # 剩余时间不足时改用的模型，如 qwen-turbo，为空时不切换
+        self.fallback_threshold = 10.0  # 剩余时间少于多少秒时改用 fallback_model
+        # 对话历史配置（交互模式下跨轮次保存）
+        self.context_window_tokens = 32000  # 模型上下文窗口，历史预算为窗口减去 max_tokens
+        self.tool_result_max_chars = 8000  # 单条工具结果写入历史时保留的最大字符数
+        # 追踪配置（客户端与服务器共用）
+        self.tracing_enabled = True  # 记录 span 和延迟直方图
+        self.trace_export_path = ""  # OTLP JSON 追踪文件路径，为空时不导出
+        # stdio 服务器预热进程池配置（python warm_pool.py 启动，客户端以 --mode warm-pool 连接）
+        self.warm_pool_socket = ""  # Unix 套接字路径，为空时使用临时目录下的 mcp-warm-pool.sock
+        self.warm_pool_size = 2  # 保持预热的空闲进程数
+        self.warm_pool_max_calls = 1000  # 单个进程处理多少次工具调用后退役，0 表示不限制
+        self.warm_pool_max_rss_mb = 512  # 单个进程内存超过多少 MB 后退役，0 表示不限制
+        # 客户端启动时连接的 MCP 服务器列表（命令行未指定服务器时使用）
+        # 每项如 {"name": "tools", "transport": "stdio|module|sse|streamable-http|warm-pool", "target": "testsever/main.py", "replicas": 1}
+        self.mcp_servers = []
         self.handlers_config = {
             "image": {
                 "enabled": True,
@@ -54,6 +135,8 @@ class Config:
             "model": self.model,
             "max_tokens": self.max_tokens,
             "temperature": self.temperature,
+            "stream": self.stream,
+            "prompt_cache_control": self.prompt_cache_control,
         }
     
     def get_client_params(self) -> Dict[str, Any]:
@@ -64,6 +147,147 @@ class Config:
             "api_key": self.api_key,
             "base_url": self.api_base,
         }
+    
+    def get_http_params(self) -> Dict[str, Any]:
+        """返回上游 HTTP 连接池参数字典"""
+        return {
+            "max_connections": self.http_max_connections,
+            "max_keepalive_connections": self.http_max_keepalive_connections,
+            "keepalive_expiry": self.http_keepalive_expiry,
+            "http2": self.http2,
+            "timeout": self.http_timeout,
+            "connect_timeout": self.http_connect_timeout,
+        }
+    
+    def get_fetch_params(self) -> Dict[str, Any]:
+        """返回服务器 fetch 连接池参数字典"""
+        return {
+            "max_connections": self.fetch_max_connections,
+            "max_keepalive_connections": self.fetch_max_keepalive_connections,
+            "max_connections_per_host": self.fetch_max_connections_per_host,
+            "keepalive_expiry": self.fetch_keepalive_expiry,
+            "timeout": self.fetch_timeout,
+            "max_bytes": self.fetch_max_bytes,
+            "dns_cache_ttl": self.dns_cache_ttl,
+        }
+    
+    def get_executor_params(self) -> Dict[str, Any]:
+        """返回服务器工具执行池参数字典"""
+        return {
+            "thread_workers": self.server_thread_workers,
+            "process_workers": self.server_process_workers,
+            "max_queue": self.server_tool_queue_size,
+        }
+    
+    def get_coalescing_params(self) -> Dict[str, Any]:
+        """返回服务器工具调用合并参数字典"""
+        return {
+            "coalesce": self.tool_coalescing,
+            "coalesce_exclude": list(self.tool_coalescing_exclude),
+        }
+    
+    def get_scheduler_params(self) -> Dict[str, Any]:
+        """返回上游 LLM 调度参数字典"""
+        return {
+            "rpm": self.rate_limit_rpm,
+            "tpm": self.rate_limit_tpm,
+            "min_concurrency": self.llm_min_concurrency,
+            "max_concurrency": self.llm_max_concurrency,
+            "latency_target": self.llm_latency_target,
+            "max_retries": self.llm_max_retries,
+            "retry_base_delay": self.llm_retry_base_delay,
+            "retry_max_delay": self.llm_retry_max_delay,
+        }
+    
+    def get_llm_cache_params(self) -> Dict[str, Any]:
+        """返回 LLM 工具结果缓存参数字典"""
+        return {
+            "max_bytes": self.llm_cache_max_bytes,
+            "ttl": self.llm_cache_ttl,
+            "disk_path": self.llm_cache_path or None,
+            "disk_max_bytes": self.llm_cache_disk_max_bytes,
+        }
+    
+    def get_text_batch_params(self) -> Dict[str, Any]:
+        """返回文本工具微批处理参数字典"""
+        return {
+            "window": self.text_batch_window,
+            "max_items": self.text_batch_max_items,
+            "max_tokens": self.text_batch_max_tokens,
+        }
+    
+    def get_warm_pool_params(self) -> Dict[str, Any]:
+        """返回预热进程池参数字典"""
+        return {
+            "socket": self.warm_pool_socket or os.path.join(tempfile.gettempdir(), "mcp-warm-pool.sock"),
+            "size": self.warm_pool_size,
+            "max_calls": self.warm_pool_max_calls,
+            "max_rss_mb": self.warm_pool_max_rss_mb,
+        }
+    
+    def get_mcp_servers(self) -> List[Dict[str, Any]]:
+        """返回配置的 MCP 服务器列表"""
+        return list(self.mcp_servers)
+    
+    def get_tool_params(self) -> Dict[str, Any]:
+        """返回工具调用参数字典"""
+        return {
+            "parallel_tool_calls": self.parallel_tool_calls,
+            "tool_concurrency": self.tool_concurrency,
+            "tool_failure_policy": self.tool_failure_policy,
+        }
+    
+    def get_tracing_params(self) -> Dict[str, Any]:
+        """返回追踪参数字典"""
+        return {
+            "enabled": self.tracing_enabled,
+            "export_path": self.trace_export_path or None,
+        }
+    
+    def get_latency_params(self) -> Dict[str, Any]:
+        """返回延迟控制参数字典"""
+        return {
+            "deadline": self.query_deadline,
+            "hedge": self.hedge_requests,
+            "hedge_percentile": self.hedge_percentile,
+            "hedge_initial_delay": self.hedge_initial_delay,
+            "fallback_model": self.fallback_model,
+            "fallback_threshold": self.fallback_threshold,
+        }
+    
+    def get_speculation_params(self) -> Dict[str, Any]:
+        """返回推测执行参数字典"""
+        return {
+            "enabled": self.speculative_tools,
+            "max_calls": self.speculation_max_calls,
+            "ttl": self.speculation_ttl,
+        }
+    
+    def get_conversation_params(self) -> Dict[str, Any]:
+        """返回对话历史参数字典，为模型输出预留 max_tokens"""
+        return {
+            "budget_tokens": max(1000, self.context_window_tokens - self.max_tokens),
+            "tool_result_chars": self.tool_result_max_chars,
+        }
+
+
+# 按文件路径缓存的配置实例，在 get_config 首次调用时创建
+_configs: Dict[str, Config] = {}
+
+
+def get_config(config_file: Optional[str] = "config.json") -> Config:
+    """返回按文件路径缓存的共享配置实例，每个文件只读取一次
+
+    需要覆盖参数或修改配置时请直接创建 Config。
+    """
+    key = os.path.abspath(config_file) if config_file else ""
+    if key not in _configs:
+        _configs[key] = Config(config_file)
+    return _configs[key]
+
 
-# 创建配置实例
-config = Config("config.json") 
\ No newline at end of file
+def __getattr__(name: str) -> Any:
+    # 兼容 from config import config：首次访问时才读取 config.json，导入本模块没有文件 I/O
+    if name == "config":
+        return get_config("config.json")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,147 @@
+import json
+from typing import Any, Dict, List, Optional
+
+# 压缩后旧工具结果保留的字符数
+COMPACTED_TOOL_CHARS = 200
+# 超出预算时一次压缩到预算的这一比例，之后若干次请求只追加消息，前缀保持不变
+COMPACT_TARGET = 0.75
+
+
+def estimate_message_tokens(message: Dict[str, Any]) -> int:
+    """粗略估算一条消息的 token 数（与 llm_scheduler.estimate_tokens 一致，按 UTF-8 字节数/3）"""
+    return len(json.dumps(message, ensure_ascii=False).encode("utf-8")) // 3 + 4
+
+
+class Conversation:
+    """带 token 预算的多轮对话历史
+
+    交互模式下跨轮次保存，使模型能看到之前的问答。每次请求 LLM 前按预算压缩：
+    1. 先截短较早的工具结果（最近一跳的结果保持完整）
+    2. 仍超出时删除较早轮次的工具调用过程（助手的 tool_calls 与对应的工具结果成对删除）
+    3. 最后从最早的轮次开始删除助手的回答
+    系统消息和所有用户消息始终保留（不会被删除或截短），只压缩助手和工具消息，
+    因此全部用户消息本身超出预算时历史仍可能超出预算。
+
+    未超出预算时历史只追加不修改，相邻请求共享相同的前缀，可以命中上游的前缀缓存；
+    超出时一次压缩到预算的 COMPACT_TARGET，减少破坏前缀的次数。
+    """
+
+    def __init__(self, budget_tokens: int, tool_result_chars: int = 4000,
+                 system_prompt: Optional[str] = None):
+        """
+        Args:
+            budget_tokens: 历史消息的 token 预算
+            tool_result_chars: 单条工具结果写入历史时保留的最大字符数
+            system_prompt: 可选的系统提示，始终位于历史开头
+        """
+        self.budget_tokens = budget_tokens
+        self.tool_result_chars = tool_result_chars
+        self.messages: List[Dict[str, Any]] = []
+        if system_prompt:
+            self.messages.append({"role": "system", "content": system_prompt})
+        # 当前轮用户消息的位置，以及最近一次请求 LLM 时历史的长度（之后的工具结果不截短）
+        self._turn_start = len(self.messages)
+        self._fresh_from = len(self.messages)
+        self.stats = {"truncated": 0, "dropped": 0}
+
+    def begin_turn(self, query: str) -> int:
+        """开始新一轮问答，返回可用于 rollback 的位置"""
+        mark = len(self.messages)
+        self._turn_start = mark
+        self.messages.append({"role": "user", "content": query})
+        self._fresh_from = len(self.messages)
+        return mark
+
+    def rollback(self, mark: int):
+        """撤销 mark 之后的消息（本轮失败时使用，避免留下不完整的工具调用）"""
+        del self.messages[mark:]
+        self._turn_start = min(self._turn_start, len(self.messages))
+        self._fresh_from = min(self._fresh_from, len(self.messages))
+
+    def add_assistant(self, content: str, tool_calls: Optional[List[Dict[str, Any]]] = None):
+        message: Dict[str, Any] = {"role": "assistant", "content": content}
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        self.messages.append(message)
+
+    def add_tool_result(self, tool_call_id: str, name: str, content: str):
+        """添加工具结果，过长的结果按 tool_result_chars 截短"""
+        self.messages.append({
+            "role": "tool",
+            "tool_call_id": tool_call_id,
+            "name": name,
+            "content": self._truncate(content, self.tool_result_chars),
+        })
+
+    def clear(self):
+        """清空历史，只保留系统消息"""
+        self.messages = [message for message in self.messages if message["role"] == "system"]
+        self._turn_start = self._fresh_from = len(self.messages)
+
+    def estimate_tokens(self) -> int:
+        return sum(estimate_message_tokens(message) for message in self.messages)
+
+    def prepare(self) -> List[Dict[str, Any]]:
+        """按预算压缩历史并返回本次请求使用的消息列表"""
+        self.compact()
+        self._fresh_from = len(self.messages)
+        return self.messages
+
+    def _truncate(self, content: str, limit: int) -> str:
+        if len(content) <= limit:
+            return content
+        self.stats["truncated"] += 1
+        return f"{content[:limit]}…[已截断，原始长度 {len(content)} 字符]"
+
+    def compact(self):
+        """超出预算时把历史压缩到预算的 COMPACT_TARGET 以内"""
+        total = self.estimate_tokens()
+        if total <= self.budget_tokens:
+            return
+        target = int(self.budget_tokens * COMPACT_TARGET)
+
+        # 1. 截短较早的工具结果，从最早的开始
+        for index in range(self._fresh_from):
+            if total <= target:
+                return
+            message = self.messages[index]
+            # 已截短的结果还带有约 30 字符的截断说明，不再重复处理
+            if message["role"] != "tool" or len(message["content"]) <= COMPACTED_TOOL_CHARS + 32:
+                continue
+            before = estimate_message_tokens(message)
+            message["content"] = self._truncate(message["content"], COMPACTED_TOOL_CHARS)
+            total -= before - estimate_message_tokens(message)
+
+        # 2. 删除较早轮次的工具调用过程，只保留这些轮次的用户问题和最终回答
+        index = 0
+        while total > target and index < self._turn_start:
+            message = self.messages[index]
+            if message["role"] != "assistant" or not message.get("tool_calls"):
+                index += 1
+                continue
+            end = index + 1
+            while end < self._turn_start and self.messages[end]["role"] == "tool":
+                end += 1
+            total -= sum(estimate_message_tokens(m) for m in self.messages[index:end])
+            del self.messages[index:end]
+            self._shift(index, end - index)
+            self.stats["dropped"] += end - index
+
+        # 3. 从最早的轮次开始删除助手的回答，用户消息和当前轮保持不变
+        index = 0
+        while total > target and index < self._turn_start:
+            message = self.messages[index]
+            if message["role"] in ("system", "user"):
+                index += 1
+                continue
+            total -= estimate_message_tokens(message)
+            del self.messages[index]
+            self._shift(index)
+            self.stats["dropped"] += 1
+
+    def _shift(self, index: int, count: int = 1):
+        # 删除 index 处的 count 条消息后修正位置标记
+        if self._turn_start > index:
+            self._turn_start -= count
+        if self._fresh_from > index:
+            self._fresh_from -= count
@@ -0,0 +1,157 @@
+import asyncio
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Iterator, Optional, TypeVar
+
+from tracing import Histogram
+
+T = TypeVar("T")
+
+_current_deadline: contextvars.ContextVar[Optional["Deadline"]] = contextvars.ContextVar(
+    "current_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """查询超过了端到端截止时间"""
+
+
+class Deadline:
+    """一次查询的端到端截止时间
+
+    通过 contextvars 在链式调用的每一跳之间传递（asyncio 任务创建时继承），
+    每个 LLM 请求和工具调用的超时都不超过剩余时间。
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self, slack: float = 0.0) -> bool:
+        """剩余时间是否不超过 slack 秒"""
+        return self.remaining() <= slack
+
+    def error(self) -> DeadlineExceeded:
+        return DeadlineExceeded(f"查询已超过 {self.seconds:g} 秒的截止时间")
+
+    def cap(self, timeout: float) -> float:
+        """把步骤自身的超时限制在剩余时间以内，已经超时时抛出 DeadlineExceeded"""
+        if self.expired():
+            raise self.error()
+        return min(timeout, self.remaining())
+
+    async def run(self, awaitable: Awaitable[T]) -> T:
+        """在剩余时间内等待结果，超时后取消并抛出 DeadlineExceeded"""
+        try:
+            timeout = self.cap(self.seconds)
+        except DeadlineExceeded:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            raise self.error()
+
+
+def current_deadline() -> Optional[Deadline]:
+    """当前查询的截止时间，没有设置时返回 None"""
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]) -> Iterator[Optional[Deadline]]:
+    """在该作用域（及其中创建的任务）内生效的截止时间，seconds 为空或不大于 0 时不设置"""
+    deadline = Deadline(seconds) if seconds and seconds > 0 else None
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+class Hedger:
+    """对冲请求
+
+    请求在按历史延迟分位数计算的时间内没有完成时，再发送一个相同的请求，
+    先成功的结果被采用，另一个请求随即取消。只有慢于该分位数的请求会被对冲，
+    额外的上游负载大约为 (100 - percentile)%。
+    """
+
+    def __init__(self, percentile: float = 95.0, initial_delay: float = 2.0, min_samples: int = 20,
+                 min_delay: float = 0.05):
+        """
+        Args:
+            percentile: 对冲延迟取历史请求延迟的第几百分位
+            initial_delay: 样本不足 min_samples 时使用的对冲延迟（秒）
+            min_samples: 开始使用分位数前需要的延迟样本数
+            min_delay: 对冲延迟的下限（秒）
+        """
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.histogram = Histogram()
+        self.stats = {"requests": 0, "hedged": 0, "backup_wins": 0}
+
+    def delay(self) -> float:
+        """当前的对冲延迟（秒）"""
+        if self.histogram.count < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, self.histogram.percentile(self.percentile))
+
+    async def run(self, send: Callable[[], Awaitable[T]]) -> T:
+        """执行请求，必要时对冲
+
+        Args:
+            send: 发送一次请求的函数，每次调用发出一个独立的请求
+        """
+        self.stats["requests"] += 1
+        delay = self.delay()
+        deadline = current_deadline()
+        started = time.monotonic()
+        primary = asyncio.ensure_future(send())
+        if deadline is not None and deadline.remaining() <= delay:
+            # 截止前来不及对冲
+            result = await primary
+            self.histogram.record(time.monotonic() - started)
+            return result
+
+        backup: Optional[asyncio.Future] = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                result = primary.result()
+                self.histogram.record(time.monotonic() - started)
+                return result
+
+            self.stats["hedged"] += 1
+            backup_started = time.monotonic()
+            backup = asyncio.ensure_future(send())
+            pending = {primary, backup}
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self.stats["backup_wins"] += 1
+                            self.histogram.record(time.monotonic() - backup_started)
+                        else:
+                            self.histogram.record(time.monotonic() - started)
+                        return task.result()
+                    error = error or task.exception()
+            # 两个请求都失败时抛出先失败的那个错误
+            raise error
+        finally:
+            # 取消落后的请求（调用方被取消时两个都取消）
+            for task in (primary, backup):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def summary(self) -> str:
+        return (f"对冲请求 {self.stats['hedged']} 次（共 {self.stats['requests']} 次请求），"
+                f"备份请求先完成 {self.stats['backup_wins']} 次，当前对冲延迟 {self.delay() * 1000:.0f}ms")
@@ -0,0 +1,347 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import random
+import time
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+if TYPE_CHECKING:
+    import httpx
+
+# 优先级通道，数值越小越优先
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_LANES = {"interactive": PRIORITY_INTERACTIVE, "batch": PRIORITY_BATCH}
+
+# 会重试的上游状态码
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+_current_priority: contextvars.ContextVar[int] = contextvars.ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+
+
+def retryable_errors() -> Tuple[type, ...]:
+    """会重试的传输层异常（请求尚未被上游处理），httpx 在第一次发送请求时才导入"""
+    import httpx
+    return (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError, httpx.PoolTimeout)
+
+
+class LLMAPIError(Exception):
+    """上游 LLM API 返回错误状态码"""
+
+    def __init__(self, status_code: int, body: str = "", retry_after: Optional[float] = None):
+        super().__init__(f"API请求失败: {status_code}, {body}")
+        self.status_code = status_code
+        self.body = body
+        self.retry_after = retry_after
+
+
+@contextmanager
+def priority_lane(lane: str) -> Iterator[None]:
+    """在当前上下文（及其创建的任务）中使用指定的优先级通道
+
+    Args:
+        lane: "interactive" 或 "batch"
+    """
+    token = _current_priority.set(PRIORITY_LANES[lane])
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def estimate_tokens(body: bytes, max_tokens: int = 0) -> int:
+    """粗略估算一次请求消耗的 token 数（请求体字节数/3 加上最大输出 token 数）"""
+    return len(body) // 3 + max_tokens
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 头，支持秒数和 HTTP 日期两种格式"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """令牌桶，按每分钟速率补充，用于 RPM/TPM 限制
+
+    令牌不足时按优先级排队，补充出的令牌总是先分配给优先级最高、最早等待的请求。
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self._updated = time.monotonic()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float, priority: int = PRIORITY_INTERACTIVE):
+        """取出 amount 个令牌，不足时按优先级排队等待（超过桶容量的请求按容量计）"""
+        amount = min(amount, self.capacity)
+        self._refill()
+        if not self._waiters and self.tokens >= amount:
+            self.tokens -= amount
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), amount, future))
+        self._wake()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 令牌已分配但调用方被取消，归还令牌
+                self.tokens = min(self.capacity, self.tokens + amount)
+            self._wake()
+            raise
+
+    def _wake(self):
+        # 按优先级分配已有令牌，再为队首请求按缺口定时，等待期间不持有任何锁
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._refill()
+        while self._waiters:
+            _, _, amount, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self.tokens < amount:
+                delay = (amount - self.tokens) / self.rate
+                self._timer = asyncio.get_running_loop().call_later(delay, self._wake)
+                return
+            heapq.heappop(self._waiters)
+            self.tokens -= amount
+            future.set_result(None)
+
+    def adjust(self, delta: float):
+        """按实际用量修正：正数退还令牌，负数追加扣除（允许暂时为负）"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + delta)
+        if self._waiters:
+            self._wake()
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD 自适应并发限制器，带优先级等待队列
+
+    请求成功且延迟未超过目标时并发上限加性增长（每个上限周期 +1），
+    遇到 429 或延迟超标时乘性减半。空出的槽位总是先分配给优先级最高、最早等待的请求。
+    """
+
+    def __init__(self, min_limit: int, max_limit: int, latency_target: float = 0.0,
+                 decrease_cooldown: float = 1.0):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.latency_target = latency_target
+        self.decrease_cooldown = decrease_cooldown
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._last_decrease = 0.0
+
+    async def acquire(self, priority: int):
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 槽位已分配但调用方被取消，归还槽位
+                self.release()
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    def on_success(self, latency: float):
+        if self.latency_target and latency > self.latency_target:
+            self._decrease()
+        else:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._wake()
+
+    def on_throttle(self):
+        self._decrease()
+
+    def _decrease(self):
+        # 一批并发请求同时收到 429 时只减半一次
+        now = time.monotonic()
+        if now - self._last_decrease >= self.decrease_cooldown:
+            self.limit = max(self.min_limit, self.limit / 2)
+            self._last_decrease = now
+
+
+class LLMScheduler:
+    """上游 LLM 请求调度器
+
+    组合 RPM/TPM 令牌桶、AIMD 自适应并发和优先级通道，对 429/5xx 和连接错误
+    做带抖动的指数退避重试，并遵守 Retry-After。收到 Retry-After 时所有请求一起暂停。
+    """
+
+    def __init__(self, rpm: int = 0, tpm: int = 0, min_concurrency: int = 1, max_concurrency: int = 16,
+                 latency_target: float = 0.0, max_retries: int = 3, retry_base_delay: float = 0.5,
+                 retry_max_delay: float = 20.0):
+        self.request_bucket = TokenBucket(rpm) if rpm > 0 else None
+        self.token_bucket = TokenBucket(tpm) if tpm > 0 else None
+        self.limiter = AdaptiveConcurrencyLimiter(min_concurrency, max_concurrency, latency_target)
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self._paused_until = 0.0
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0, "errors": 0}
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """计算第 attempt 次重试前的等待时间，Retry-After 优先，否则使用 full jitter 指数退避"""
+        if retry_after is not None:
+            return min(retry_after, self.retry_max_delay)
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * (2 ** attempt)))
+
+    async def _wait_for_pause(self):
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """返回请求/重试/限流计数和当前并发状态"""
+        return dict(self.stats, concurrency_limit=self.limiter.limit, in_flight=self.limiter.in_flight)
+
+    def reconcile_tokens(self, estimated: int, usage: Optional[Dict[str, Any]]):
+        """用响应中的 usage 修正 TPM 令牌桶"""
+        if self.token_bucket and usage and usage.get("total_tokens"):
+            self.token_bucket.adjust(estimated - usage["total_tokens"])
+
+    @asynccontextmanager
+    async def request(self, send: Callable[[], Awaitable["httpx.Response"]], estimated_tokens: int = 0,
+                      priority: Optional[int] = None) -> AsyncIterator["httpx.Response"]:
+        """在调度器控制下发送请求
+
+        退出上下文前一直占用并发槽位（流式响应读取期间也计入并发）。重试用尽后
+        返回最后一个错误响应，由调用方决定如何报告状态码。
+
+        Args:
+            send: 发送请求并返回响应的函数，每次重试都会重新调用
+            estimated_tokens: 预估 token 数，用于 TPM 限制
+            priority: 优先级，默认取当前上下文的优先级通道
+
+        Yields:
+            上游响应
+        """
+        if priority is None:
+            priority = _current_priority.get()
+
+        retryable = retryable_errors()
+        attempt = 0
+        while True:
+            await self._wait_for_pause()
+            # 先按优先级等待 RPM/TPM 令牌再占用并发槽位，限流期间槽位不会被低优先级请求占住
+            if self.request_bucket:
+                await self.request_bucket.acquire(1, priority)
+            if self.token_bucket and estimated_tokens:
+                await self.token_bucket.acquire(estimated_tokens, priority)
+            await self.limiter.acquire(priority)
+            released = False
+            try:
+                self.stats["requests"] += 1
+                start = time.monotonic()
+                try:
+                    response = await send()
+                except retryable:
+                    self.stats["errors"] += 1
+                    if attempt >= self.max_retries:
+                        raise
+                    response = None
+
+                if response is not None and \
+                        (response.status_code not in RETRYABLE_STATUS or attempt >= self.max_retries):
+                    try:
+                        yield response
+                    finally:
+                        if response.status_code == 429:
+                            self.limiter.on_throttle()
+                        elif response.status_code < 400:
+                            self.limiter.on_success(time.monotonic() - start)
+                            self._reconcile_from_body(response, estimated_tokens)
+                        await response.aclose()
+                    return
+
+                # 需要重试：先释放槽位再等待
+                retry_after = None
+                if response is not None:
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    if response.status_code == 429:
+                        self.stats["throttled"] += 1
+                        self.limiter.on_throttle()
+                        if retry_after:
+                            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                    await response.aclose()
+                self.limiter.release()
+                released = True
+            finally:
+                if not released:
+                    self.limiter.release()
+
+            self.stats["retries"] += 1
+            await asyncio.sleep(self.backoff_delay(attempt, retry_after))
+            attempt += 1
+
+    def _reconcile_from_body(self, response: "httpx.Response", estimated_tokens: int):
+        # 非流式响应已读取完毕，直接从 usage 修正；流式响应由调用方调用 reconcile_tokens
+        import httpx
+        try:
+            usage = response.json().get("usage")
+        except (httpx.ResponseNotRead, ValueError, AttributeError):
+            return
+        self.reconcile_tokens(estimated_tokens, usage)
+
+
+_scheduler: Optional[LLMScheduler] = None
+
+
+def get_scheduler(params: Dict[str, Any]) -> LLMScheduler:
+    """获取进程内共享的调度器，首次调用时按参数创建
+
+    Args:
+        params: Config.get_scheduler_params() 返回的参数字典
+    """
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LLMScheduler(
+            rpm=params["rpm"],
+            tpm=params["tpm"],
+            min_concurrency=params["min_concurrency"],
+            max_concurrency=params["max_concurrency"],
+            latency_target=params["latency_target"],
+            max_retries=params["max_retries"],
+            retry_base_delay=params["retry_base_delay"],
+            retry_max_delay=params["retry_max_delay"],
+        )
+    return _scheduler
@@ -0,0 +1,147 @@
+import json
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional
+
+if TYPE_CHECKING:
+    import httpx
+
+
+async def iter_sse_chunks(response: "httpx.Response") -> AsyncIterator[Dict[str, Any]]:
+    """逐个解析 /chat/completions 流式响应中的 SSE 数据块
+
+    Args:
+        response: 以 stream 方式发起的 httpx 响应
+
+    Yields:
+        每个 data: 行解析出的 JSON 对象，遇到 [DONE] 时结束
+    """
+    data_lines: List[str] = []
+    async for line in response.aiter_lines():
+        if line.startswith("data:"):
+            data_lines.append(line[5:].lstrip())
+            continue
+        if line.strip() or not data_lines:
+            # 忽略 event:/id:/注释行
+            continue
+
+        # 空行表示一个事件结束
+        data = "\n".join(data_lines)
+        data_lines = []
+        if data == "[DONE]":
+            return
+        yield json.loads(data)
+
+    # 部分服务端在最后一个事件后不发送空行
+    if data_lines:
+        data = "\n".join(data_lines)
+        if data != "[DONE]":
+            yield json.loads(data)
+
+
+class StreamAssembler:
+    """把流式增量拼装回完整的助手消息
+
+    工具调用的参数以字符串片段的形式到达，当某个工具调用的参数已能解析为完整的
+    JSON 对象，或者出现了下一个工具调用时，认为该调用已完整，可以立即执行。
+    """
+
+    def __init__(self):
+        self.role = "assistant"
+        self.content_parts: List[str] = []
+        self.tool_calls: List[Dict[str, Any]] = []
+        self.finish_reason: Optional[str] = None
+        self.usage: Optional[Dict[str, Any]] = None
+        self._completed = set()
+
+    def feed(self, chunk: Dict[str, Any]) -> Dict[str, Any]:
+        """处理一个数据块
+
+        Returns:
+            包含 content（本块的文本增量）和 tool_calls（本块中变为完整的工具调用）的字典
+        """
+        if chunk.get("usage"):
+            self.usage = chunk["usage"]
+
+        content_delta = ""
+        completed: List[Dict[str, Any]] = []
+        for choice in chunk.get("choices") or []:
+            if choice.get("index", 0) != 0:
+                continue
+            delta = choice.get("delta") or {}
+            if delta.get("role"):
+                self.role = delta["role"]
+            if delta.get("content"):
+                content_delta += delta["content"]
+                self.content_parts.append(delta["content"])
+            for tool_delta in delta.get("tool_calls") or []:
+                completed.extend(self._merge_tool_delta(tool_delta))
+            if choice.get("finish_reason"):
+                self.finish_reason = choice["finish_reason"]
+
+        return {"content": content_delta, "tool_calls": completed}
+
+    def _merge_tool_delta(self, tool_delta: Dict[str, Any]) -> List[Dict[str, Any]]:
+        index = tool_delta.get("index")
+        if index is None:
+            # 没有 index 时按 id 匹配，否则视为新的调用
+            index = next((i for i, call in enumerate(self.tool_calls)
+                          if tool_delta.get("id") and call["id"] == tool_delta["id"]),
+                         len(self.tool_calls))
+
+        completed = []
+        while len(self.tool_calls) <= index:
+            # 新的调用开始，之前的调用都已完整
+            completed.extend(self._complete_all())
+            self.tool_calls.append({"id": "", "type": "function",
+                                    "function": {"name": "", "arguments": ""}})
+
+        call = self.tool_calls[index]
+        if tool_delta.get("id"):
+            call["id"] = tool_delta["id"]
+        if tool_delta.get("type"):
+            call["type"] = tool_delta["type"]
+        function_delta = tool_delta.get("function") or {}
+        if function_delta.get("name") and not call["function"]["name"]:
+            call["function"]["name"] = function_delta["name"]
+        if function_delta.get("arguments"):
+            call["function"]["arguments"] += function_delta["arguments"]
+
+        if index not in self._completed and call["id"] and call["function"]["name"] \
+                and _is_complete_json(call["function"]["arguments"]):
+            self._completed.add(index)
+            completed.append(call)
+        return completed
+
+    def _complete_all(self) -> List[Dict[str, Any]]:
+        completed = []
+        for index, call in enumerate(self.tool_calls):
+            if index not in self._completed:
+                self._completed.add(index)
+                completed.append(call)
+        return completed
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """流结束，返回尚未报告为完整的工具调用"""
+        return self._complete_all()
+
+    def to_response(self) -> Dict[str, Any]:
+        """构造与非流式接口相同结构的响应字典"""
+        message: Dict[str, Any] = {"role": self.role, "content": "".join(self.content_parts)}
+        if self.tool_calls:
+            message["tool_calls"] = self.tool_calls
+        response: Dict[str, Any] = {
+            "choices": [{"index": 0, "message": message, "finish_reason": self.finish_reason}]
+        }
+        if self.usage:
+            response["usage"] = self.usage
+        return response
+
+
+def _is_complete_json(text: str) -> bool:
+    """参数片段是否已构成完整的 JSON 对象"""
+    text = text.strip()
+    if not text.endswith("}"):
+        return False
+    try:
+        return isinstance(json.loads(text), dict)
+    except ValueError:
+        return False
@@ -1,40 +1,174 @@
+import time
+# --profile-startup 报告的计时起点（解释器启动之后、导入依赖之前）
+IMPORT_STARTED = time.perf_counter()
 import asyncio
-from typing import Optional, Dict, Any, List
+from typing import TYPE_CHECKING, Optional, Dict, Any, List, Callable, Awaitable
 from contextlib import AsyncExitStack
 import json
-import httpx
 import argparse
 import sys
 import os
-
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
-from mcp.client.sse import sse_client
-
-from dotenv import load_dotenv
+from urllib.parse import urlparse
 
 # 导入模型配置
 from model_config import ModelConfig
-from config import Config  # 导入统一配置类
+from server_pool import ServerPool, ServerGroup
+from llm_stream import StreamAssembler, iter_sse_chunks
+from batch_runner import BatchRunner
+from conversation import Conversation
+from tracing import get_tracer
+from speculation import Speculator
+from latency_control import DeadlineExceeded, Hedger, current_deadline, deadline_scope
+from request_builder import PromptCacheStats, build_chat_body, canonical_tools_json, with_cache_marker
+from llm_scheduler import LLMScheduler, LLMAPIError, estimate_tokens, get_scheduler, parse_retry_after
+
+# mcp（导入时会加载全部传输层、uvicorn 和 dotenv）、httpx 和 dotenv 在第一次连接或调用 LLM 时才导入
+if TYPE_CHECKING:
+    import httpx
+    from mcp import ClientSession
+
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+
+_env_loaded = False
+
+def load_env():
+    """从 .env 加载环境变量，只在第一次创建客户端时读取"""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+class ToolCallRound:
+    """一轮工具调用的调度状态
+
+    持有本轮的并发信号量和已启动的调用任务。流式模式下，工具调用在参数拼装完整时
+    就通过 start() 提前启动，之后 execute_tool_calls 复用同一任务而不会重复执行。
+    """
+
+    def __init__(self, call_tool: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]], concurrency: int):
+        self._call_tool = call_tool
+        # 信号量按先来先得唤醒，并发数为 1 时即按顺序执行
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.tasks: Dict[str, asyncio.Task] = {}
+
+    async def _run_with_limit(self, tool_call: Dict[str, Any]) -> Dict[str, Any]:
+        async with self._semaphore:
+            return await self._call_tool(tool_call)
+
+    def start(self, tool_call: Dict[str, Any]) -> asyncio.Task:
+        """启动工具调用，同一 tool_call_id 只会启动一次"""
+        task = self.tasks.get(tool_call["id"])
+        if task is None:
+            task = asyncio.create_task(self._run_with_limit(tool_call))
+            self.tasks[tool_call["id"]] = task
+        return task
 
-# 从 .env 加载环境变量
-load_dotenv()
+    def cancel_pending(self):
+        """取消所有尚未完成的调用"""
+        for task in self.tasks.values():
+            if not task.done():
+                task.cancel()
 
 class MCPClient:
-    def __init__(self, config_file: Optional[str] = "config.json"):
+    def __init__(self, config_file: Optional[str] = "config.json", **kwargs):
         # 初始化会话和客户端对象
-        self.session: Optional[ClientSession] = None
+        self.session: Optional["ClientSession"] = None
         self.exit_stack = AsyncExitStack()
         
-        # 使用模型配置
-        self.model_config = ModelConfig(config_file)
+        # 使用模型配置，kwargs 覆盖配置文件中的同名项（环境变量可来自 .env）
+        load_env()
+        self.model_config = ModelConfig(config_file, **kwargs)
+        
+        # 共享的上游 HTTP 客户端，首次调用 LLM 时创建，随 exit_stack 关闭
+        self.http_client: Optional["httpx.AsyncClient"] = None
+        
+        # 多服务器连接池与工具路由，每个服务器的工具目录在连接时构建，收到 tools/list_changed 通知后失效
+        self.servers = ServerPool()
+        
+        # 交互模式的对话历史，跨轮次保存
+        self.conversation = self.new_conversation()
+        
+        # 上游前缀缓存命中统计（来自响应 usage.prompt_tokens_details.cached_tokens）
+        self.prompt_cache = PromptCacheStats()
+        
+        # LLM 请求、工具调用和链式调用每一跳的追踪与延迟直方图
+        self.tracer = get_tracer(dict(self.model_config.get_tracing_params(), service_name="mcp-client"))
+        
+        # 纯工具的推测执行：LLM 请求进行中提前执行可预测的只读幂等工具调用
+        speculation_params = self.model_config.get_speculation_params()
+        self.speculator: Optional[Speculator] = Speculator(
+            self.servers.call_tool,
+            self.servers.is_pure,
+            self.servers.required_params,
+            max_calls=speculation_params["max_calls"],
+            ttl=speculation_params["ttl"],
+        ) if speculation_params["enabled"] else None
+        
+        # 延迟控制：对冲慢请求，临近截止时间时改用较便宜的模型
+        latency_params = self.model_config.get_latency_params()
+        self.hedger: Optional[Hedger] = Hedger(
+            percentile=latency_params["hedge_percentile"],
+            initial_delay=latency_params["hedge_initial_delay"],
+        ) if latency_params["hedge"] else None
+        self.fallbacks = 0
+        
+        # 启动分析：每个服务器的连接耗时和第一次工具调用
+        self.connect_seconds: Dict[str, float] = {}
+        self.first_tool_call: Optional[Dict[str, Any]] = None
+        
+    async def _start_session(self, group: ServerGroup, read_stream, write_stream) -> "ClientSession":
+        """在给定的通信流上创建并初始化 ClientSession，加入服务器组
+
+        组内第一个会话负责获取并缓存工具目录，其余副本共享该目录。
+        """
+        from mcp import ClientSession
+
+        session = await self.exit_stack.enter_async_context(
+            ClientSession(read_stream, write_stream, message_handler=group.catalog.handle_message)
+        )
+        
+        # 发送初始化请求给服务器
+        await session.initialize()
+        
+        group.add_session(session)
+        if len(group.sessions) == 1:
+            # 列出可用的工具并缓存
+            await group.refresh()
         
-    async def connect_to_server(self, server_script_path: str):
+        # 保持 self.session 指向第一个服务器的会话，兼容单服务器用法
+        if self.session is None:
+            self.session = session
+        return session
+
+    async def _connect_group(self, name: str, open_transport: Callable[[], Any], replicas: int = 1) -> ServerGroup:
+        """打开同一个服务器的一个或多个副本会话
+
+        Args:
+            name: 服务器名称，多服务器时作为工具名前缀
+            open_transport: 返回传输层异步上下文管理器的函数，其结果的前两项为读、写流
+            replicas: 副本会话数
+        """
+        group = self.servers.add_group(name)
+        for _ in range(max(1, replicas)):
+            streams = await self.exit_stack.enter_async_context(open_transport())
+            await self._start_session(group, streams[0], streams[1])
+        return group
+
+    async def refresh_tools(self):
+        """显式刷新所有服务器的工具目录缓存"""
+        await self.servers.refresh()
+
+    async def connect_to_server(self, server_script_path: str, name: Optional[str] = None, replicas: int = 1):
         """连接到 MCP 服务器 (stdio 模式)
 
         Args:
             server_script_path: 服务器脚本的路径 (.py 或 .js)
+            name: 服务器名称，默认取脚本文件名
+            replicas: 启动的服务器进程（副本）数
         """
+        from mcp.client.stdio import StdioServerParameters, stdio_client
+        
         # 检查是否是Python模块调用
         if server_script_path.startswith("python "):
             parts = server_script_path.split()
@@ -55,135 +189,504 @@ class MCPClient:
             env=None
         )
 
-        stdio_transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
-        self.stdio, self.write = stdio_transport
-        self.session = await self.exit_stack.enter_async_context(ClientSession(self.stdio, self.write))
-
-        await self.session.initialize()
-
-        # 列出可用的工具
-        response = await self.session.list_tools()
-        tools = response.tools
-        print("\n已连接到服务器，工具包括：", [tool.name for tool in tools])
+        name = name or os.path.splitext(os.path.basename(args[-1]))[0]
+        group = await self._connect_group(name, lambda: stdio_client(server_params), replicas)
+        print(f"\n已连接到服务器 {group.name}，工具包括：", [tool.name for tool in group.catalog.tools])
     
-    async def connect_to_python_module(self, module_name: str):
+    async def connect_to_python_module(self, module_name: str, name: Optional[str] = None, replicas: int = 1):
         """连接到Python模块MCP服务器 (stdio模式)
 
         Args:
             module_name: 模块名称，如 mcp_server_fetch
+            name: 服务器名称，默认取模块名
+            replicas: 启动的服务器进程（副本）数
         """
+        from mcp.client.stdio import StdioServerParameters, stdio_client
+        
         server_params = StdioServerParameters(
             command="python",
             args=["-m", module_name],
             env=None
         )
 
-        stdio_transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
-        self.stdio, self.write = stdio_transport
-        self.session = await self.exit_stack.enter_async_context(ClientSession(self.stdio, self.write))
-
-        await self.session.initialize()
-
-        # 列出可用的工具
-        response = await self.session.list_tools()
-        tools = response.tools
-        print(f"\n已连接到 {module_name} 模块服务器，工具包括：", [tool.name for tool in tools])
+        group = await self._connect_group(name or module_name, lambda: stdio_client(server_params), replicas)
+        print(f"\n已连接到 {module_name} 模块服务器，工具包括：", [tool.name for tool in group.catalog.tools])
     
-    async def connect_to_sse_server(self, server_url: str):
+    async def connect_to_sse_server(self, server_url: str, name: Optional[str] = None, replicas: int = 1):
         """连接到 MCP 服务器 (SSE 模式)
 
         Args:
             server_url: 服务器 URL，如 http://localhost:8000/sse
+            name: 服务器名称，默认取 URL 的主机和端口
+            replicas: 建立的 SSE 会话（副本）数
         """
+        from mcp.client.sse import sse_client
+        
         # 使用官方 SSE 客户端连接
         # sse_client 会建立 SSE 连接并返回通信流
-        streams = await self.exit_stack.enter_async_context(sse_client(server_url))
-        
-        # 使用流创建 ClientSession
-        # streams[0] 是从服务器接收消息的流
-        # streams[1] 是向服务器发送消息的流
-        self.session = await self.exit_stack.enter_async_context(ClientSession(streams[0], streams[1]))
+        # streams[0] 是从服务器接收消息的流，streams[1] 是向服务器发送消息的流
+        name = name or urlparse(server_url).netloc
+        group = await self._connect_group(name, lambda: sse_client(server_url), replicas)
+        print(f"\n已连接到 SSE 服务器 {group.name}，工具包括：", [tool.name for tool in group.catalog.tools])
+
+    async def connect_to_streamable_http_server(self, server_url: str, name: Optional[str] = None,
+                                                replicas: int = 1):
+        """连接到 MCP 服务器 (streamable HTTP 模式)
+
+        Args:
+            server_url: 服务器 URL，如 http://localhost:8000/mcp
+            name: 服务器名称，默认取 URL 的主机和端口
+            replicas: 建立的会话（副本）数
+        """
+        from mcp.client.streamable_http import streamablehttp_client
         
-        # 发送初始化请求给服务器
-        await self.session.initialize()
+        # 每个请求是独立的 HTTP POST，无状态服务器不需要粘性会话，也不保持长连接的 SSE 流
+        name = name or urlparse(server_url).netloc
+        group = await self._connect_group(name, lambda: streamablehttp_client(server_url), replicas)
+        print(f"\n已连接到 streamable HTTP 服务器 {group.name}，工具包括：",
+              [tool.name for tool in group.catalog.tools])
+
+    async def connect_to_warm_pool(self, socket_path: str, name: Optional[str] = None, replicas: int = 1):
+        """连接到预热进程池 (python warm_pool.py)，分到的服务器进程已完成启动和预热
+
+        Args:
+            socket_path: 进程池的 Unix 套接字路径，为空时使用配置的 warm_pool_socket
+            name: 服务器名称，默认为 warm-pool
+            replicas: 占用的服务器进程（副本）数
+        """
+        from warm_pool import warm_pool_client
         
-        # 列出可用的工具
-        response = await self.session.list_tools()
-        tools = response.tools
-        print("\n已连接到 SSE 服务器，工具包括：", [tool.name for tool in tools])
+        socket_path = socket_path or self.model_config.get_warm_pool_params()["socket"]
+        group = await self._connect_group(name or "warm-pool", lambda: warm_pool_client(socket_path), replicas)
+        print(f"\n已连接到预热进程池 {socket_path}，工具包括：", [tool.name for tool in group.catalog.tools])
 
-    async def call_qwen_api(self, messages: List[Dict[str, Any]], tools=None) -> Dict[str, Any]:
-        """调用阿里云千问 API
+    async def connect_from_config(self, servers: List[Dict[str, Any]]):
+        """按配置连接多个服务器
 
         Args:
-            messages: 消息历史
-            tools: 可用工具列表
+            servers: 服务器配置列表，每项包含 transport (stdio/module/sse/streamable-http/warm-pool)、target，
+                     可选 name 和 replicas
+        """
+        connectors = {
+            "stdio": self.connect_to_server,
+            "module": self.connect_to_python_module,
+            "sse": self.connect_to_sse_server,
+            "streamable-http": self.connect_to_streamable_http_server,
+            "warm-pool": self.connect_to_warm_pool,
+        }
+        for server in servers:
+            transport = server.get("transport", "stdio")
+            if transport not in connectors:
+                raise ValueError(f"不支持的传输方式: {transport}")
+            started = time.perf_counter()
+            await connectors[transport](server.get("target", ""), name=server.get("name"),
+                                        replicas=server.get("replicas", 1))
+            self.connect_seconds[server.get("name") or server.get("target") or transport] = \
+                time.perf_counter() - started
+
+    def get_http_client(self) -> "httpx.AsyncClient":
+        """获取共享的上游 HTTP 客户端
+
+        客户端在多次 LLM 调用之间复用 TCP/TLS 连接（keep-alive），
+        避免链式工具调用的每一步都重新握手。
 
         Returns:
-            API 响应
+            长期存活的 httpx.AsyncClient
+        """
+        if self.http_client is None:
+            import httpx
+            http_params = self.model_config.get_http_params()
+            
+            http2 = http_params["http2"]
+            if http2:
+                try:
+                    import h2  # noqa: F401
+                except ImportError:
+                    print("警告: 未安装 h2，已禁用 HTTP/2（可通过 pip install httpx[http2] 启用）")
+                    http2 = False
+            
+            self.http_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(http_params["timeout"], connect=http_params["connect_timeout"]),
+                limits=httpx.Limits(
+                    max_connections=http_params["max_connections"],
+                    max_keepalive_connections=http_params["max_keepalive_connections"],
+                    keepalive_expiry=http_params["keepalive_expiry"],
+                ),
+                http2=http2,
+            )
+            # 通过 exit_stack 在 cleanup() 时关闭连接池
+            self.exit_stack.push_async_callback(self.http_client.aclose)
+        return self.http_client
+
+    def _build_chat_request(self, messages: List[Dict[str, Any]], tools=None,
+                            tools_json: Optional[str] = None, stream: bool = False,
+                            model: Optional[str] = None):
+        """构造 /chat/completions 请求的 URL、请求体和请求头
+
+        请求体按 request_builder 的规范顺序序列化，使相邻请求共享尽可能长的字节前缀，
+        提高上游前缀缓存的命中率。model 为空时使用配置的模型。
         """
         client_params = self.model_config.get_client_params()
         request_params = self.model_config.get_request_params()
         
         # 准备请求数据
         payload = {
-            "model": request_params["model"],
-            "messages": messages,
+            "model": model or request_params["model"],
             "max_tokens": request_params["max_tokens"],
             "temperature": request_params["temperature"],
         }
+        if stream:
+            payload["stream"] = True
+            payload["stream_options"] = {"include_usage": True}
         
-        # 如果有工具，添加到请求中
-        if tools:
-            payload["tools"] = tools
+        # 如果有工具，添加到请求中；缓存的工具 JSON 片段直接拼接，避免每轮重复编码工具定义
+        if tools and not tools_json:
+            tools_json = canonical_tools_json(tools)
+        if request_params["prompt_cache_control"]:
+            messages = with_cache_marker(messages)
+        body = build_chat_body(payload, messages, tools_json)
         
         # 发送请求到阿里云灵积API
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {client_params['api_key']}"
         }
+        if stream:
+            headers["Accept"] = "text/event-stream"
+        
+        return f"{client_params['base_url']}/chat/completions", body, headers
+
+    def _select_model(self) -> str:
+        """选择本次请求的模型：当前查询的剩余时间少于 fallback_threshold 时改用 fallback_model"""
+        latency_params = self.model_config.get_latency_params()
+        deadline = current_deadline()
+        if latency_params["fallback_model"] and deadline is not None \
+                and deadline.remaining() < latency_params["fallback_threshold"]:
+            self.fallbacks += 1
+            return latency_params["fallback_model"]
+        return self.model_config.get_request_params()["model"]
+
+    def _request_kwargs(self) -> Dict[str, Any]:
+        """单次上游请求的超时：有截止时间时不超过剩余时间，否则使用连接池的默认超时"""
+        deadline = current_deadline()
+        if deadline is None:
+            return {}
+        import httpx
+        http_params = self.model_config.get_http_params()
+        return {"timeout": httpx.Timeout(deadline.cap(http_params["timeout"]),
+                                         connect=deadline.cap(http_params["connect_timeout"]))}
+
+    @staticmethod
+    async def _within_deadline(awaitable):
+        """等待请求完成，有截止时间时超时即取消"""
+        deadline = current_deadline()
+        return await (deadline.run(awaitable) if deadline is not None else awaitable)
+
+    @staticmethod
+    def _check_deadline():
+        """被截止时间截短的 httpx 超时按超过截止时间报告"""
+        deadline = current_deadline()
+        if deadline is not None and deadline.expired(slack=0.05):
+            raise deadline.error()
+
+    def get_scheduler(self) -> LLMScheduler:
+        """获取进程内共享的上游 LLM 调度器"""
+        return get_scheduler(self.model_config.get_scheduler_params())
+
+    async def call_qwen_api(self, messages: List[Dict[str, Any]], tools=None,
+                            tools_json: Optional[str] = None) -> Dict[str, Any]:
+        """调用阿里云千问 API
+
+        Args:
+            messages: 消息历史
+            tools: 可用工具列表
+            tools_json: 预先序列化的工具列表 JSON 片段，提供时优先于 tools
+
+        Returns:
+            API 响应
+        """
+        import httpx
+        model = self._select_model()
+        url, body, headers = self._build_chat_request(messages, tools, tools_json, model=model)
         
-        # 设置超时时间，默认为60秒
-        timeout = httpx.Timeout(60.0, connect=30.0)
+        # 复用共享连接池，超时时间由配置决定（默认60秒），有截止时间时不超过剩余时间
+        client = self.get_http_client()
+        # 经共享调度器发送：限流、自适应并发，429/5xx 按 Retry-After 和退避重试
+        scheduler = self.get_scheduler()
+        estimated = estimate_tokens(body, self.model_config.get_request_params()["max_tokens"])
         
-        try:
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                response = await client.post(
-                    f"{client_params['base_url']}/chat/completions",
-                    json=payload,
-                    headers=headers
-                )
+        with self.tracer.span("llm.request", stream=False, request_bytes=len(body), model=model) as span:
+            async def attempt() -> Dict[str, Any]:
+                request_kwargs = self._request_kwargs()
+                async with scheduler.request(lambda: client.post(url, content=body, headers=headers,
+                                                                 **request_kwargs),
+                                             estimated) as response:
+                    span.set(status_code=response.status_code, response_bytes=len(response.content))
+                    if response.status_code == 200:
+                        result = response.json()
+                        span.set_usage(result.get("usage"))
+                        self.prompt_cache.record(result.get("usage"))
+                        return result
+                    raise LLMAPIError(response.status_code, response.text,
+                                      parse_retry_after(response.headers.get("Retry-After")))
+            
+            try:
+                # 开启对冲时，超过延迟分位数仍未完成的请求会再发送一次，先完成的结果被采用
+                return await self._within_deadline(self.hedger.run(attempt) if self.hedger else attempt())
+            except (LLMAPIError, DeadlineExceeded):
+                # 保留状态码，便于调用方区分限流与其他错误
+                raise
+            except httpx.ReadTimeout:
+                self._check_deadline()
+                raise Exception("连接千问API超时，请检查网络连接或稍后重试")
+            except httpx.ConnectTimeout:
+                self._check_deadline()
+                raise Exception("连接千问API失败，请检查网络连接")
+            except Exception as e:
+                raise Exception(f"API请求异常: {str(e)}")
+
+    async def call_qwen_api_stream(self, messages: List[Dict[str, Any]], tools=None,
+                                   tools_json: Optional[str] = None,
+                                   on_token: Optional[Callable[[str], None]] = None,
+                                   on_tool_call: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """以流式 (stream: true) 方式调用阿里云千问 API
+
+        Args:
+            messages: 消息历史
+            tools: 可用工具列表
+            tools_json: 预先序列化的工具列表 JSON 片段，提供时优先于 tools
+            on_token: 收到文本增量时的回调
+            on_tool_call: 某个工具调用的参数拼装完整时的回调，可用于立即执行该工具
+
+        Returns:
+            与 call_qwen_api 结构相同的完整响应
+        """
+        import httpx
+        model = self._select_model()
+        url, body, headers = self._build_chat_request(messages, tools, tools_json, stream=True, model=model)
+        client = self.get_http_client()
+        scheduler = self.get_scheduler()
+        estimated = estimate_tokens(body, self.model_config.get_request_params()["max_tokens"])
+        assembler = StreamAssembler()
+        
+        def send():
+            request = client.build_request("POST", url, content=body, headers=headers, **self._request_kwargs())
+            return client.send(request, stream=True)
+        
+        def dispatch(tool_calls: List[Dict[str, Any]]):
+            if on_tool_call:
+                for tool_call in tool_calls:
+                    on_tool_call(tool_call)
+        
+        with self.tracer.span("llm.request", stream=True, request_bytes=len(body), model=model) as span:
+            async def attempt() -> Dict[str, Any]:
+                # 读取整个流期间都占用调度器的并发槽位
+                async with scheduler.request(send, estimated) as response:
+                    span.set(status_code=response.status_code)
+                    if response.status_code != 200:
+                        await response.aread()
+                        raise LLMAPIError(response.status_code, response.text,
+                                          parse_retry_after(response.headers.get("Retry-After")))
+                    
+                    async for chunk in iter_sse_chunks(response):
+                        delta = assembler.feed(chunk)
+                        if delta["content"] and "time_to_first_token" not in span.attributes:
+                            span.set(time_to_first_token=(time.time_ns() - span.start_ns) / 1e9)
+                        if delta["content"] and on_token:
+                            on_token(delta["content"])
+                        dispatch(delta["tool_calls"])
                 
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    raise Exception(f"API请求失败: {response.status_code}, {response.text}")
-        except httpx.ReadTimeout:
-            raise Exception("连接千问API超时，请检查网络连接或稍后重试")
-        except httpx.ConnectTimeout:
-            raise Exception("连接千问API失败，请检查网络连接")
-        except Exception as e:
-            raise Exception(f"API请求异常: {str(e)}")
+                scheduler.reconcile_tokens(estimated, assembler.usage)
+                span.set_usage(assembler.usage)
+                self.prompt_cache.record(assembler.usage)
+                dispatch(assembler.finish())
+                return assembler.to_response()
+            
+            try:
+                # 流式输出已经交给 on_token，不做对冲，只受截止时间限制
+                return await self._within_deadline(attempt())
+            except (LLMAPIError, DeadlineExceeded):
+                raise
+            except httpx.ReadTimeout:
+                self._check_deadline()
+                raise Exception("连接千问API超时，请检查网络连接或稍后重试")
+            except httpx.ConnectTimeout:
+                self._check_deadline()
+                raise Exception("连接千问API失败，请检查网络连接")
+            except Exception as e:
+                raise Exception(f"API请求异常: {str(e)}")
+
+    async def call_tool(self, tool_call: Dict[str, Any]) -> Dict[str, Any]:
+        """执行单个工具调用，异常被捕获并记录在结果中
+
+        Args:
+            tool_call: 模型返回的 tool_calls 中的一项
+
+        Returns:
+            包含 id、name、args、content、error 的结果字典
+        """
+        function_call = tool_call["function"]
+        tool_name = function_call["name"]
+        result = {"id": tool_call["id"], "name": tool_name, "args": None, "content": "", "error": None}
+        started = time.perf_counter()
+        
+        with self.tracer.span("tool.call", tool=tool_name,
+                              args_bytes=len(function_call.get("arguments") or "")) as span:
+            try:
+                tool_args = json.loads(function_call.get("arguments") or "{}")
+                result["args"] = tool_args
+                
+                # 优先使用推测执行的结果，否则按工具名路由到对应服务器，并在其副本间负载均衡
+                call_result = None
+                if self.speculator is not None:
+                    call_result = await self.speculator.take(tool_name, tool_args)
+                    span.set(speculative=call_result is not None)
+                if call_result is None:
+                    # 工具调用同样不超过本次查询的剩余时间
+                    call_result = await self._within_deadline(self.servers.call_tool(tool_name, tool_args))
+                
+                # 确保工具结果是可序列化的
+                try:
+                    result["content"] = json.dumps(call_result.content)
+                except TypeError:
+                    result["content"] = str(call_result.content)
+                
+                # FastMCP 以 isError=True 的结果（而不是异常）报告工具执行失败
+                if call_result.isError:
+                    result["error"] = f"工具调用错误 ({tool_name}): {result['content']}"
+            except DeadlineExceeded as e:
+                result["error"] = f"工具调用超时 ({tool_name}): {str(e)}"
+                result["content"] = result["error"]
+            except Exception as e:
+                result["error"] = f"工具调用错误 ({tool_name}): {str(e)}"
+                result["content"] = result["error"]
+                import traceback
+                print("\n工具调用详细错误:")
+                traceback.print_exc()
+            span.set(result_bytes=len(result["content"]), error=result["error"] is not None)
+        
+        if self.first_tool_call is None:
+            finished = time.perf_counter()
+            self.first_tool_call = {"tool": tool_name, "latency": finished - started,
+                                    "since_start": finished - IMPORT_STARTED}
+        return result
+
+    def new_tool_round(self) -> "ToolCallRound":
+        """按工具调用配置创建一轮调用的调度状态"""
+        tool_params = self.model_config.get_tool_params()
+        concurrency = max(1, tool_params["tool_concurrency"]) if tool_params["parallel_tool_calls"] else 1
+        return ToolCallRound(self.call_tool, concurrency)
+
+    async def execute_tool_calls(self, tool_calls: List[Dict[str, Any]],
+                                 tool_round: Optional["ToolCallRound"] = None) -> List[Dict[str, Any]]:
+        """执行同一轮中的多个工具调用
+
+        启用 parallel_tool_calls 时，相互独立的调用在 tool_concurrency 上限内并发执行；
+        否则逐个执行。tool_failure_policy 为 cancel 时，任一调用失败（包括 isError 结果）
+        会取消其余尚未完成的调用。注意取消只是停止客户端一侧的等待，不会向服务器发送
+        notifications/cancelled，服务器上已开始的工具仍会执行完毕。
+
+        Args:
+            tool_calls: 模型返回的 function 类型工具调用列表
+            tool_round: 本轮的调度状态，流式模式下其中可能已有提前启动的调用
+
+        Returns:
+            与 tool_calls 顺序一致的结果列表
+        """
+        if tool_round is None:
+            tool_round = self.new_tool_round()
+        cancel_on_failure = self.model_config.get_tool_params()["tool_failure_policy"] == "cancel"
+        
+        tasks = [tool_round.start(tool_call) for tool_call in tool_calls]
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if cancel_on_failure and any(not task.cancelled() and task.result()["error"] for task in done):
+                    for task in pending:
+                        task.cancel()
+                    await asyncio.gather(*pending, return_exceptions=True)
+                    break
+        finally:
+            # 外层被取消时不留下孤立的工具调用
+            tool_round.cancel_pending()
+        
+        results = []
+        for tool_call, task in zip(tool_calls, tasks):
+            if task.cancelled():
+                tool_name = tool_call["function"]["name"]
+                error = f"工具调用已取消 ({tool_name}): 同一轮中的其他工具调用失败"
+                results.append({"id": tool_call["id"], "name": tool_name, "args": None,
+                                "content": error, "error": error})
+            else:
+                results.append(task.result())
+        return results
+
+    async def request_llm(self, messages: List[Dict[str, Any]], tools_json: Optional[str] = None,
+                          on_token: Optional[Callable[[str], None]] = None,
+                          tool_round: Optional[ToolCallRound] = None) -> Dict[str, Any]:
+        """按配置以流式或非流式方式请求 LLM
+
+        流式模式下文本增量通过 on_token 实时输出，参数完整的工具调用立即在 tool_round 中启动，
+        使工具执行与模型生成重叠。
+        """
+        if not self.model_config.get_request_params()["stream"]:
+            return await self.call_qwen_api(messages, tools_json=tools_json)
+        
+        def start_tool_call(tool_call: Dict[str, Any]):
+            if tool_round is not None and tool_call["type"] == "function":
+                tool_round.start(tool_call)
+        
+        return await self.call_qwen_api_stream(messages, tools_json=tools_json,
+                                               on_token=on_token, on_tool_call=start_tool_call)
+
+    def new_conversation(self) -> Conversation:
+        """按配置创建对话历史"""
+        return Conversation(**self.model_config.get_conversation_params())
 
-    async def process_query(self, query: str) -> str:
-        """使用千问和可用的工具处理查询，支持链式工具调用"""
+    async def process_query(self, query: str, on_token: Optional[Callable[[str], None]] = None,
+                            raise_errors: bool = False, conversation: Optional[Conversation] = None,
+                            deadline: Optional[float] = None) -> str:
+        """使用千问和可用的工具处理查询，支持链式工具调用
+
+        Args:
+            query: 用户查询
+            on_token: 流式模式下的输出回调，模型文本和工具调用提示会实时传给它
+            raise_errors: 为 True 时查询失败会抛出异常，而不是返回错误文本（批量模式用于统计失败）
+            conversation: 对话历史，本轮问答会追加到其中；为 None 时只使用本次查询（批量模式）
+            deadline: 端到端截止时间（秒），链式调用的每一跳共享；为 None 时使用配置的 query_deadline，
+                0 表示不限制
+        """
+        if deadline is None:
+            deadline = self.model_config.get_latency_params()["deadline"]
+        with self.tracer.span("agent.query", query_chars=len(query), deadline=deadline or None), \
+                deadline_scope(deadline):
+            return await self._run_query(query, on_token, raise_errors, conversation)
+
+    async def _run_query(self, query: str, on_token: Optional[Callable[[str], None]],
+                         raise_errors: bool, conversation: Optional[Conversation]) -> str:
+        streaming = on_token is not None and self.model_config.get_request_params()["stream"]
+        final_text = []
+        
+        def add_text(text: str):
+            # 流式模式下模型文本已经实时输出，这里只补充输出工具调用提示等内容
+            final_text.append(text)
+            if streaming:
+                on_token(f"\n{text}\n")
+        
+        # 流式模式下提前启动的工具调用，任何退出路径都要取消未完成的部分
+        tool_round: Optional[ToolCallRound] = None
+        if conversation is None:
+            conversation = self.new_conversation()
+        # 本轮未正常完成时撤销已追加的消息，避免历史中留下没有结果的工具调用
+        turn_mark: Optional[int] = None
+        completed = False
+        # 本轮每一跳执行的工具调用，完成后供推测执行学习
+        hops: List[List[Any]] = []
         try:
-            messages = [
-                {
-                    "role": "user",
-                    "content": query
-                }
-            ]
-
-            response = await self.session.list_tools()
-            available_tools = [{
-                "type": "function",
-                "function": {
-                    "name": tool.name,
-                    "description": tool.description,
-                    "parameters": tool.inputSchema
-                }
-            } for tool in response.tools]
+            # 使用缓存的工具目录，仅在收到变更通知后才重新获取
+            await self.servers.ensure_fresh()
+            tools_json = self.servers.tools_json
 
             # 处理直接工具调用的格式：工具名+空格+参数
             if " " in query:
@@ -192,13 +695,7 @@ class MCPClient:
                 tool_args_str = parts[1]
                 
                 # 检查工具是否存在
-                tool_exists = False
-                for tool in response.tools:
-                    if tool.name == tool_name:
-                        tool_exists = True
-                        break
-                
-                if tool_exists:
+                if self.servers.has_tool(tool_name):
                     try:
                         # 尝试解析参数
                         if tool_args_str.startswith("{") and tool_args_str.endswith("}"):
@@ -209,23 +706,32 @@ class MCPClient:
                             tool_args = {"url": tool_args_str}
                         
                         # 直接调用工具
-                        result = await self.session.call_tool(tool_name, tool_args)
+                        result = await self.servers.call_tool(tool_name, tool_args)
                         return f"[直接调用工具 {tool_name}]\n{result.content}"
                     except Exception as e:
+                        if raise_errors:
+                            raise
                         return f"工具调用错误: {str(e)}\n\n参数格式应为JSON或简单URL"
             
-            # 初始千问 API 调用
-            try:
-                response = await self.call_qwen_api(messages, available_tools)
-            except Exception as e:
-                return f"千问API调用失败: {str(e)}\n\n请检查网络连接或API配置"
-            
-            final_text = []
-            
             # 最大链式调用次数，防止无限循环
             max_chain_calls = 5
             chain_count = 0
             
+            # 初始千问 API 调用，每次请求前按 token 预算压缩历史
+            turn_mark = conversation.begin_turn(query)
+            if self.speculator is not None:
+                self.speculator.speculate(self.speculator.predict_from_query(query, self.servers.tool_names()))
+            tool_round = self.new_tool_round()
+            try:
+                with self.tracer.span("agent.hop", hop=0):
+                    response = await self.request_llm(conversation.prepare(), tools_json, on_token, tool_round)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                if raise_errors:
+                    raise
+                return f"千问API调用失败: {str(e)}\n\n请检查网络连接或API配置"
+            
             # 循环处理工具调用，直到模型不再调用工具或达到最大调用次数
             while chain_count < max_chain_calls:
                 chain_count += 1
@@ -241,78 +747,87 @@ class MCPClient:
                     if not isinstance(content, str):
                         content = str(content)
                     final_text.append(content)
+                    conversation.add_assistant(content)
+                    completed = True
                     break
                 
-                # 处理所有工具调用
-                has_tool_calls = False
-                for tool_call in assistant_message["tool_calls"]:
-                    if tool_call["type"] == "function":
-                        has_tool_calls = True
-                        function_call = tool_call["function"]
-                        tool_name = function_call["name"]
-                        tool_args = json.loads(function_call["arguments"])
-                        
-                        # 执行工具调用
-                        try:
-                            result = await self.session.call_tool(tool_name, tool_args)
-                            final_text.append(f"[调用工具 {tool_name}，参数 {tool_args}]")
-                            
-                            # 确保内容是字符串
-                            assistant_content = assistant_message.get("content", "")
-                            if not isinstance(assistant_content, str):
-                                assistant_content = str(assistant_content)
-                            
-                            # 添加助手消息到历史
-                            messages.append({
-                                "role": "assistant",
-                                "content": assistant_content,
-                                "tool_calls": assistant_message["tool_calls"]
-                            })
-                            
-                            # 确保工具结果是可序列化的
-                            try:
-                                tool_result_content = json.dumps(result.content)
-                            except TypeError:
-                                tool_result_content = str(result.content)
-                            
-                            # 添加工具结果到历史
-                            messages.append({
-                                "role": "tool",
-                                "tool_call_id": tool_call["id"],
-                                "name": tool_name,
-                                "content": tool_result_content
-                            })
-                        except Exception as e:
-                            error_msg = f"工具调用错误 ({tool_name}): {str(e)}"
-                            final_text.append(error_msg)
-                            import traceback
-                            print("\n工具调用详细错误:")
-                            traceback.print_exc()
-                            break
+                tool_calls = [tool_call for tool_call in assistant_message["tool_calls"]
+                              if tool_call["type"] == "function"]
                 
                 # 如果没有工具调用，结束循环
-                if not has_tool_calls:
+                if not tool_calls:
                     break
                 
-                # 获取下一个响应
-                response = await self.call_qwen_api(messages, available_tools)
+                # 确保内容是字符串
+                assistant_content = assistant_message.get("content", "")
+                if not isinstance(assistant_content, str):
+                    assistant_content = str(assistant_content)
+                
+                # 添加助手消息到历史（每轮只添加一次）
+                conversation.add_assistant(assistant_content, assistant_message["tool_calls"])
+                
+                # 每一跳包括本轮工具调用和随后的 LLM 请求
+                with self.tracer.span("agent.hop", hop=chain_count, tool_calls=len(tool_calls)):
+                    # 执行本轮全部工具调用，结果按 tool_call_id 原顺序返回
+                    results = await self.execute_tool_calls(tool_calls, tool_round)
+                    for result in results:
+                        if result["error"]:
+                            add_text(result["error"])
+                        else:
+                            add_text(f"[调用工具 {result['name']}，参数 {result['args']}]")
+                    
+                        # 添加工具结果到历史，失败的调用也要回复，保证每个 tool_call_id 都有结果
+                        conversation.add_tool_result(result["id"], result["name"], result["content"])
+                    
+                    hops.append([(result["name"], result["args"]) for result in results
+                                 if result["args"] is not None and not result["error"]])
+                    if self.speculator is not None:
+                        self.speculator.speculate(self.speculator.predict_next(hops[-1]))
+                    
+                    # 获取下一个响应；若这已是最后允许的一轮，其工具调用不会执行，不提前启动
+                    tool_round = self.new_tool_round()
+                    response = await self.request_llm(
+                        conversation.prepare(), tools_json, on_token,
+                        tool_round if chain_count < max_chain_calls else None
+                    )
             
             # 添加最终响应
             if chain_count >= max_chain_calls and "choices" in response and len(response["choices"]) > 0:
-                final_text.append("(达到最大链式调用次数限制)")
-                final_text.append(response["choices"][0]["message"].get("content", ""))
+                add_text("(达到最大链式调用次数限制)")
+                content = response["choices"][0]["message"].get("content", "") or ""
+                final_text.append(content)
+                # 最后一轮的工具调用不会执行，历史中只记录文本
+                conversation.add_assistant(content if isinstance(content, str) else str(content))
+                completed = True
             
+            return "\n".join(final_text)
+        except DeadlineExceeded as e:
+            if raise_errors:
+                raise
+            # 超过截止时间时返回已经得到的部分结果，而不是继续等待
+            add_text(f"({str(e)})")
             return "\n".join(final_text)
         except Exception as e:
+            if raise_errors:
+                raise
             import traceback
             print("\n处理查询时出错:")
             traceback.print_exc()
+            if streaming:
+                on_token(f"\n处理查询时出错: {str(e)}\n")
             return f"处理查询时出错: {str(e)}"
+        finally:
+            if tool_round is not None:
+                tool_round.cancel_pending()
+            if turn_mark is not None and not completed:
+                conversation.rollback(turn_mark)
+            if completed and self.speculator is not None:
+                self.speculator.observe(query, hops)
 
     async def chat_loop(self):
         """运行交互式聊天循环"""
         print("\nMCP 客户端已启动！")
-        print("输入你的查询或输入 'quit' 退出。")
+        print("输入你的查询或输入 'quit' 退出，输入 'refresh' 刷新工具列表，输入 'clear' 清空对话历史。")
 
         import traceback
         while True:
@@ -321,67 +836,153 @@ class MCPClient:
 
                 if query.lower() == 'quit':
                     break
+                
+                if query.lower() == 'refresh':
+                    await self.refresh_tools()
+                    print("\n工具列表已刷新：", self.servers.tool_names())
+                    continue
+                
+                if query.lower() == 'clear':
+                    self.conversation.clear()
+                    print("\n对话历史已清空")
+                    continue
 
-                response = await self.process_query(query)
-                print("\n" + response)
+                # 流式模式下边生成边输出
+                streamed = False
+                
+                def print_token(text: str):
+                    nonlocal streamed
+                    if not streamed:
+                        print()
+                        streamed = True
+                    print(text, end="", flush=True)
+                
+                response = await self.process_query(query, on_token=print_token,
+                                                    conversation=self.conversation)
+                if streamed:
+                    print()
+                else:
+                    print("\n" + response)
 
             except Exception as e:
                 print("\n错误:")
                 traceback.print_exc()
                 print(f"\n错误摘要: {str(e)}")
 
+    def startup_report(self) -> str:
+        """启动分析报告：模块导入、各服务器连接（启动、initialize 和 tools/list）和第一次工具调用的耗时"""
+        lines = [f"启动分析: 导入模块 {IMPORT_SECONDS * 1000:.1f} ms（不含解释器启动）"]
+        for name, seconds in self.connect_seconds.items():
+            lines.append(f"  连接 {name}: {seconds * 1000:.1f} ms")
+        if self.first_tool_call is None:
+            lines.append("  没有发生工具调用")
+        else:
+            call = self.first_tool_call
+            lines.append(f"  第一次工具调用 {call['tool']}: {call['latency'] * 1000:.1f} ms，"
+                         f"距离启动 {call['since_start'] * 1000:.1f} ms")
+        return "\n".join(lines)
+
     async def cleanup(self):
         """清理资源"""
+        if self.speculator is not None:
+            self.speculator.cancel_all()
         await self.exit_stack.aclose()
+        self.tracer.flush()
+
+async def run_client(client: MCPClient, args):
+    """连接完成后运行批量模式或交互式聊天循环"""
+    if args.batch:
+        runner = BatchRunner(
+            client,
+            args.batch,
+            args.output or f"{os.path.splitext(args.batch)[0]}.out.jsonl",
+            concurrency=args.concurrency,
+            ordered=args.ordered,
+            resume=args.resume,
+            query_field=args.query_field,
+        )
+        await runner.run()
+    else:
+        await client.chat_loop()
+    if client.prompt_cache.requests:
+        print(client.prompt_cache.summary(), file=sys.stderr)
+    if client.speculator is not None and client.speculator.stats["launched"]:
+        print(client.speculator.summary(), file=sys.stderr)
+    if client.hedger is not None and client.hedger.stats["requests"]:
+        print(client.hedger.summary(), file=sys.stderr)
+    if client.fallbacks:
+        print(f"临近截止时间改用 {client.model_config.get_latency_params()['fallback_model']} "
+              f"{client.fallbacks} 次", file=sys.stderr)
+    if client.tracer.histograms:
+        print(client.tracer.summary(), file=sys.stderr)
 
 async def main():
     parser = argparse.ArgumentParser(description="MCP 客户端")
-    parser.add_argument("server", nargs="?", help="服务器脚本路径或 SSE 服务器 URL")
-    parser.add_argument("--mode", choices=["stdio", "sse"], default="stdio",
-                      help="连接模式: stdio 或 sse")
-    parser.add_argument("-m", "--module", help="直接启动Python模块作为MCP服务器")
+    parser.add_argument("server", nargs="*", help="服务器脚本路径或 SSE 服务器 URL，可指定多个")
+    parser.add_argument("--mode", choices=["stdio", "sse", "streamable-http", "warm-pool"], default="stdio",
+                      help="连接模式: stdio、sse、streamable-http 或 warm-pool（预热进程池的套接字路径，"
+                           "省略时使用配置的 warm_pool_socket）；以 http:// 或 https:// 开头的地址默认按 sse 连接")
+    parser.add_argument("-m", "--module", action="append", default=[],
+                      help="直接启动Python模块作为MCP服务器，可重复指定")
+    parser.add_argument("--replicas", type=int, default=1, help="每个服务器打开的副本会话数，调用在副本间负载均衡")
+    parser.add_argument("--stream", action="store_true", help="以流式方式请求 LLM，实时输出生成内容")
+    parser.add_argument("--deadline", type=float, help="每次查询的截止时间（秒），覆盖配置的 query_deadline")
+    parser.add_argument("--batch", "--input", dest="batch", metavar="INPUT",
+                      help="批量模式: 从 JSONL 文件读取查询，不进入交互循环")
+    parser.add_argument("--output", help="批量模式的结果文件 (JSONL)，默认为 <INPUT>.out.jsonl")
+    parser.add_argument("--concurrency", type=int, default=8, help="批量模式同时运行的查询数")
+    parser.add_argument("--ordered", action="store_true", help="批量模式按输入顺序写出结果（默认按完成顺序）")
+    parser.add_argument("--resume", action="store_true", help="批量模式从检查点继续上次的运行")
+    parser.add_argument("--profile-startup", action="store_true",
+                      help="退出时报告模块导入、服务器连接和第一次工具调用的耗时")
+    parser.add_argument("--query-field", help="批量模式中查询文本所在的字段，默认依次尝试 query/prompt/body/content")
     
     args = parser.parse_args()
     
-    # 使用 -m 参数指定Python模块
-    if args.module:
-        if args.server:
-            print("警告: 同时指定了服务器路径和模块名，将优先使用模块名")
-        
-        client = MCPClient()
-        try:
-            await client.connect_to_python_module(args.module)
-            await client.chat_loop()
-        except Exception as e:
-            print(f"程序运行出错: {str(e)}")
-            import traceback
-            traceback.print_exc()
-        finally:
-            await client.cleanup()
-        return
+    # 命令行参数覆盖配置文件
+    overrides = {}
+    if args.stream:
+        overrides["stream"] = True
+    if args.deadline is not None:
+        overrides["query_deadline"] = args.deadline
+    
+    client = MCPClient(**overrides)
     
-    if not args.server:
+    # 命令行指定的服务器，未指定时使用配置文件中的 mcp_servers
+    servers = [{"transport": "module", "target": module, "replicas": args.replicas} for module in args.module]
+    for server in args.server:
+        is_url = server.startswith("http://") or server.startswith("https://")
+        # SSE 模式 - 连接到运行中的 HTTP 服务器，地址如 http://localhost:8000/sse
+        # streamable HTTP 模式 - 地址如 http://localhost:8000/mcp
+        # 标准输入输出模式 - 启动并连接到子进程服务器
+        # 预热进程池模式 - 地址为 warm_pool.py 监听的 Unix 套接字
+        if args.mode in ("streamable-http", "warm-pool"):
+            transport = args.mode
+        else:
+            transport = "sse" if args.mode == "sse" or is_url else "stdio"
+        servers.append({"transport": transport, "target": server, "replicas": args.replicas})
+    if not servers and args.mode == "warm-pool":
+        servers = [{"transport": "warm-pool", "target": "", "replicas": args.replicas}]
+    if not servers:
+        servers = client.model_config.get_mcp_servers()
+    
+    if not servers:
         print("使用方法: python mcp_client.py <path_to_server_script> 或 python mcp_client.py --mode=sse <server_url>")
         print("          python mcp_client.py -m <module_name> (直接启动Python模块)")
+        print("          可同时指定多个服务器，或在 config.json 的 mcp_servers 中配置")
         sys.exit(1)
     
-    client = MCPClient()
     try:
-        if args.mode == "stdio":
-            # 标准输入输出模式 - 启动并连接到子进程服务器
-            await client.connect_to_server(args.server)
-        else:
-            # SSE 模式 - 连接到运行中的 HTTP 服务器
-            # args.server 应为 URL，如 http://localhost:8000/sse
-            await client.connect_to_sse_server(args.server)
-        
-        await client.chat_loop()
+        await client.connect_from_config(servers)
+        await run_client(client, args)
     except Exception as e:
         print(f"程序运行出错: {str(e)}")
         import traceback
         traceback.print_exc()
     finally:
         await client.cleanup()
+        if args.profile_startup:
+            print(client.startup_report(), file=sys.stderr)
 
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file
@@ -1,10 +1,10 @@
-from typing import Optional, Dict, Any
-from config import Config  # 导入统一配置类
+from typing import Optional, Dict, Any, List
+from config import Config, get_config  # 导入统一配置类
 
 class ModelConfig:
     def __init__(self, config_file: Optional[str] = None, **kwargs):
-        # 使用统一配置类
-        self.config = Config(config_file, **kwargs)
+        # 使用统一配置类，没有覆盖参数时复用按文件缓存的共享实例，配置文件只读取一次
+        self.config = Config(config_file, **kwargs) if kwargs else get_config(config_file)
         
     def get_request_params(self) -> Dict[str, Any]:
         """返回请求参数字典"""
@@ -12,4 +12,60 @@ class ModelConfig:
     
     def get_client_params(self) -> Dict[str, Any]:
         """返回客户端参数字典"""
-        return self.config.get_client_params() 
\ No newline at end of file
+        return self.config.get_client_params() 
+    
+    def get_http_params(self) -> Dict[str, Any]:
+        """返回上游 HTTP 连接池参数字典"""
+        return self.config.get_http_params()
+    
+    def get_fetch_params(self) -> Dict[str, Any]:
+        """返回服务器 fetch 连接池参数字典"""
+        return self.config.get_fetch_params()
+    
+    def get_executor_params(self) -> Dict[str, Any]:
+        """返回服务器工具执行池参数字典"""
+        return self.config.get_executor_params()
+    
+    def get_coalescing_params(self) -> Dict[str, Any]:
+        """返回服务器工具调用合并参数字典"""
+        return self.config.get_coalescing_params()
+    
+    def get_tool_params(self) -> Dict[str, Any]:
+        """返回工具调用参数字典"""
+        return self.config.get_tool_params()
+    
+    def get_mcp_servers(self) -> List[Dict[str, Any]]:
+        """返回配置的 MCP 服务器列表"""
+        return self.config.get_mcp_servers()
+    
+    def get_scheduler_params(self) -> Dict[str, Any]:
+        """返回上游 LLM 调度参数字典"""
+        return self.config.get_scheduler_params()
+    
+    def get_llm_cache_params(self) -> Dict[str, Any]:
+        """返回 LLM 工具结果缓存参数字典"""
+        return self.config.get_llm_cache_params()
+    
+    def get_text_batch_params(self) -> Dict[str, Any]:
+        """返回文本工具微批处理参数字典"""
+        return self.config.get_text_batch_params()
+    
+    def get_warm_pool_params(self) -> Dict[str, Any]:
+        """返回预热进程池参数字典"""
+        return self.config.get_warm_pool_params()
+    
+    def get_conversation_params(self) -> Dict[str, Any]:
+        """返回对话历史参数字典"""
+        return self.config.get_conversation_params()
+    
+    def get_tracing_params(self) -> Dict[str, Any]:
+        """返回追踪参数字典"""
+        return self.config.get_tracing_params()
+    
+    def get_latency_params(self) -> Dict[str, Any]:
+        """返回延迟控制参数字典"""
+        return self.config.get_latency_params()
+    
+    def get_speculation_params(self) -> Dict[str, Any]:
+        """返回推测执行参数字典"""
+        return self.config.get_speculation_params()
@@ -0,0 +1,79 @@
+import json
+from typing import Any, Dict, List, Optional
+
+# 显式缓存标记（DashScope / Anthropic 兼容接口）
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def canonical_dumps(value: Any) -> str:
+    """规范化 JSON 序列化：键排序、紧凑分隔符、不转义非 ASCII 字符，相同内容总是得到相同字节"""
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def canonical_tools_json(tools: List[Dict[str, Any]]) -> str:
+    """按工具名排序并规范化序列化工具列表
+
+    服务器连接顺序、工具目录刷新都不会改变结果，保证请求前缀稳定。
+    """
+    return canonical_dumps(sorted(tools, key=lambda tool: tool.get("function", {}).get("name", "")))
+
+
+def with_cache_marker(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """在最后一条消息上添加 cache_control 标记，返回新列表，不修改原消息
+
+    服务端会缓存到标记处为止的前缀，下一次请求（在此基础上追加消息）即可命中。
+    """
+    if not messages:
+        return messages
+    last = messages[-1]
+    content = last.get("content")
+    if not isinstance(content, str) or not content:
+        return messages
+    marked = dict(last, content=[{"type": "text", "text": content, "cache_control": CACHE_CONTROL}])
+    return messages[:-1] + [marked]
+
+
+def build_chat_body(params: Dict[str, Any], messages: List[Dict[str, Any]],
+                    tools_json: Optional[str] = None) -> bytes:
+    """构造前缀稳定的 /chat/completions 请求体
+
+    固定参数和工具定义在前、消息历史在后，并全部规范化序列化。只要历史是追加的，
+    相邻两次请求的请求体只在末尾不同，上游的前缀缓存（KV cache）可以命中。
+
+    Args:
+        params: 除 messages/tools 外的请求字段
+        messages: 消息历史
+        tools_json: canonical_tools_json 生成的工具列表
+    """
+    head = canonical_dumps(params)[:-1]
+    if tools_json and tools_json != "[]":
+        head += f',"tools":{tools_json}'
+    return f'{head},"messages":{canonical_dumps(messages)}}}'.encode("utf-8")
+
+
+class PromptCacheStats:
+    """统计响应 usage 中报告的前缀缓存命中 token 数"""
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def record(self, usage: Optional[Dict[str, Any]]) -> int:
+        """记录一次响应的 usage，返回其中命中缓存的 token 数"""
+        if not usage:
+            return 0
+        details = usage.get("prompt_tokens_details") or {}
+        cached = details.get("cached_tokens") or 0
+        self.requests += 1
+        self.prompt_tokens += usage.get("prompt_tokens") or 0
+        self.cached_tokens += cached
+        return cached
+
+    @property
+    def hit_ratio(self) -> float:
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+    def summary(self) -> str:
+        return (f"LLM 请求 {self.requests} 次，输入 {self.prompt_tokens} tokens，"
+                f"其中缓存命中 {self.cached_tokens} tokens（{self.hit_ratio:.1%}）")
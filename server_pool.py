@@ -0,0 +1,175 @@
+import re
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from request_builder import canonical_tools_json
+from tool_catalog import ToolCatalog
+
+# 多服务器时工具名的命名空间分隔符，OpenAI 工具名只允许字母、数字、_ 和 -
+NAMESPACE_SEPARATOR = "__"
+
+if TYPE_CHECKING:
+    from mcp import ClientSession
+
+
+class ServerGroup:
+    """同一个 MCP 服务器的一组副本会话
+
+    副本共享同一份工具目录，call_tool 总是发往未完成请求数最少的副本。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.sessions: List["ClientSession"] = []
+        self.outstanding: List[int] = []
+        self.catalog = ToolCatalog()
+        self._next = 0
+
+    def add_session(self, session: "ClientSession"):
+        """添加一个已初始化的副本会话"""
+        self.sessions.append(session)
+        self.outstanding.append(0)
+
+    def pick(self) -> int:
+        """选择未完成请求数最少的副本，数量相同时轮询"""
+        count = len(self.sessions)
+        best = None
+        for offset in range(count):
+            index = (self._next + offset) % count
+            if best is None or self.outstanding[index] < self.outstanding[best]:
+                best = index
+        self._next = (best + 1) % count
+        return best
+
+    async def call_tool(self, name: str, arguments: Dict[str, Any]):
+        index = self.pick()
+        self.outstanding[index] += 1
+        try:
+            return await self.sessions[index].call_tool(name, arguments)
+        finally:
+            self.outstanding[index] -= 1
+
+    async def ensure_fresh(self):
+        await self.catalog.ensure_fresh(self.sessions[0])
+
+    async def refresh(self):
+        await self.catalog.refresh(self.sessions[0])
+
+
+class ServerPool:
+    """多服务器连接池与工具路由
+
+    合并所有服务器的工具目录。只连接一个服务器时保持原始工具名；
+    连接多个服务器时工具名加上 "<服务器名>__" 前缀，调用时按前缀路由到对应服务器。
+    """
+
+    def __init__(self):
+        self.groups: Dict[str, ServerGroup] = {}
+        # 合并后的工具目录
+        self.tools: List[Tuple[str, ServerGroup, Any]] = []
+        self.openai_tools: List[Dict[str, Any]] = []
+        self.tools_json: str = "[]"
+        self._routes: Dict[str, Tuple[ServerGroup, str]] = {}
+        self._versions: Optional[Tuple[int, ...]] = None
+
+    def add_group(self, name: str) -> ServerGroup:
+        """按名称创建服务器组，名称会被规范化并在重复时加上序号"""
+        base = re.sub(r"[^a-zA-Z0-9_-]", "_", name) or "server"
+        unique = base
+        suffix = 2
+        while unique in self.groups:
+            unique = f"{base}_{suffix}"
+            suffix += 1
+        group = ServerGroup(unique)
+        self.groups[unique] = group
+        return group
+
+    @property
+    def primary_session(self) -> Optional["ClientSession"]:
+        """第一个服务器的第一个会话"""
+        for group in self.groups.values():
+            if group.sessions:
+                return group.sessions[0]
+        return None
+
+    def _rebuild(self):
+        """按各服务器的工具目录重建合并目录"""
+        namespaced = len(self.groups) > 1
+        self.tools = []
+        self.openai_tools = []
+        self._routes = {}
+        bare_names: Dict[str, List[Tuple[ServerGroup, str]]] = {}
+
+        for group in self.groups.values():
+            for tool, openai_tool in zip(group.catalog.tools, group.catalog.openai_tools):
+                exposed = f"{group.name}{NAMESPACE_SEPARATOR}{tool.name}" if namespaced else tool.name
+                self.tools.append((exposed, group, tool))
+                self.openai_tools.append({
+                    "type": "function",
+                    "function": dict(openai_tool["function"], name=exposed),
+                })
+                self._routes[exposed] = (group, tool.name)
+                bare_names.setdefault(tool.name, []).append((group, tool.name))
+
+        # 不重复的原始工具名也可直接使用（如直接调用 "fetch <url>"）
+        for name, routes in bare_names.items():
+            if len(routes) == 1:
+                self._routes.setdefault(name, routes[0])
+
+        # 按工具名排序并规范化序列化，连接顺序和目录刷新不会改变请求前缀
+        self.tools_json = canonical_tools_json(self.openai_tools)
+
+    def _sync(self):
+        versions = tuple(group.catalog.version for group in self.groups.values())
+        if versions != self._versions:
+            self._rebuild()
+            self._versions = versions
+
+    async def ensure_fresh(self):
+        """刷新过期的服务器目录，必要时重建合并目录"""
+        for group in self.groups.values():
+            await group.ensure_fresh()
+        self._sync()
+
+    async def refresh(self):
+        """显式刷新所有服务器的工具目录"""
+        for group in self.groups.values():
+            await group.refresh()
+        self._sync()
+
+    def resolve(self, name: str) -> Tuple[ServerGroup, str]:
+        """把暴露给模型的工具名解析为 (服务器组, 原始工具名)"""
+        self._sync()
+        if name not in self._routes:
+            raise ValueError(f"未知工具: {name}")
+        return self._routes[name]
+
+    def has_tool(self, name: str) -> bool:
+        self._sync()
+        return name in self._routes
+
+    def tool_names(self) -> List[str]:
+        self._sync()
+        return [exposed for exposed, _, _ in self.tools]
+
+    def _find(self, name: str) -> Optional[Any]:
+        self._sync()
+        for exposed, _, tool in self.tools:
+            if exposed == name:
+                return tool
+        return None
+
+    def is_pure(self, name: str) -> bool:
+        """工具是否被服务器标注为只读且幂等（readOnlyHint 和 idempotentHint），可以安全地提前执行"""
+        tool = self._find(name)
+        annotations = tool.annotations if tool is not None else None
+        return bool(annotations and annotations.readOnlyHint and annotations.idempotentHint)
+
+    def required_params(self, name: str) -> List[str]:
+        """工具输入模式中的必填参数"""
+        tool = self._find(name)
+        return list(tool.inputSchema.get("required", [])) if tool is not None else []
+
+    async def call_tool(self, name: str, arguments: Dict[str, Any]):
+        """把工具调用路由到对应服务器，并在其副本间负载均衡"""
+        group, tool_name = self.resolve(name)
+        return await group.call_tool(tool_name, arguments)
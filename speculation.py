@@ -0,0 +1,168 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from request_builder import canonical_dumps
+
+# 记住的查询数、每个参数记住的取值数和每个调用记住的后继调用数
+MAX_QUERIES = 256
+MAX_VALUES_PER_PARAM = 64
+MAX_SUCCESSORS = 8
+
+ToolCall = Tuple[str, Dict[str, Any]]
+
+
+def call_key(name: str, arguments: Dict[str, Any]) -> str:
+    """工具调用的规范化键，参数顺序不同的相同调用得到相同的键"""
+    return f"{name}:{canonical_dumps(arguments)}"
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class Speculator:
+    """纯工具的推测执行
+
+    在 LLM 请求进行中提前执行模型可能请求的无副作用工具（服务器标注了 readOnlyHint
+    和 idempotentHint 的工具），模型真的请求相同调用时直接使用提前得到的结果。
+
+    预测来源：
+    1. 相同查询上次第一跳调用过的工具
+    2. 参数提取：该工具某参数以前出现过的取值出现在本次查询中（如城市名）
+    3. 链式模式：上次某个调用之后下一跳调用过的工具
+    """
+
+    def __init__(self, execute: Callable[[str, Dict[str, Any]], Awaitable[Any]],
+                 is_pure: Callable[[str], bool], required_params: Callable[[str], List[str]],
+                 max_calls: int = 4, ttl: float = 30.0):
+        """
+        Args:
+            execute: 实际执行工具调用的函数，参数为 (工具名, 参数)
+            is_pure: 判断工具是否可以推测执行
+            required_params: 返回工具的必填参数名
+            max_calls: 每次最多推测执行的调用数
+            ttl: 推测结果的有效期（秒），过期未被使用则丢弃
+        """
+        self.execute = execute
+        self.is_pure = is_pure
+        self.required_params = required_params
+        self.max_calls = max_calls
+        self.ttl = ttl
+        self._query_calls: "OrderedDict[str, List[ToolCall]]" = OrderedDict()
+        self._param_values: Dict[Tuple[str, str], "OrderedDict[str, None]"] = {}
+        self._successors: Dict[str, "OrderedDict[str, ToolCall]"] = {}
+        self._pending: Dict[str, Tuple[asyncio.Task, float]] = {}
+        self.stats = {"launched": 0, "hits": 0, "wasted": 0}
+
+    def observe(self, query: str, hops: List[List[ToolCall]]):
+        """记录一次查询的链式调用过程，用于之后的预测"""
+        if not hops:
+            return
+        normalized = normalize_query(query)
+        self._query_calls[normalized] = list(hops[0])
+        self._query_calls.move_to_end(normalized)
+        while len(self._query_calls) > MAX_QUERIES:
+            self._query_calls.popitem(last=False)
+
+        for calls in hops:
+            for name, arguments in calls:
+                for param, value in arguments.items():
+                    if isinstance(value, str) and value:
+                        values = self._param_values.setdefault((name, param), OrderedDict())
+                        values[value] = None
+                        values.move_to_end(value)
+                        while len(values) > MAX_VALUES_PER_PARAM:
+                            values.popitem(last=False)
+
+        for previous, following in zip(hops, hops[1:]):
+            for name, arguments in previous:
+                successors = self._successors.setdefault(call_key(name, arguments), OrderedDict())
+                for call in following:
+                    successors[call_key(*call)] = call
+                    successors.move_to_end(call_key(*call))
+                while len(successors) > MAX_SUCCESSORS:
+                    successors.popitem(last=False)
+
+    def predict_from_query(self, query: str, tool_names: List[str]) -> List[ToolCall]:
+        """预测第一跳的调用"""
+        predicted = list(self._query_calls.get(normalize_query(query), []))
+        for name in tool_names:
+            required = self.required_params(name)
+            if not required or not self.is_pure(name):
+                continue
+            arguments = {}
+            for param in required:
+                # 取查询中出现的最长的已知取值
+                matches = [value for value in self._param_values.get((name, param), ()) if value in query]
+                if not matches:
+                    break
+                arguments[param] = max(matches, key=len)
+            else:
+                predicted.append((name, arguments))
+        return predicted
+
+    def predict_next(self, calls: List[ToolCall]) -> List[ToolCall]:
+        """按链式模式预测下一跳的调用"""
+        predicted = []
+        for name, arguments in calls:
+            predicted.extend(self._successors.get(call_key(name, arguments), {}).values())
+        return predicted
+
+    def speculate(self, calls: List[ToolCall]):
+        """后台执行预测的纯工具调用，已在执行的调用不重复启动"""
+        self._expire()
+        launched = 0
+        seen: Set[str] = set()
+        for name, arguments in calls:
+            key = call_key(name, arguments)
+            if launched >= self.max_calls:
+                break
+            if key in seen or key in self._pending or not self.is_pure(name):
+                continue
+            seen.add(key)
+            task = asyncio.ensure_future(self.execute(name, arguments))
+            # 没有被使用的失败结果不应产生 "exception was never retrieved" 警告
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._pending[key] = (task, time.monotonic() + self.ttl)
+            self.stats["launched"] += 1
+            launched += 1
+
+    async def take(self, name: str, arguments: Dict[str, Any]) -> Optional[Any]:
+        """取出推测执行的结果；没有对应的推测或推测执行失败时返回 None"""
+        entry = self._pending.pop(call_key(name, arguments), None)
+        if entry is None:
+            return None
+        task, expires = entry
+        if task.cancelled() or (expires < time.monotonic() and task.done()):
+            self.stats["wasted"] += 1
+            return None
+        try:
+            # shield: 调用方被取消时推测任务继续执行，但结果不再使用
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.stats["wasted"] += 1
+            return None
+        self.stats["hits"] += 1
+        return result
+
+    def _expire(self):
+        now = time.monotonic()
+        for key, (task, expires) in list(self._pending.items()):
+            if expires < now and task.done():
+                del self._pending[key]
+                self.stats["wasted"] += 1
+
+    def cancel_all(self):
+        """取消尚未使用的推测调用"""
+        for task, _ in self._pending.values():
+            task.cancel()
+        self.stats["wasted"] += len(self._pending)
+        self._pending.clear()
+
+    def summary(self) -> str:
+        return (f"推测执行 {self.stats['launched']} 次，命中 {self.stats['hits']} 次，"
+                f"未使用 {self.stats['wasted']} 次")
@@ -0,0 +1,296 @@
+import ast
+import math
+import time
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # NumPy 是可选依赖，缺失时逐行计算
+    np = None
+
+# 表达式最大长度和语法树最大节点数
+MAX_EXPRESSION_LENGTH = 10000
+MAX_NODES = 2000
+# 整数结果（包括中间结果）的最大位数，防止 9**9**9 之类的表达式耗尽内存和 CPU
+MAX_INT_BITS = 10000
+# 编译缓存的表达式数量
+COMPILE_CACHE_SIZE = 256
+
+# 允许的函数
+FUNCTIONS = {
+    "abs": abs, "round": round, "min": min, "max": max,
+    "sqrt": math.sqrt, "exp": math.exp, "log": math.log, "log10": math.log10, "log2": math.log2,
+    "sin": math.sin, "cos": math.cos, "tan": math.tan,
+    "asin": math.asin, "acos": math.acos, "atan": math.atan, "atan2": math.atan2,
+    "sinh": math.sinh, "cosh": math.cosh, "tanh": math.tanh,
+    "floor": math.floor, "ceil": math.ceil, "fabs": math.fabs, "hypot": math.hypot,
+    "degrees": math.degrees, "radians": math.radians, "gcd": math.gcd,
+}
+# 允许的常量
+CONSTANTS = {"pi": math.pi, "e": math.e, "tau": math.tau, "inf": math.inf}
+
+# 允许出现的语法节点
+ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp, ast.Call,
+    ast.Name, ast.Load, ast.Constant,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.LShift, ast.RShift,
+    ast.BitAnd, ast.BitOr, ast.BitXor, ast.USub, ast.UAdd, ast.Not, ast.Invert, ast.And, ast.Or,
+    ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+)
+# 可能产生超大整数的运算，替换为带检查的函数
+GUARDED_OPS = {ast.Pow: "_pow", ast.Mult: "_mul", ast.LShift: "_lshift"}
+
+
+class ExpressionError(Exception):
+    """表达式不合法、超出限制或计算失败"""
+
+
+def _check_int(value: Any) -> Any:
+    if isinstance(value, int) and value.bit_length() > MAX_INT_BITS:
+        raise ExpressionError(f"结果超出 {MAX_INT_BITS} 位整数的限制")
+    return value
+
+
+def _check_result(value: Any) -> Any:
+    # inf/nan 不是合法的 JSON 数值，作为计算失败处理
+    if isinstance(value, float) and not math.isfinite(value):
+        raise ExpressionError("数值溢出或结果不是有限数值")
+    return _check_int(value)
+
+
+def _pow(base: Any, exponent: Any) -> Any:
+    if isinstance(base, int) and isinstance(exponent, int) and exponent > 0 and abs(base) > 1:
+        if exponent * math.log2(abs(base)) > MAX_INT_BITS:
+            raise ExpressionError(f"结果超出 {MAX_INT_BITS} 位整数的限制")
+    result = base ** exponent
+    if isinstance(result, complex):
+        raise ExpressionError("结果为复数")
+    return result
+
+
+def _mul(left: Any, right: Any) -> Any:
+    if isinstance(left, int) and isinstance(right, int) and \
+            left.bit_length() + right.bit_length() > MAX_INT_BITS + 1:
+        raise ExpressionError(f"结果超出 {MAX_INT_BITS} 位整数的限制")
+    return left * right
+
+
+def _lshift(left: Any, right: Any) -> Any:
+    if isinstance(right, int) and right > MAX_INT_BITS:
+        raise ExpressionError(f"结果超出 {MAX_INT_BITS} 位整数的限制")
+    return left << right
+
+
+GUARDS = {"_pow": _pow, "_mul": _mul, "_lshift": _lshift}
+
+
+class _GuardTransformer(ast.NodeTransformer):
+    """把 **、*、<< 改写为带大小检查的函数调用"""
+
+    def visit_BinOp(self, node: ast.BinOp) -> ast.AST:
+        self.generic_visit(node)
+        guard = GUARDED_OPS.get(type(node.op))
+        if guard is None:
+            return node
+        return ast.copy_location(
+            ast.Call(func=ast.Name(id=guard, ctx=ast.Load()), args=[node.left, node.right], keywords=[]),
+            node,
+        )
+
+
+class CompiledExpression:
+    """校验并编译后的表达式"""
+
+    def __init__(self, source: str, code: Any, names: FrozenSet[str], calls: FrozenSet[str]):
+        self.source = source
+        self.code = code
+        # 表达式中引用的变量名（不含函数和常量）
+        self.names = names
+        self.calls = calls
+
+    def evaluate(self, variables: Optional[Dict[str, Any]] = None) -> Any:
+        """用一组变量取值计算表达式"""
+        namespace = dict(FUNCTIONS, **CONSTANTS, **GUARDS)
+        return self._run(namespace, variables or {})
+
+    def _run(self, namespace: Dict[str, Any], variables: Dict[str, Any]) -> Any:
+        missing = self.names - variables.keys()
+        if missing:
+            raise ExpressionError(f"缺少变量: {', '.join(sorted(missing))}")
+        for name, value in variables.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ExpressionError(f"变量 {name} 必须是数字")
+            _check_int(value)
+        namespace["__builtins__"] = {}
+        try:
+            return _check_result(eval(self.code, namespace, variables))
+        except ExpressionError:
+            raise
+        except OverflowError as e:
+            raise ExpressionError("数值溢出") from e
+        except (ArithmeticError, ValueError, TypeError) as e:
+            raise ExpressionError(str(e)) from e
+
+
+def _validate(tree: ast.Expression) -> None:
+    count = 0
+    for node in ast.walk(tree):
+        count += 1
+        if count > MAX_NODES:
+            raise ExpressionError(f"表达式过于复杂（超过 {MAX_NODES} 个节点）")
+        if not isinstance(node, ALLOWED_NODES):
+            raise ExpressionError(f"不支持的语法: {type(node).__name__}")
+        if isinstance(node, ast.Constant) and \
+                (isinstance(node.value, bool) or not isinstance(node.value, (int, float))):
+            raise ExpressionError(f"不支持的常量: {node.value!r}")
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+                raise ExpressionError(f"不支持的函数: {ast.unparse(node.func)}")
+            if node.keywords:
+                raise ExpressionError("函数调用不支持关键字参数")
+        if isinstance(node, ast.Name) and node.id.startswith("_"):
+            raise ExpressionError(f"不支持的名称: {node.id}")
+
+
+@lru_cache(maxsize=COMPILE_CACHE_SIZE)
+def compile_expression(expression: str) -> CompiledExpression:
+    """解析、校验并编译表达式，结果按表达式文本缓存
+
+    Raises:
+        ExpressionError: 表达式不合法或超出限制
+    """
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ExpressionError(f"表达式过长（超过 {MAX_EXPRESSION_LENGTH} 个字符）")
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except (SyntaxError, RecursionError, MemoryError) as e:
+        raise ExpressionError(f"表达式语法错误: {e}") from e
+    _validate(tree)
+
+    calls = frozenset(node.func.id for node in ast.walk(tree) if isinstance(node, ast.Call))
+    names = frozenset(
+        node.id for node in ast.walk(tree)
+        if isinstance(node, ast.Name) and node.id not in FUNCTIONS and node.id not in CONSTANTS
+    )
+    try:
+        tree = ast.fix_missing_locations(_GuardTransformer().visit(tree))
+        code = compile(tree, "<expression>", "eval")
+    except RecursionError as e:
+        raise ExpressionError("表达式嵌套过深") from e
+    return CompiledExpression(expression, code, names, calls)
+
+
+def evaluate(expression: str, variables: Optional[Dict[str, Any]] = None) -> Any:
+    """计算表达式
+
+    Args:
+        expression: 数学表达式，如 '2 + 2 * 3' 或 'sqrt(x**2 + y**2)'
+        variables: 变量取值
+
+    Raises:
+        ExpressionError: 表达式不合法、超出限制或计算失败
+    """
+    return compile_expression(expression).evaluate(variables)
+
+
+if np is not None:
+    # NumPy 向量化计算使用的函数，表达式中出现其他函数时逐行计算
+    # （floor/ceil 在 math 中返回整数、在 NumPy 中返回浮点数，不向量化）
+    NUMPY_FUNCTIONS = {
+        "abs": np.abs, "sqrt": np.sqrt, "exp": np.exp, "log": np.log, "log10": np.log10, "log2": np.log2,
+        "sin": np.sin, "cos": np.cos, "tan": np.tan,
+        "asin": np.arcsin, "acos": np.arccos, "atan": np.arctan, "atan2": np.arctan2,
+        "sinh": np.sinh, "cosh": np.cosh, "tanh": np.tanh,
+        "fabs": np.fabs, "hypot": np.hypot, "degrees": np.degrees, "radians": np.radians,
+    }
+    # 整数数组上的运算可能静默溢出，由 _evaluate_numpy 用浮点副本校验
+    NUMPY_GUARDS = {"_pow": np.power, "_mul": np.multiply, "_lshift": np.left_shift}
+else:
+    NUMPY_FUNCTIONS = {}
+    NUMPY_GUARDS = {}
+
+
+def _column(values: List[Any]) -> Optional[Any]:
+    # 整列都是 float 或都是精确可表示为浮点数的 int 时才向量化，保证结果类型与逐行计算一致
+    if all(type(value) is float for value in values):
+        return np.array(values, dtype=np.float64)
+    if all(type(value) is int and -2 ** 53 < value < 2 ** 53 for value in values):
+        return np.array(values, dtype=np.int64)
+    return None
+
+
+def _eval_columns(compiled: CompiledExpression, columns: Dict[str, Any], size: int) -> Optional[Any]:
+    namespace = dict(NUMPY_FUNCTIONS, **CONSTANTS, **NUMPY_GUARDS)
+    namespace["__builtins__"] = {}
+    try:
+        # 除零、溢出和无效运算抛出 FloatingPointError，而不是静默得到 inf/nan
+        with np.errstate(all="raise"):
+            result = eval(compiled.code, namespace, columns)
+    except Exception:
+        return None
+    return np.broadcast_to(np.asarray(result), (size,))
+
+
+def _evaluate_numpy(compiled: CompiledExpression, bindings: List[Dict[str, Any]]) -> Optional[List[Any]]:
+    """用 NumPy 对整列变量一次性计算
+
+    结果与逐行计算不能保证完全一致时返回 None，由逐行计算给出结果或抛出同样的 ExpressionError：
+    and/or/if 等无法作用于数组的表达式、混合 int/float 的列、除零或溢出等计算错误、非有限结果，
+    以及整数运算的结果与浮点副本不一致（int64 溢出）。
+    """
+    if np is None or not compiled.names or not compiled.calls <= NUMPY_FUNCTIONS.keys():
+        return None
+    # 逐行计算会校验所有变量，多余的变量交给逐行计算处理
+    if any(binding.keys() != compiled.names for binding in bindings):
+        return None
+    columns = {}
+    for name in compiled.names:
+        column = _column([binding[name] for binding in bindings])
+        if column is None:
+            return None
+        columns[name] = column
+
+    result = _eval_columns(compiled, columns, len(bindings))
+    if result is None or result.dtype.kind not in "bif":
+        return None
+    if result.dtype.kind == "f" and not np.isfinite(result).all():
+        return None
+    if any(column.dtype.kind == "i" for column in columns.values()):
+        shadow = _eval_columns(compiled, {name: column.astype(np.float64) for name, column in columns.items()},
+                               len(bindings))
+        if shadow is None or not np.array_equal(result, shadow):
+            return None
+    return result.tolist()
+
+
+def evaluate_many(expression: str, bindings: List[Dict[str, Any]], timeout: float = 1.0) -> List[Any]:
+    """对多组变量取值计算同一个表达式
+
+    安装了 NumPy 且表达式可以向量化时一次性按列计算，否则逐行计算。
+    逐行计算超过 timeout 秒时中止。
+
+    Args:
+        expression: 数学表达式
+        bindings: 变量取值列表
+        timeout: 逐行计算的时间上限（秒）
+
+    Raises:
+        ExpressionError: 表达式不合法、超出限制、计算失败或超时
+    """
+    compiled = compile_expression(expression)
+    if not bindings:
+        return []
+
+    results = _evaluate_numpy(compiled, bindings)
+    if results is not None:
+        return results
+
+    deadline = time.monotonic() + timeout
+    namespace = dict(FUNCTIONS, **CONSTANTS, **GUARDS)
+    results = []
+    for index, variables in enumerate(bindings):
+        if time.monotonic() > deadline:
+            raise ExpressionError(f"计算超时（{timeout} 秒内完成 {index}/{len(bindings)} 组）")
+        results.append(compiled._run(namespace, variables))
+    return results
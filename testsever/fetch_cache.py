@@ -0,0 +1,183 @@
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import httpx
+
+from fetch_stream import build_headers, page_result, stream_text, validate_window
+
+
+class CacheEntry:
+    """一个 URL 缓存的整页提取文本及其 HTTP 校验信息"""
+
+    __slots__ = ("text", "truncated", "max_bytes", "etag", "last_modified", "expires", "size")
+
+    def __init__(self, text: str, truncated: bool, max_bytes: int, etag: Optional[str],
+                 last_modified: Optional[str], expires: float):
+        self.text = text
+        # 整页文本是否因 max_bytes 截断，以及截断时使用的 max_bytes
+        self.truncated = truncated
+        self.max_bytes = max_bytes
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires = expires
+        self.size = len(text.encode("utf-8"))
+
+
+def freshness_lifetime(headers: httpx.Headers) -> Optional[float]:
+    """按 Cache-Control / Expires 计算响应的新鲜期（秒）
+
+    Returns:
+        新鲜期秒数；响应不允许缓存（no-store）时返回 None
+    """
+    directives = {}
+    for part in headers.get("Cache-Control", "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"')
+
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0.0
+    if "max-age" in directives:
+        try:
+            return max(0.0, float(directives["max-age"]) - float(headers.get("Age", 0)))
+        except ValueError:
+            return 0.0
+    if headers.get("Expires"):
+        try:
+            return max(0.0, parsedate_to_datetime(headers["Expires"]).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return 0.0
+    return 0.0
+
+
+class FetchCache:
+    """遵循 HTTP 缓存语义的 fetch 结果缓存
+
+    每个 URL（及 byte_range）只缓存一条整页提取文本及 ETag/Last-Modified，各页按 start_index/max_length
+    从中切出。新鲜期（Cache-Control max-age 或 Expires）内直接返回缓存；过期后带
+    If-None-Match/If-Modified-Since 重新验证，304 时沿用缓存。同一 URL 的并发请求合并为一次下载。
+    按文本的 UTF-8 字节数做 LRU 淘汰。
+
+    可缓存的响应会读取全部正文（不超过 max_bytes）；不可缓存的响应只读取到请求的页为止。
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024):
+        """
+        Args:
+            max_bytes: 缓存最多占用的字节数（按文本的 UTF-8 编码长度计）
+        """
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[Tuple, asyncio.Task] = {}
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+
+    async def fetch(self, client: httpx.AsyncClient, url: str, headers: Dict[str, str], start_index: int = 0,
+                    max_length: int = 20000, max_bytes: int = 5 * 1024 * 1024, byte_range: Optional[str] = None,
+                    slot: Optional[Callable[[str], Any]] = None) -> Dict[str, Any]:
+        """获取网页文本，优先使用缓存
+
+        参数与 fetch_stream.fetch_text 相同；slot 为可选的按主机限流上下文工厂，
+        只在真正发出请求时占用。
+        """
+        validate_window(start_index, max_length)
+        key = (url, byte_range)
+        window = (start_index, max_length)
+        entry = self._usable(key, max_bytes)
+        if entry is not None and entry.expires > time.monotonic():
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return page_result(entry.text, url, start_index, max_length, entry.truncated)
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(self._load(key, client, url, headers, window, max_bytes, slot))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: 一个等待者被取消时不影响其他合并进来的请求
+        loaded = await asyncio.shield(task)
+        if "page" in loaded and loaded["window"] not in (None, window):
+            # 响应不可缓存，合并进来的请求要的是另一页，单独下载
+            loaded = await self._load(key, client, url, headers, window, max_bytes, slot)
+        if "page" in loaded:
+            return dict(loaded["page"])
+        return page_result(loaded["text"], url, start_index, max_length, loaded["truncated"])
+
+    def _usable(self, key: Tuple, max_bytes: int) -> Optional[CacheEntry]:
+        # 以更小的 max_bytes 截断的文本不能满足更大的下载上限
+        entry = self._entries.get(key)
+        if entry is not None and entry.truncated and entry.max_bytes < max_bytes:
+            return None
+        return entry
+
+    async def _load(self, key, client, url, headers, window, max_bytes, slot) -> Dict[str, Any]:
+        """下载或重新验证整页文本
+
+        Returns:
+            {"text", "truncated"}：可缓存的整页文本；
+            {"page", "window"}：不可缓存时按 window 读取的一页（请求失败时 window 为 None，错误适用于所有等待者）
+        """
+        entry = self._usable(key, max_bytes)
+        request_headers = dict(build_headers(headers, key[1]))
+        if entry is not None:
+            if entry.etag:
+                request_headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                request_headers["If-Modified-Since"] = entry.last_modified
+
+        async with (slot(url) if slot else nullcontext()):
+            async with client.stream("GET", url, headers=request_headers) as response:
+                if response.status_code == 304 and entry is not None:
+                    self.stats["revalidated"] += 1
+                    lifetime = freshness_lifetime(response.headers)
+                    entry.expires = time.monotonic() + (lifetime or 0.0)
+                    entry.etag = response.headers.get("ETag", entry.etag)
+                    entry.last_modified = response.headers.get("Last-Modified", entry.last_modified)
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                    return {"text": entry.text, "truncated": entry.truncated}
+
+                self.stats["misses"] += 1
+                if response.status_code not in (200, 206):
+                    return {"page": {"error": f"获取失败，状态码: {response.status_code}", "url": url,
+                                     "status_code": response.status_code}, "window": None}
+                lifetime = freshness_lifetime(response.headers)
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+                # no-store，或既没有新鲜期也没有校验信息的响应无法复用，只读取请求的页
+                if lifetime is None or (not lifetime and not etag and not last_modified):
+                    self._remove(key)
+                    start_index, max_length = window
+                    return {"page": await stream_text(response, url, start_index, max_length, max_bytes),
+                            "window": window}
+                document = await stream_text(response, url, 0, None, max_bytes)
+                self._store(key, CacheEntry(document["content"], document["truncated"], max_bytes,
+                                            etag, last_modified, time.monotonic() + lifetime))
+                return {"text": document["content"], "truncated": document["truncated"]}
+
+    def _store(self, key: Tuple, entry: CacheEntry):
+        self._remove(key)
+        if entry.size > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.stats["evictions"] += 1
+
+    def _remove(self, key: Tuple):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def get_stats(self) -> Dict[str, Any]:
+        """返回命中/重新验证/未命中计数和占用"""
+        return dict(self.stats, entries=len(self._entries), bytes=self._bytes)
@@ -0,0 +1,222 @@
+import codecs
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+# 内容不会显示为正文的标签，其中的文本全部丢弃
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "iframe"}
+
+
+class HTMLTextExtractor(HTMLParser):
+    """增量的 HTML 转纯文本解析器
+
+    可以分块喂入已解码的文本，每次 feed 返回新产生的正文。标签替换为空格，
+    连续空白折叠为一个空格，实体由 HTMLParser 解码。
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._parts: List[str] = []
+        self._skip_depth = 0
+        self._space = False
+        self._started = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        self._space = True
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        self._space = True
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        words = data.split()
+        if not words:
+            self._space = True
+            return
+        if self._started and (self._space or data[0].isspace()):
+            self._parts.append(" ")
+        self._parts.append(" ".join(words))
+        self._started = True
+        self._space = data[-1].isspace()
+
+    def feed(self, data: str) -> str:
+        super().feed(data)
+        return self._take()
+
+    def close(self) -> str:
+        super().close()
+        return self._take()
+
+    def _take(self) -> str:
+        text = "".join(self._parts)
+        self._parts = []
+        return text
+
+
+def looks_like_html(content_type: str, head: str) -> bool:
+    """按 Content-Type 或正文开头判断是否为 HTML"""
+    if "html" in content_type.lower():
+        return True
+    head = head.lstrip()[:20].lower()
+    return head.startswith("<!doctype html") or head.startswith("<html")
+
+
+def validate_window(start_index: int, max_length: int):
+    """检查分页参数，max_length 小于 1 时 next_start_index 不会前进，翻页会陷入死循环"""
+    if start_index < 0:
+        raise ValueError(f"start_index 不能为负数: {start_index}")
+    if max_length < 1:
+        raise ValueError(f"max_length 必须大于 0: {max_length}")
+
+
+def build_headers(headers: Dict[str, str], byte_range: Optional[str] = None) -> Dict[str, str]:
+    """在请求头中加入可选的 Range"""
+    if byte_range:
+        return dict(headers, Range=f"bytes={byte_range}")
+    return headers
+
+
+async def fetch_text(client: httpx.AsyncClient, url: str, headers: Dict[str, str], start_index: int = 0,
+                     max_length: int = 20000, max_bytes: int = 5 * 1024 * 1024,
+                     byte_range: Optional[str] = None) -> Dict[str, Any]:
+    """流式获取网页并提取文本
+
+    每次调用都从第 0 个字节开始下载和解析，直到收集到所需范围的字符，因此翻到靠后的页时
+    下载量与 start_index + max_length 成正比（上限为 max_bytes）。需要逐页读取长页面时
+    应开启 fetch 缓存（fetch_cache.FetchCache），可缓存的响应只下载一次，之后的页从缓存切出。
+
+    Args:
+        client: 发送请求使用的 HTTP 客户端
+        url: 网页 URL
+        headers: 请求头
+        start_index: 返回内容在提取文本中的起始字符位置
+        max_length: 最多返回的字符数
+        max_bytes: 最多下载的字节数
+        byte_range: 可选的字节范围，如 "0-65535"，作为 Range 请求头发送
+
+    Returns:
+        stream_text 的结果；请求失败时返回 error
+
+    Raises:
+        ValueError: start_index 为负数或 max_length 小于 1
+    """
+    validate_window(start_index, max_length)
+    async with client.stream("GET", url, headers=build_headers(headers, byte_range)) as response:
+        if response.status_code not in (200, 206):
+            return {"error": f"获取失败，状态码: {response.status_code}", "url": url,
+                    "status_code": response.status_code}
+        return await stream_text(response, url, start_index, max_length, max_bytes)
+
+
+async def stream_text(response: httpx.Response, url: str, start_index: int = 0,
+                      max_length: Optional[int] = 20000, max_bytes: int = 5 * 1024 * 1024) -> Dict[str, Any]:
+    """从流式响应中提取文本，只保留 [start_index, start_index + max_length) 范围内的字符
+
+    响应体按块读取、增量解码和解析，收集到所需字符后立即停止下载，
+    下载量超过 max_bytes 时截断。max_length 为 None 时读取全部正文（用于缓存整页文本）。
+
+    Args:
+        response: 以 stream 方式打开、尚未读取的响应
+        url: 网页 URL
+        start_index: 返回内容在提取文本中的起始字符位置
+        max_length: 最多返回的字符数，None 表示不限
+        max_bytes: 最多下载的字节数
+
+    Returns:
+        包含 content、start_index、next_start_index（没有更多内容时为 None）
+        和 truncated（是否因 max_bytes 截断）的字典
+
+    Raises:
+        ValueError: start_index 为负数或 max_length 小于 1
+    """
+    if max_length is None:
+        validate_window(start_index, 1)
+        end_index = None
+    else:
+        validate_window(start_index, max_length)
+        end_index = start_index + max_length
+    decoder = codecs.getincrementaldecoder(response.charset_encoding or "utf-8")(errors="replace")
+    content_type = response.headers.get("Content-Type", "")
+    extractor: Optional[HTMLTextExtractor] = None
+    is_html: Optional[bool] = None
+
+    kept: List[str] = []
+    position = 0  # 已产生的文本字符数
+    received = 0
+    truncated = False
+    more = False
+
+    def collect(text: str):
+        nonlocal position
+        # 只保留请求范围内的字符，多保留一个用于判断后面是否还有内容
+        lo = max(start_index - position, 0)
+        hi = len(text) if end_index is None else max(end_index + 1 - position, 0)
+        if lo < len(text) and hi > lo:
+            kept.append(text[lo:hi])
+        position += len(text)
+
+    async for chunk in response.aiter_bytes():
+        if received + len(chunk) > max_bytes:
+            chunk = chunk[:max_bytes - received]
+            truncated = True
+        received += len(chunk)
+
+        text = decoder.decode(chunk)
+        if is_html is None:
+            if not text.strip():
+                continue
+            is_html = looks_like_html(content_type, text)
+            extractor = HTMLTextExtractor() if is_html else None
+        collect(extractor.feed(text) if extractor else text)
+
+        if end_index is not None and position > end_index:
+            more = True
+            break
+        if truncated:
+            break
+
+    if not more:
+        # 读完或因 max_bytes 截断：冲刷解码器和解析器中缓存的末尾文本，再截取范围
+        tail = decoder.decode(b"", final=True)
+        if extractor:
+            tail = extractor.feed(tail) + extractor.close()
+        collect(tail)
+
+    content = "".join(kept)
+    if max_length is not None and len(content) > max_length:
+        content = content[:max_length]
+        more = True
+    return {
+        "content": content,
+        "url": url,
+        "start_index": start_index,
+        "next_start_index": start_index + len(content) if more else None,
+        "truncated": truncated and not more,
+    }
+
+
+def page_result(text: str, url: str, start_index: int, max_length: int, truncated: bool) -> Dict[str, Any]:
+    """从已提取的整页文本中切出一页，结果格式与 stream_text 相同
+
+    Args:
+        text: 整页文本
+        url: 网页 URL
+        start_index: 返回内容的起始字符位置
+        max_length: 最多返回的字符数
+        truncated: 整页文本是否因 max_bytes 截断（只在这一页到达文本末尾时报告）
+    """
+    content = text[start_index:start_index + max_length]
+    more = len(text) > start_index + max_length
+    return {
+        "content": content,
+        "url": url,
+        "start_index": start_index,
+        "next_start_index": start_index + len(content) if more else None,
+        "truncated": truncated and not more,
+    }
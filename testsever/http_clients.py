@@ -0,0 +1,273 @@
+import asyncio
+import ipaddress
+import socket
+import sys
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import httpcore
+import httpx
+
+
+class CachingDNSBackend(httpcore.AsyncNetworkBackend):
+    """带 TTL 的 DNS 缓存网络后端
+
+    在建立 TCP 连接前用缓存的地址替换主机名，TLS 握手仍使用原主机名做 SNI 和证书校验。
+    缓存解析出的全部地址，按顺序尝试连接，某个地址连接失败时尝试下一个；
+    全部失败时丢弃缓存，下次重新解析。
+    """
+
+    def __init__(self, ttl: float = 300.0, backend: Optional[httpcore.AsyncNetworkBackend] = None):
+        self.ttl = ttl
+        self._backend = backend or httpcore.AnyIOBackend()
+        self._cache: Dict[Tuple[str, int], Tuple[float, List[str]]] = {}
+
+    async def resolve(self, host: str, port: int) -> List[str]:
+        """把主机名解析为 IP 地址列表（按 getaddrinfo 的顺序去重），IP 字面量直接返回"""
+        try:
+            ipaddress.ip_address(host)
+            return [host]
+        except ValueError:
+            pass
+
+        now = time.monotonic()
+        entry = self._cache.get((host, port))
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        self._cache[(host, port)] = (now + self.ttl, addresses)
+        return addresses
+
+    async def connect_tcp(self, host: str, port: int, timeout: Optional[float] = None,
+                          local_address: Optional[str] = None, socket_options=None):
+        addresses = await self.resolve(host, port)
+        error: Optional[Exception] = None
+        for address in addresses:
+            try:
+                stream = await self._backend.connect_tcp(address, port, timeout=timeout,
+                                                         local_address=local_address,
+                                                         socket_options=socket_options)
+            except Exception as e:
+                error = e
+                continue
+            if address != addresses[0]:
+                # 后续连接优先使用可用的地址
+                entry = self._cache.get((host, port))
+                if entry is not None:
+                    self._cache[(host, port)] = (entry[0], [address] + [a for a in entry[1] if a != address])
+            return stream
+        self._cache.pop((host, port), None)
+        raise error
+
+    async def connect_unix_socket(self, path: str, timeout: Optional[float] = None, socket_options=None):
+        return await self._backend.connect_unix_socket(path, timeout=timeout, socket_options=socket_options)
+
+    async def sleep(self, seconds: float):
+        await self._backend.sleep(seconds)
+
+
+# httpcore 异常对应的 httpx 异常（与 httpx 默认传输相同），按从具体到一般的顺序匹配
+HTTPCORE_ERRORS = (
+    (httpcore.ConnectTimeout, httpx.ConnectTimeout),
+    (httpcore.ReadTimeout, httpx.ReadTimeout),
+    (httpcore.WriteTimeout, httpx.WriteTimeout),
+    (httpcore.PoolTimeout, httpx.PoolTimeout),
+    (httpcore.TimeoutException, httpx.TimeoutException),
+    (httpcore.ConnectError, httpx.ConnectError),
+    (httpcore.ReadError, httpx.ReadError),
+    (httpcore.WriteError, httpx.WriteError),
+    (httpcore.NetworkError, httpx.NetworkError),
+    (httpcore.ProxyError, httpx.ProxyError),
+    (httpcore.UnsupportedProtocol, httpx.UnsupportedProtocol),
+    (httpcore.LocalProtocolError, httpx.LocalProtocolError),
+    (httpcore.RemoteProtocolError, httpx.RemoteProtocolError),
+    (httpcore.ProtocolError, httpx.ProtocolError),
+)
+
+
+@contextmanager
+def _map_httpcore_errors() -> Iterator[None]:
+    try:
+        yield
+    except Exception as e:
+        for source, target in HTTPCORE_ERRORS:
+            if isinstance(e, source):
+                raise target(str(e)) from e
+        raise
+
+
+class _ResponseStream(httpx.AsyncByteStream):
+    def __init__(self, stream: AsyncIterable[bytes]):
+        self._stream = stream
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        with _map_httpcore_errors():
+            async for part in self._stream:
+                yield part
+
+    async def aclose(self):
+        if hasattr(self._stream, "aclose"):
+            with _map_httpcore_errors():
+                await self._stream.aclose()
+
+
+class CachingDNSTransport(httpx.AsyncBaseTransport):
+    """使用 CachingDNSBackend 建立连接的 httpx 传输
+
+    httpx.AsyncHTTPTransport 不提供设置网络后端的参数，这里通过 httpcore 连接池公开的
+    network_backend 参数构建连接池，按 httpx 传输接口转换请求和响应，并把 httpcore 异常
+    映射为对应的 httpx 异常（重试和超时处理依赖这些异常类型）。
+    """
+
+    def __init__(self, backend: httpcore.AsyncNetworkBackend, limits: httpx.Limits, http2: bool = False):
+        self._pool = httpcore.AsyncConnectionPool(
+            ssl_context=httpx.create_ssl_context(),
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            http1=True,
+            http2=http2,
+            network_backend=backend,
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        core_request = httpcore.Request(
+            method=request.method,
+            url=httpcore.URL(
+                scheme=request.url.raw_scheme,
+                host=request.url.raw_host,
+                port=request.url.port,
+                target=request.url.raw_path,
+            ),
+            headers=request.headers.raw,
+            content=request.stream,
+            extensions=request.extensions,
+        )
+        with _map_httpcore_errors():
+            response = await self._pool.handle_async_request(core_request)
+        return httpx.Response(
+            status_code=response.status,
+            headers=response.headers,
+            stream=_ResponseStream(response.stream),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self._pool.aclose()
+
+
+class HTTPClientRegistry:
+    """服务器进程级的 HTTP 客户端注册表
+
+    维护两个相互独立的连接池：调用上游 LLM 的 llm 客户端，以及供 fetch 访问任意网站的
+    fetch 客户端（按主机限制并发连接数）。两者共享 DNS 缓存，在多次工具调用和多个会话之间
+    复用 keep-alive 连接。
+
+    注册表按引用计数管理生命周期：FastMCP 的 lifespan 在每个会话开始时调用 acquire，
+    结束时调用 release，最后一个引用释放时关闭连接池。stdio 模式下进程内只有一个会话；
+    SSE 模式下应用本身也持有一个引用，使连接池在会话之间保持存活。
+    """
+
+    def __init__(self, http_params: Dict[str, Any], fetch_params: Dict[str, Any]):
+        """
+        Args:
+            http_params: Config.get_http_params() 返回的上游连接池参数
+            fetch_params: Config.get_fetch_params() 返回的 fetch 连接池参数
+        """
+        self.http_params = http_params
+        self.fetch_params = fetch_params
+        self.dns = CachingDNSBackend(ttl=fetch_params["dns_cache_ttl"])
+        self._llm: Optional[httpx.AsyncClient] = None
+        self._fetch: Optional[httpx.AsyncClient] = None
+        # 主机 -> [信号量, 正在使用的请求数]，没有请求使用时删除，字典大小不超过进行中的 fetch 数
+        self._host_limits: Dict[str, List[Any]] = {}
+        self._refs = 0
+
+    @property
+    def llm(self) -> httpx.AsyncClient:
+        """上游 LLM API 的共享客户端，首次使用时创建"""
+        if self._llm is None:
+            params = self.http_params
+            http2 = params["http2"]
+            if http2:
+                try:
+                    import h2  # noqa: F401
+                except ImportError:
+                    print("警告: 未安装 h2，已禁用 HTTP/2（可通过 pip install httpx[http2] 启用）",
+                          file=sys.stderr)
+                    http2 = False
+            limits = httpx.Limits(
+                max_connections=params["max_connections"],
+                max_keepalive_connections=params["max_keepalive_connections"],
+                keepalive_expiry=params["keepalive_expiry"],
+            )
+            self._llm = httpx.AsyncClient(
+                timeout=httpx.Timeout(params["timeout"], connect=params["connect_timeout"]),
+                limits=limits,
+                transport=CachingDNSTransport(self.dns, limits, http2),
+            )
+        return self._llm
+
+    @property
+    def fetch(self) -> httpx.AsyncClient:
+        """fetch 工具的共享客户端，首次使用时创建"""
+        if self._fetch is None:
+            params = self.fetch_params
+            limits = httpx.Limits(
+                max_connections=params["max_connections"],
+                max_keepalive_connections=params["max_keepalive_connections"],
+                keepalive_expiry=params["keepalive_expiry"],
+            )
+            self._fetch = httpx.AsyncClient(
+                timeout=httpx.Timeout(params["timeout"]),
+                limits=limits,
+                transport=CachingDNSTransport(self.dns, limits),
+                follow_redirects=True,
+            )
+        return self._fetch
+
+    @asynccontextmanager
+    async def host_slot(self, url: str) -> AsyncIterator[None]:
+        """占用目标主机的一个连接名额，同一主机同时进行的 fetch 不超过 max_connections_per_host"""
+        host = httpx.URL(url).host
+        slot = self._host_limits.get(host)
+        if slot is None:
+            slot = self._host_limits[host] = [asyncio.Semaphore(self.fetch_params["max_connections_per_host"]), 0]
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            slot[1] -= 1
+            if not slot[1] and self._host_limits.get(host) is slot:
+                del self._host_limits[host]
+
+    def acquire(self):
+        self._refs += 1
+
+    async def release(self):
+        self._refs -= 1
+        if self._refs <= 0:
+            self._refs = 0
+            await self.aclose()
+
+    async def aclose(self):
+        """关闭所有连接池，之后再次使用时会重新创建"""
+        clients = [client for client in (self._llm, self._fetch) if client is not None]
+        self._llm = None
+        self._fetch = None
+        self._host_limits.clear()
+        for client in clients:
+            await client.aclose()
+
+    @asynccontextmanager
+    async def lifespan(self, *_) -> AsyncIterator["HTTPClientRegistry"]:
+        """用作 FastMCP 或 Starlette 的 lifespan，在其存续期间持有一个引用"""
+        self.acquire()
+        try:
+            yield self
+        finally:
+            await self.release()
@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+# 磁盘层每写入多少次清理一次过期条目
+DISK_PURGE_EVERY = 256
+# 按容量淘汰时每次取出的最旧条目数
+DISK_EVICT_CHUNK = 64
+
+
+class ResponseCache:
+    """按内容寻址的 LLM 工具结果缓存
+
+    键由工具名和完整请求数据（模型、提示模板、参数、采样参数）规范化后取 SHA-256。
+    内存层为按字节数淘汰的 LRU；配置了 disk_path 时另有 sqlite 磁盘层，重启后仍然有效。
+    磁盘层的读写在专用线程中执行，不阻塞事件循环；运行期间定期清理过期条目，
+    超出 disk_max_bytes 时按最近访问时间淘汰最旧的条目。
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, ttl: float = 3600.0,
+                 disk_path: Optional[str] = None, disk_max_bytes: int = 0):
+        """
+        Args:
+            max_bytes: 内存层最多占用的字节数（按结果 JSON 长度计）
+            ttl: 默认过期时间（秒），0 表示不过期
+            disk_path: sqlite 文件路径，为空时只使用内存层
+            disk_max_bytes: 磁盘层最多占用的字节数（按结果 JSON 的 UTF-8 长度计），0 表示不限制
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_max_bytes = disk_max_bytes
+        # 键 -> (过期时间, 结果, 大小)
+        self._memory: OrderedDict = OrderedDict()
+        self._memory_bytes = 0
+        self._db: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._disk_bytes = 0
+        self._disk_sets = 0
+        self.stats = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0,
+                      "disk_evictions": 0}
+
+        if disk_path:
+            directory = os.path.dirname(os.path.abspath(disk_path))
+            os.makedirs(directory, exist_ok=True)
+            # 所有 sqlite 操作都在这一个线程中串行执行
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-cache")
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL,"
+                " size INTEGER NOT NULL DEFAULT 0, accessed REAL NOT NULL DEFAULT 0)"
+            )
+            # 旧版本创建的表没有 size/accessed 列
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(llm_cache)")}
+            if "size" not in columns:
+                self._db.execute("ALTER TABLE llm_cache ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+                self._db.execute("UPDATE llm_cache SET size = length(CAST(value AS BLOB))")
+            if "accessed" not in columns:
+                self._db.execute("ALTER TABLE llm_cache ADD COLUMN accessed REAL NOT NULL DEFAULT 0")
+            self._db.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)")
+            self._evict_disk()
+
+    @staticmethod
+    def make_key(namespace: str, payload: Dict[str, Any]) -> str:
+        """由命名空间（工具名）和请求数据生成缓存键"""
+        canonical = json.dumps([namespace, payload], ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[Any]:
+        """查询缓存，未命中或已过期时返回 None"""
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires, value, _ = entry
+            if not expires or expires > now:
+                self._memory.move_to_end(key)
+                self.stats["hits"] += 1
+                self.stats["memory_hits"] += 1
+                return value
+            self._remove(key)
+
+        if self._db is not None:
+            row = await asyncio.get_running_loop().run_in_executor(self._executor, self._disk_get, key, now)
+            if row is not None:
+                encoded, expires = row
+                value = json.loads(encoded)
+                # 提升到内存层
+                self._store_memory(key, value, expires, len(encoded))
+                self.stats["hits"] += 1
+                self.stats["disk_hits"] += 1
+                return value
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """写入缓存
+
+        Args:
+            key: 缓存键
+            value: 可 JSON 序列化的结果
+            ttl: 过期时间（秒），默认使用构造时的 ttl
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.time() + ttl if ttl else 0.0
+        encoded = json.dumps(value, ensure_ascii=False)
+        self._store_memory(key, value, expires, len(encoded))
+        if self._db is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._disk_set, key, encoded, expires)
+
+    def _disk_get(self, key: str, now: float):
+        # 在磁盘线程中执行：返回未过期的 (value, expires)，并更新访问时间
+        row = self._db.execute("SELECT value, expires, size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        encoded, expires, size = row
+        if expires and expires <= now:
+            self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._db.commit()
+            self._disk_bytes -= size
+            return None
+        self._db.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+        self._db.commit()
+        return encoded, expires
+
+    def _disk_set(self, key: str, encoded: str, expires: float):
+        # 在磁盘线程中执行
+        size = len(encoded.encode("utf-8"))
+        row = self._db.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        self._db.execute("INSERT OR REPLACE INTO llm_cache (key, value, expires, size, accessed) VALUES (?, ?, ?, ?, ?)",
+                         (key, encoded, expires, size, time.time()))
+        self._disk_bytes += size - (row[0] if row else 0)
+        self._disk_sets += 1
+        if self._disk_sets >= DISK_PURGE_EVERY or (self.disk_max_bytes and self._disk_bytes > self.disk_max_bytes):
+            self._evict_disk()
+        else:
+            self._db.commit()
+
+    def _evict_disk(self):
+        """删除过期条目，超出 disk_max_bytes 时从最久未访问的条目开始删除"""
+        self._db.execute("DELETE FROM llm_cache WHERE expires > 0 AND expires < ?", (time.time(),))
+        self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        self._disk_sets = 0
+        while self.disk_max_bytes and self._disk_bytes > self.disk_max_bytes:
+            rows = self._db.execute("SELECT key, size FROM llm_cache ORDER BY accessed LIMIT ?",
+                                    (DISK_EVICT_CHUNK,)).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self._disk_bytes <= self.disk_max_bytes:
+                    break
+                self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._disk_bytes -= size
+                self.stats["disk_evictions"] += 1
+        self._db.commit()
+
+    def _store_memory(self, key: str, value: Any, expires: float, size: int):
+        if size > self.max_bytes:
+            return
+        self._remove(key)
+        self._memory[key] = (expires, value, size)
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_bytes:
+            oldest = next(iter(self._memory))
+            self._remove(oldest)
+            self.stats["evictions"] += 1
+
+    def _remove(self, key: str):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= entry[2]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """返回命中/未命中计数以及内存层和磁盘层的占用"""
+        return dict(self.stats, entries=len(self._memory), memory_bytes=self._memory_bytes,
+                    disk_bytes=self._disk_bytes)
+
+    def close(self):
+        if self._executor is not None:
+            # 等待已提交的磁盘操作完成后再关闭连接
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -1,44 +1,104 @@
-from typing import Dict, Any, Optional, List, Union
+import time
+# --profile-startup 报告的计时起点（解释器启动之后、导入依赖之前）
+STARTUP_BEGAN = time.perf_counter()
+from typing import Dict, Any, Optional, List
 import httpx
-import re
 import os
 import json
 import sys
 import asyncio
-import uvicorn
-import click
+from contextlib import asynccontextmanager
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from mcp.server.fastmcp import FastMCP
-from mcp.server.sse import SseServerTransport
-from starlette.applications import Starlette
-from starlette.routing import Mount, Route
-from config import Config  # 导入新的配置类
+from mcp.types import ToolAnnotations
+from config import get_config
+from llm_scheduler import estimate_tokens, get_scheduler
+from llm_cache import ResponseCache
+from http_clients import HTTPClientRegistry
+from fetch_stream import fetch_text
+from fetch_cache import FetchCache
+from expr_engine import ExpressionError, evaluate, evaluate_many
+from micro_batcher import MicroBatcher
+from tool_executor import PolicyFastMCP, ToolExecutor
+from tracing import get_tracer
 
 # 获取当前脚本所在目录
 current_dir = os.path.dirname(os.path.abspath(__file__))
 config_path = os.path.join(os.path.dirname(current_dir), "config.json")
-config = Config(config_path if os.path.exists(config_path) else None)
+config = get_config(config_path)
 
-# 初始化 FastMCP server
-mcp = FastMCP("combined-tools")
+# 工具调用和上游 LLM 请求的追踪与延迟直方图，HTTP 模式下经 /metrics 导出
+tracer = get_tracer(dict(config.get_tracing_params(), service_name="mcp-server"))
 
-# 计算器工具
-@mcp.tool()
-async def calculate(expression: str) -> Dict[str, Any]:
+# 进程级共享的 HTTP 连接池（上游 LLM 与 fetch 各一个），随会话的 lifespan 引用计数并在最后关闭
+http_clients = HTTPClientRegistry(config.get_http_params(), config.get_fetch_params())
+
+# CPU 密集的工具在线程池或工作进程中执行，不阻塞事件循环
+executor = ToolExecutor(**config.get_executor_params())
+
+# 初始化 FastMCP server，工具可以通过 @mcp.tool(execution=...) 指定执行策略，
+# 参数相同的并发调用共享一次执行（single-flight）
+mcp = PolicyFastMCP("combined-tools", lifespan=http_clients.lifespan, executor=executor, tracer=tracer,
+                    **config.get_coalescing_params())
+
+# 进程内共享的上游 LLM 调度器：RPM/TPM 限流、自适应并发、429/5xx 重试
+scheduler = get_scheduler(config.get_scheduler_params())
+
+# 确定性 LLM 工具（摘要、翻译、情感分析）的结果缓存，关闭时容量为 0，所有查询都不命中
+llm_cache = ResponseCache(**config.get_llm_cache_params()) if config.llm_cache_enabled \
+    else ResponseCache(max_bytes=0)
+
+# fetch 的 HTTP 缓存：按 Cache-Control 复用结果，过期后用 ETag/Last-Modified 重新验证
+fetch_cache = FetchCache(config.fetch_cache_max_bytes) if config.fetch_cache_enabled else None
+
+async def post_chat_completions(payload: Dict[str, Any]) -> httpx.Response:
+    """经共享调度器和连接池向上游发送 /chat/completions 请求
+
+    Args:
+        payload: 请求数据
+
+    Returns:
+        上游响应（重试用尽后为最后一个错误响应）
+    """
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {config.api_key}"
+    }
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    client = http_clients.llm
+    with tracer.span("llm.request", stream=False, request_bytes=len(body)) as span:
+        async with scheduler.request(
+            lambda: client.post(f"{config.api_base}/chat/completions", content=body, headers=headers),
+            estimate_tokens(body, payload.get("max_tokens", 0)),
+        ) as response:
+            span.set(status_code=response.status_code, response_bytes=len(response.content))
+            return response
+
+# 无副作用、结果只取决于参数的工具，客户端可以推测执行
+PURE_TOOL = ToolAnnotations(readOnlyHint=True, idempotentHint=True, openWorldHint=False)
+
+# 计算器工具，在工作进程中执行，超时会终止进程
+@mcp.tool(execution="process", timeout=config.calculate_timeout, annotations=PURE_TOOL)
+def calculate(expression: str, variables: Optional[Dict[str, float]] = None,
+              bindings: Optional[List[Dict[str, float]]] = None) -> Dict[str, Any]:
     """计算数学表达式
     
+    支持 + - * / // % ** 、比较、条件表达式以及 sqrt、log、sin 等数学函数和 pi、e 常量。
+    
     Args:
-        expression: 数学表达式，如 '2 + 2 * 3'
+        expression: 数学表达式，如 '2 + 2 * 3' 或 'sqrt(x**2 + y**2)'
+        variables: 表达式中变量的取值，如 {"x": 3, "y": 4}
+        bindings: 多组变量取值，对每组分别计算，返回 results 列表
     """
     try:
-        # 安全计算表达式
-        result = eval(expression, {"__builtins__": {}})
-        return {"result": result}
-    except Exception as e:
+        # 表达式经语法树白名单校验后编译并缓存，不会执行任意代码
+        if bindings is not None:
+            return {"results": evaluate_many(expression, bindings)}
+        return {"result": evaluate(expression, variables)}
+    except ExpressionError as e:
         return {"error": str(e)}
 
 # 天气服务工具
-@mcp.tool()
+@mcp.tool(annotations=PURE_TOOL)
 async def get_weather(city: str) -> Dict[str, Any]:
     """获取城市天气信息
     
@@ -60,38 +120,36 @@ async def get_weather(city: str) -> Dict[str, Any]:
 
 # 网页获取工具
 @mcp.tool()
-async def fetch(url: str) -> Dict[str, Any]:
-    """获取网页内容
+async def fetch(url: str, start_index: int = 0, max_length: int = 20000,
+                byte_range: Optional[str] = None) -> Dict[str, Any]:
+    """获取网页内容，HTML 页面会转换为纯文本
+    
+    长页面可以分页读取：返回结果中的 next_start_index 不为空时，
+    用它作为 start_index 再次调用即可获取后续内容。
     
     Args:
         url: 要获取的网页URL
+        start_index: 从提取文本的第几个字符开始返回
+        max_length: 最多返回的字符数
+        byte_range: 可选，只请求指定的字节范围，如 "0-65535"
     """
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            headers = {
-                "User-Agent": "ModelContextProtocol/1.0 (MCP-Server; +https://github.com/modelcontextprotocol/servers)"
-            }
-            response = await client.get(url, headers=headers, follow_redirects=True)
-            
-            if response.status_code == 200:
-                content = response.text
-                # 简单处理HTML内容
-                if content.strip().startswith("<!DOCTYPE html>") or content.strip().startswith("<html"):
-                    # 简单的HTML到纯文本转换
-                    text = re.sub(r'<[^>]+>', ' ', content)
-                    # 移除多余空格
-                    text = re.sub(r'\s+', ' ', text).strip()
-                    # 移除特殊字符
-                    text = re.sub(r'&[^;]+;', ' ', text)
-                    return {"content": text, "url": url}
-                return {"content": content, "url": url}
-            else:
-                return {"error": f"获取失败，状态码: {response.status_code}", "url": url}
+        headers = {
+            "User-Agent": "ModelContextProtocol/1.0 (MCP-Server; +https://github.com/modelcontextprotocol/servers)"
+        }
+        if fetch_cache is not None:
+            return await fetch_cache.fetch(http_clients.fetch, url, headers, start_index=start_index,
+                                           max_length=max_length, max_bytes=config.fetch_max_bytes,
+                                           byte_range=byte_range, slot=http_clients.host_slot)
+        async with http_clients.host_slot(url):
+            return await fetch_text(http_clients.fetch, url, headers, start_index=start_index,
+                                    max_length=max_length, max_bytes=config.fetch_max_bytes,
+                                    byte_range=byte_range)
     except Exception as e:
         return {"error": f"获取网页错误: {str(e)}", "url": url}
 
-# 添加 LLM 对话功能
-@mcp.tool()
+# 添加 LLM 对话功能，采样结果每次不同，相同参数的并发调用也要各自请求上游
+@mcp.tool(coalesce=False)
 async def chat(messages: List[Dict[str, str]]) -> Dict[str, Any]:
     """与大模型对话
     
@@ -99,48 +157,195 @@ async def chat(messages: List[Dict[str, str]]) -> Dict[str, Any]:
         messages: 对话历史，格式为 [{"role": "user", "content": "你好"}, ...]
     """
     try:
-        async with httpx.AsyncClient() as client:
-            # 准备请求数据
-            payload = {
-                "model": config.model,
-                "messages": messages,
-                "max_tokens": config.max_tokens,
-                "temperature": config.temperature,
-            }
-            
-            # 发送请求到阿里云灵积API
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {config.api_key}"
-            }
+        # 准备请求数据
+        payload = {
+            "model": config.model,
+            "messages": messages,
+            "max_tokens": config.max_tokens,
+            "temperature": config.temperature,
+        }
             
-            response = await client.post(
-                f"{config.api_base}/chat/completions",
-                json=payload,
-                headers=headers
-            )
+        # 发送请求到阿里云灵积API
+        response = await post_chat_completions(payload)
             
-            # 解析响应
-            if response.status_code == 200:
-                response_json = response.json()
+        # 解析响应
+        if response.status_code == 200:
+            response_json = response.json()
                 
-                # 提取回复内容
-                if "choices" in response_json and len(response_json["choices"]) > 0:
-                    assistant_message = response_json["choices"][0]["message"]
-                    return {
-                        "response": assistant_message.get("content", ""),
-                        "role": assistant_message.get("role", "assistant")
-                    }
+            # 提取回复内容
+            if "choices" in response_json and len(response_json["choices"]) > 0:
+                assistant_message = response_json["choices"][0]["message"]
+                return {
+                    "response": assistant_message.get("content", ""),
+                    "role": assistant_message.get("role", "assistant")
+                }
             
-            # 处理错误
-            return {
-                "error": f"API请求失败: {response.status_code}",
-                "details": response.text
-            }
+        # 处理错误
+        return {
+            "error": f"API请求失败: {response.status_code}",
+            "details": response.text,
+            "status_code": response.status_code
+        }
     
     except Exception as e:
         return {"error": f"调用LLM出错: {str(e)}"}
 
+# 文本类 LLM 工具：系统提示（{option} 为工具参数）、单条请求的 max_tokens、结果字段和错误信息
+TEXT_TASKS = {
+    "summarize_text": {
+        "prompt": "请将以下文本摘要为不超过{option}个字符的简短摘要:",
+        "max_tokens": 500, "field": "summary", "error": "摘要生成失败", "error_prefix": "摘要工具错误",
+    },
+    "translate_text": {
+        "prompt": "请将以下文本翻译为{option}:",
+        "max_tokens": 1000, "field": "translation", "error": "翻译失败", "error_prefix": "翻译工具错误",
+    },
+    "analyze_sentiment": {
+        "prompt": "请分析以下文本的情感倾向，并给出积极、消极或中性的评价，以及0-10的情感分数和简短理由:",
+        "max_tokens": 500, "field": "analysis", "error": "情感分析失败", "error_prefix": "情感分析工具错误",
+    },
+}
+
+# 批量请求的输出 token 上限（各条目 max_tokens 之和超过时截断）
+MAX_BATCH_OUTPUT_TOKENS = 8192
+
+def text_task_payload(tool: str, option: Any, text: str) -> Dict[str, Any]:
+    """单条文本任务的请求数据，同时用作结果缓存的键"""
+    task = TEXT_TASKS[tool]
+    return {
+        "model": config.model,
+        "messages": [
+            {"role": "system", "content": task["prompt"].format(option=option)},
+            {"role": "user", "content": text}
+        ],
+        "max_tokens": task["max_tokens"],
+        "temperature": 0.3,
+    }
+
+async def request_text_task(tool: str, option: Any, text: str) -> Dict[str, Any]:
+    """单独请求上游完成一条文本任务，成功的结果写入缓存"""
+    task = TEXT_TASKS[tool]
+    payload = text_task_payload(tool, option, text)
+    try:
+        response = await post_chat_completions(payload)
+            
+        if response.status_code == 200:
+            response_json = response.json()
+            if "choices" in response_json and len(response_json["choices"]) > 0:
+                result = {task["field"]: response_json["choices"][0]["message"]["content"]}
+                await llm_cache.set(llm_cache.make_key(tool, payload), result)
+                return result
+            
+        return {"error": task["error"], "details": response.text, "status_code": response.status_code}
+    except Exception as e:
+        return {"error": f"{task['error_prefix']}: {str(e)}"}
+
+def parse_batch_results(content: str, count: int) -> Optional[List[str]]:
+    """解析批量请求的结构化输出 {"results": [...]}，格式不符或条数不对时返回 None"""
+    content = content.strip()
+    if content.startswith("```"):
+        content = content.strip("`").partition("\n")[2]
+    try:
+        parsed = json.loads(content)
+    except ValueError:
+        return None
+    results = parsed.get("results") if isinstance(parsed, dict) else parsed
+    if not isinstance(results, list) or len(results) != count:
+        return None
+    return [item if isinstance(item, str) else json.dumps(item, ensure_ascii=False) for item in results]
+
+async def run_text_batch(key: Any, texts: List[str]) -> List[Dict[str, Any]]:
+    """把同一任务的多条文本打包为一次结构化输出请求
+
+    模型返回成功但没有按要求给出等长的 JSON 数组时退回逐条请求；上游错误（已由调度器重试）
+    直接作为每一条的结果返回。
+    """
+    tool, option = key
+    if len(texts) == 1:
+        return [await request_text_task(tool, option, texts[0])]
+    
+    task = TEXT_TASKS[tool]
+    payload = {
+        "model": config.model,
+        "messages": [
+            {"role": "system", "content": (
+                f"{task['prompt'].format(option=option)}\n"
+                f"输入是包含 {len(texts)} 条文本的 JSON 数组，请逐条分别处理。"
+                f"只输出 JSON 对象 {{\"results\": [...]}}，results 按输入顺序包含 {len(texts)} 个字符串，"
+                f"第 i 个字符串是第 i 条文本的结果。"
+            )},
+            {"role": "user", "content": json.dumps(texts, ensure_ascii=False)}
+        ],
+        "max_tokens": min(MAX_BATCH_OUTPUT_TOKENS, task["max_tokens"] * len(texts)),
+        "temperature": 0.3,
+        "response_format": {"type": "json_object"},
+    }
+    # 批量结果按批量请求本身缓存，不冒充单条请求的结果
+    cache_key = llm_cache.make_key(tool, payload)
+    cached = await llm_cache.get(cache_key)
+    if cached is not None:
+        return cached["results"]
+    try:
+        response = await post_chat_completions(payload)
+    except Exception as e:
+        return [{"error": f"{task['error_prefix']}: {str(e)}"} for _ in texts]
+    if response.status_code != 200:
+        # 调度器已对 429/5xx 重试过，逐条重发只会放大上游负载，把错误返回给每个调用方
+        return [{"error": task["error"], "details": response.text, "status_code": response.status_code}
+                for _ in texts]
+    
+    contents = None
+    try:
+        choices = response.json().get("choices") or []
+        if choices:
+            contents = parse_batch_results(choices[0]["message"].get("content") or "", len(texts))
+    except (ValueError, KeyError, TypeError, AttributeError):
+        pass
+    if contents is None:
+        print(f"批量结果无法解析为 {len(texts)} 条，改为逐条请求", file=sys.stderr)
+        return list(await asyncio.gather(*(request_text_task(tool, option, text) for text in texts)))
+    
+    results = [{task["field"]: content} for content in contents]
+    await llm_cache.set(cache_key, {"results": results})
+    return results
+
+# 文本任务的微批处理器：窗口内到达的同类单条调用合并为一次上游请求
+text_batcher = MicroBatcher(run_text_batch, **config.get_text_batch_params(),
+                            weigh=lambda text: estimate_tokens(text.encode("utf-8")))
+
+async def complete_text_task(tool: str, option: Any, text: str, batched: bool) -> Dict[str, Any]:
+    """完成一条文本任务：先查缓存，未命中时经微批处理器或单独请求上游
+    
+    Args:
+        tool: TEXT_TASKS 中的工具名
+        option: 提示中的参数（摘要长度、目标语言）
+        text: 要处理的文本
+        batched: 是否经微批处理器与其它调用合并
+    """
+    # 相同模型、提示和参数的结果直接从缓存返回
+    cached = await llm_cache.get(llm_cache.make_key(tool, text_task_payload(tool, option, text)))
+    if cached is not None:
+        return cached
+    if not batched:
+        return await request_text_task(tool, option, text)
+    try:
+        return await text_batcher.submit((tool, option), text)
+    except Exception as e:
+        return {"error": f"{TEXT_TASKS[tool]['error_prefix']}: {str(e)}"}
+
+async def complete_text_tasks(tool: str, option: Any, texts: List[str]) -> Dict[str, Any]:
+    """批量工具的公共实现：每条文本分别查缓存，未命中的按 token 预算分批请求"""
+    key = (tool, option)
+    results: List[Any] = [await llm_cache.get(llm_cache.make_key(tool, text_task_payload(tool, option, text)))
+                          for text in texts]
+    misses = [i for i, result in enumerate(results) if result is None]
+    batched = await text_batcher.submit_many(key, [texts[i] for i in misses])
+    for i, result in zip(misses, batched):
+        if isinstance(result, Exception):
+            result = {"error": f"{TEXT_TASKS[tool]['error_prefix']}: {str(result)}"}
+        results[i] = result
+    return {"results": results}
+
 # 添加文本摘要工具
 @mcp.tool()
 async def summarize_text(text: str, max_length: int = 100) -> Dict[str, Any]:
@@ -150,39 +355,17 @@ async def summarize_text(text: str, max_length: int = 100) -> Dict[str, Any]:
         text: 要摘要的文本
         max_length: 摘要的最大长度（字符数）
     """
-    try:
-        # 调用千问模型进行摘要
-        async with httpx.AsyncClient() as client:
-            payload = {
-                "model": config.model,
-                "messages": [
-                    {"role": "system", "content": f"请将以下文本摘要为不超过{max_length}个字符的简短摘要:"},
-                    {"role": "user", "content": text}
-                ],
-                "max_tokens": 500,
-                "temperature": 0.3,
-            }
-            
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {config.api_key}"
-            }
-            
-            response = await client.post(
-                f"{config.api_base}/chat/completions",
-                json=payload,
-                headers=headers
-            )
-            
-            if response.status_code == 200:
-                response_json = response.json()
-                if "choices" in response_json and len(response_json["choices"]) > 0:
-                    summary = response_json["choices"][0]["message"]["content"]
-                    return {"summary": summary}
-            
-            return {"error": "摘要生成失败", "details": response.text}
-    except Exception as e:
-        return {"error": f"摘要工具错误: {str(e)}"}
+    return await complete_text_task("summarize_text", max_length, text, batched=config.text_batching)
+
+@mcp.tool()
+async def summarize_texts(texts: List[str], max_length: int = 100) -> Dict[str, Any]:
+    """批量摘要多条文本，返回与输入顺序一致的 results 列表
+    
+    Args:
+        texts: 要摘要的文本列表
+        max_length: 每条摘要的最大长度（字符数）
+    """
+    return await complete_text_tasks("summarize_text", max_length, texts)
 
 # 添加文本翻译工具
 @mcp.tool()
@@ -193,39 +376,17 @@ async def translate_text(text: str, target_language: str = "英语") -> Dict[str
         text: 要翻译的文本
         target_language: 目标语言，如"英语"、"法语"、"日语"等
     """
-    try:
-        # 调用千问模型进行翻译
-        async with httpx.AsyncClient() as client:
-            payload = {
-                "model": config.model,
-                "messages": [
-                    {"role": "system", "content": f"请将以下文本翻译为{target_language}:"},
-                    {"role": "user", "content": text}
-                ],
-                "max_tokens": 1000,
-                "temperature": 0.3,
-            }
-            
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {config.api_key}"
-            }
-            
-            response = await client.post(
-                f"{config.api_base}/chat/completions",
-                json=payload,
-                headers=headers
-            )
-            
-            if response.status_code == 200:
-                response_json = response.json()
-                if "choices" in response_json and len(response_json["choices"]) > 0:
-                    translation = response_json["choices"][0]["message"]["content"]
-                    return {"translation": translation}
-            
-            return {"error": "翻译失败", "details": response.text}
-    except Exception as e:
-        return {"error": f"翻译工具错误: {str(e)}"}
+    return await complete_text_task("translate_text", target_language, text, batched=config.text_batching)
+
+@mcp.tool()
+async def translate_texts(texts: List[str], target_language: str = "英语") -> Dict[str, Any]:
+    """批量翻译多条文本，返回与输入顺序一致的 results 列表
+    
+    Args:
+        texts: 要翻译的文本列表
+        target_language: 目标语言，如"英语"、"法语"、"日语"等
+    """
+    return await complete_text_tasks("translate_text", target_language, texts)
 
 # 添加文本分析工具
 @mcp.tool()
@@ -235,84 +396,153 @@ async def analyze_sentiment(text: str) -> Dict[str, Any]:
     Args:
         text: 要分析的文本
     """
-    try:
-        # 调用千问模型进行情感分析
-        async with httpx.AsyncClient() as client:
-            payload = {
-                "model": config.model,
-                "messages": [
-                    {"role": "system", "content": "请分析以下文本的情感倾向，并给出积极、消极或中性的评价，以及0-10的情感分数和简短理由:"},
-                    {"role": "user", "content": text}
-                ],
-                "max_tokens": 500,
-                "temperature": 0.3,
-            }
-            
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {config.api_key}"
-            }
-            
-            response = await client.post(
-                f"{config.api_base}/chat/completions",
-                json=payload,
-                headers=headers
-            )
-            
-            if response.status_code == 200:
-                response_json = response.json()
-                if "choices" in response_json and len(response_json["choices"]) > 0:
-                    analysis = response_json["choices"][0]["message"]["content"]
-                    return {"analysis": analysis}
-            
-            return {"error": "情感分析失败", "details": response.text}
-    except Exception as e:
-        return {"error": f"情感分析工具错误: {str(e)}"}
-
-# 创建 SSE 服务器传输
-sse = SseServerTransport("/messages/")
-
-# 处理 SSE 请求的函数
-async def handle_sse(request):
-    async with sse.connect_sse(request.scope, request.receive, request._send) as streams:
-        await mcp._mcp_server.run(
-            streams[0],
-            streams[1],
-            mcp._mcp_server.create_initialization_options(),
-        )
-
-# 创建 Starlette 应用
-starlette_app = Starlette(
-    debug=True,
-    routes=[
-        Route("/sse", endpoint=handle_sse),
-        Mount("/messages/", app=sse.handle_post_message),
-    ],
-)
+    return await complete_text_task("analyze_sentiment", None, text, batched=config.text_batching)
+
+@mcp.tool()
+async def analyze_sentiments(texts: List[str]) -> Dict[str, Any]:
+    """批量分析多条文本的情感倾向，返回与输入顺序一致的 results 列表
+    
+    Args:
+        texts: 要分析的文本列表
+    """
+    return await complete_text_tasks("analyze_sentiment", None, texts)
+
+def hold_http_clients(app):
+    """让应用在整个运行期间持有连接池的引用，会话之间不会关闭连接池，退出时统一关闭
+
+    同时添加 /metrics 路由，退出时写出尚未导出的追踪数据。
+    """
+    from starlette.routing import Route
+    
+    app_lifespan = app.router.lifespan_context
+    
+    @asynccontextmanager
+    async def lifespan(app):
+        try:
+            async with http_clients.lifespan(), app_lifespan(app) as state:
+                yield state
+        finally:
+            tracer.flush()
+    
+    app.router.lifespan_context = lifespan
+    app.router.routes.append(Route("/metrics", metrics, methods=["GET"]))
+    return app
+
+async def metrics(request):
+    """Prometheus 文本格式的指标：span 延迟直方图、执行池、缓存和上游调度器状态
+    
+    多 worker 模式下每次抓取由接受连接的那个 worker 返回自己的指标。
+    """
+    from starlette.responses import PlainTextResponse
+    
+    gauges = {
+        "executor": executor.get_stats(),
+        "coalescing": mcp.get_coalescing_stats(),
+        "llm_cache": llm_cache.get_stats(),
+        "text_batcher": text_batcher.get_stats(),
+        "scheduler": scheduler.get_stats(),
+    }
+    if fetch_cache is not None:
+        gauges["fetch_cache"] = fetch_cache.get_stats()
+    return PlainTextResponse(tracer.prometheus_text(gauges), media_type="text/plain; version=0.0.4")
+
+def build_sse_app(message_path: str = "/messages/"):
+    """创建 SSE 模式的应用
+    
+    Args:
+        message_path: 客户端 POST 消息的路径
+    """
+    mcp.settings.sse_path = "/sse"
+    mcp.settings.message_path = message_path
+    return hold_http_clients(mcp.sse_app())
+
+def build_streamable_http_app(stateless: bool, json_response: bool):
+    """创建 streamable HTTP 模式的应用，端点为 /mcp
+    
+    Args:
+        stateless: 无状态模式，每个请求独立处理，不保存会话，可以任意负载均衡
+        json_response: 直接返回 JSON 响应而不是 SSE 流
+    """
+    mcp.settings.streamable_http_path = "/mcp"
+    mcp.settings.stateless_http = stateless
+    mcp.settings.json_response = json_response
+    return hold_http_clients(mcp.streamable_http_app())
 
 # 主入口
 if __name__ == "__main__":
     import argparse
     
     parser = argparse.ArgumentParser(description="MCP 服务器")
-    parser.add_argument("--mode", choices=["stdio", "http"], default="stdio",
-                      help="启动模式: stdio 或 http (SSE)")
+    parser.add_argument("--mode", choices=["stdio", "http", "streamable-http"], default="stdio",
+                      help="启动模式: stdio、http (SSE) 或 streamable-http")
     parser.add_argument("--host", default="127.0.0.1", help="HTTP 服务器主机")
     parser.add_argument("--port", type=int, default=8000, help="HTTP 服务器端口")
+    parser.add_argument("--workers", type=int, default=config.sse_workers,
+                      help="HTTP 模式的 worker 进程数，大于 1 时按会话把消息路由到对应 worker")
+    parser.add_argument("--stateful", action="store_true",
+                      help="streamable-http 模式保存会话（默认按配置 streamable_http_stateless 无状态处理）")
+    parser.add_argument("--profile-startup", action="store_true",
+                      help="在标准错误输出中报告模块导入和初始化耗时，以及第一次工具调用的延迟")
+    parser.add_argument("--json-response", action="store_true", default=config.streamable_http_json_response,
+                      help="streamable-http 模式直接返回 JSON 响应而不是 SSE 流")
+    # 以下参数由多 worker 模式的主进程传给 worker 进程
+    parser.add_argument("--worker-index", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--fd", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--uds-dir", help=argparse.SUPPRESS)
     
     args = parser.parse_args()
     
+    if args.profile_startup:
+        # stdio 模式的标准输出是协议通道，报告只能写到标准错误
+        print(f"服务器启动分析: 导入和初始化 {(time.perf_counter() - STARTUP_BEGAN) * 1000:.1f} ms"
+              f"（不含解释器启动）", file=sys.stderr)
+        
+        def report_first_call(first_call: Dict[str, Any]):
+            finished = first_call["started"] + first_call["seconds"]
+            print(f"服务器启动分析: 第一次工具调用 {first_call['tool']} 耗时 {first_call['seconds'] * 1000:.1f} ms，"
+                  f"距启动 {(finished - STARTUP_BEGAN) * 1000:.1f} ms", file=sys.stderr)
+        
+        mcp.on_first_call = report_first_call
+    
     if args.mode == "stdio":
         # 原始的 stdio 模式
         mcp.run(transport='stdio')
+        tracer.flush()
+        sys.exit(0)
+    
+    # uvicorn 和多 worker 模块只在 HTTP 模式下导入，stdio 模式不需要
+    import sse_workers
+    import uvicorn
+    
+    stateless = config.streamable_http_stateless and not args.stateful
+    if args.mode == "streamable-http" and args.workers > 1 and not stateless:
+        parser.error("有状态的 streamable-http 模式不支持多个 worker")
+    
+    if args.worker_index is not None:
+        # 多 worker 模式下的 worker 进程
+        if args.mode == "streamable-http":
+            # 无状态请求可以由任意 worker 处理，不需要会话路由
+            app = build_streamable_http_app(stateless, args.json_response)
+        else:
+            app = build_sse_app(sse_workers.message_path(args.worker_index))
+            sse_workers.add_affinity_routes(app, args.worker_index, args.uds_dir)
+        sse_workers.run_worker(app, args.worker_index, args.fd, args.uds_dir,
+                               mcp.settings.log_level.lower(), config.sse_graceful_timeout)
+    elif args.workers > 1:
+        extra_args = ["--json-response"] if args.json_response else []
+        sys.exit(sse_workers.supervise(os.path.abspath(__file__), args.host, args.port, args.workers,
+                                       config.sse_graceful_timeout, mode=args.mode, extra_args=extra_args))
     else:
-        # 设置FastMCP的SSE配置
         mcp.settings.host = args.host
         mcp.settings.port = args.port
-        mcp.settings.sse_path = "/sse"
-        mcp.settings.message_path = "/messages/"
         
-        # HTTP/SSE 模式，使用FastMCP内置的sse_app方法
-        print(f"启动 HTTP 服务器，支持 SSE，地址: http://{args.host}:{args.port}/sse")
-        # 使用内置运行方法
-        mcp.run(transport='sse') 
\ No newline at end of file
+        if args.mode == "streamable-http":
+            print(f"启动 streamable HTTP 服务器，地址: http://{args.host}:{args.port}/mcp"
+                  f"（{'无状态' if stateless else '有状态'}）")
+            app = build_streamable_http_app(stateless, args.json_response)
+        else:
+            # HTTP/SSE 模式，使用FastMCP内置的sse_app方法
+            print(f"启动 HTTP 服务器，支持 SSE，地址: http://{args.host}:{args.port}/sse")
+            app = build_sse_app()
+        uvicorn.run(app, host=args.host, port=args.port, log_level=mcp.settings.log_level.lower(),
+                    timeout_graceful_shutdown=config.sse_graceful_timeout)
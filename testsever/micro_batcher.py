@@ -0,0 +1,126 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+
+class _Batch:
+    __slots__ = ("items", "futures", "tokens", "timer")
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.futures: List[asyncio.Future] = []
+        self.tokens = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class MicroBatcher:
+    """把短时间窗口内到达的同类单条请求合并为一次批量请求
+
+    同一分组键（如工具名和目标语言）的请求进入同一批，批次在窗口结束、条数达到上限
+    或累计 token 达到预算时发出；分组空闲时第一条请求不等待窗口，只有上一批仍在执行时
+    才在窗口内收集后续请求。批量函数返回与输入等长的结果列表，按顺序分发给各调用方。
+    """
+
+    def __init__(self, run_batch: Callable[[Hashable, List[Any]], Awaitable[List[Any]]],
+                 window: float = 0.02, max_items: int = 16, max_tokens: int = 3000,
+                 weigh: Callable[[Any], int] = lambda item: 1):
+        """
+        Args:
+            run_batch: 批量执行函数，参数为 (分组键, 条目列表)，返回等长的结果列表
+            window: 该分组已有批次在执行时，第一条请求到达后最多等待同批其它请求的时间（秒）
+            max_items: 每批最多的条目数
+            max_tokens: 每批条目累计的 token 预算，单条超过预算时单独成批
+            weigh: 估算单个条目 token 数的函数
+        """
+        self.run_batch = run_batch
+        self.window = window
+        self.max_items = max(1, max_items)
+        self.max_tokens = max_tokens
+        self.weigh = weigh
+        self._open: Dict[Hashable, _Batch] = {}
+        self._tasks = set()
+        # 各分组正在执行的批次数
+        self._running: Dict[Hashable, int] = {}
+        self.stats = {"items": 0, "batches": 0, "batched_items": 0, "largest_batch": 0, "failures": 0}
+
+    async def submit(self, key: Hashable, item: Any) -> Any:
+        """提交一个条目并等待它的结果，批量执行失败时抛出同样的异常
+
+        该分组没有正在执行的批次时不等待窗口，条目在当前事件循环轮次结束时发出；
+        已有批次在执行时才等待 window 秒收集同批请求。
+        """
+        return await self._enqueue(key, item, schedule=True)
+
+    async def submit_many(self, key: Hashable, items: List[Any]) -> List[Any]:
+        """一次提交多个条目（按预算分批）并立即发出，不等待窗口
+
+        Returns:
+            与 items 等长的结果列表，执行失败的条目对应位置为异常对象
+        """
+        futures = [self._enqueue(key, item, schedule=False) for item in items]
+        self._flush(key)
+        return list(await asyncio.gather(*futures, return_exceptions=True))
+
+    def _enqueue(self, key: Hashable, item: Any, schedule: bool) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        tokens = self.weigh(item)
+        batch = self._open.get(key)
+        if batch is not None and batch.tokens + tokens > self.max_tokens:
+            self._flush(key)
+            batch = None
+        if batch is None:
+            batch = self._open[key] = _Batch()
+            if schedule:
+                delay = self.window if self._running.get(key) else 0
+                batch.timer = loop.call_later(delay, self._flush, key, batch)
+
+        future = loop.create_future()
+        batch.items.append(item)
+        batch.futures.append(future)
+        batch.tokens += tokens
+        self.stats["items"] += 1
+        if len(batch.items) >= self.max_items or batch.tokens >= self.max_tokens:
+            self._flush(key)
+        return future
+
+    def _flush(self, key: Hashable, batch: Optional[_Batch] = None):
+        current = self._open.get(key)
+        if current is None or (batch is not None and current is not batch):
+            # 定时器触发前该批已因条数或预算发出
+            return
+        del self._open[key]
+        if current.timer is not None:
+            current.timer.cancel()
+        self._running[key] = self._running.get(key, 0) + 1
+        task = asyncio.ensure_future(self._run(key, current))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key: Hashable, batch: _Batch):
+        size = len(batch.items)
+        self.stats["batches"] += 1
+        if size > 1:
+            self.stats["batched_items"] += size
+        self.stats["largest_batch"] = max(self.stats["largest_batch"], size)
+        try:
+            try:
+                results = await self.run_batch(key, batch.items)
+            finally:
+                self._running[key] -= 1
+                if not self._running[key]:
+                    del self._running[key]
+            if len(results) != size:
+                raise RuntimeError(f"批量结果数 {len(results)} 与条目数 {size} 不一致")
+        except Exception as e:
+            self.stats["failures"] += 1
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, result in zip(batch.futures, results):
+            # 已取消的调用方不再接收结果
+            if not future.done():
+                future.set_result(result)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """返回批处理统计：条目数、批次数、合并进多条批次的条目数和最大批次"""
+        return dict(self.stats, open_batches=len(self._open))
@@ -0,0 +1,149 @@
+import asyncio
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+# 不转发给所属 worker 的逐跳请求头
+HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "content-length"}
+
+
+def message_path(index: int) -> str:
+    """第 index 个 worker 的消息路径，客户端 POST 到该路径，据此路由回拥有会话的 worker"""
+    return f"/messages/w{index}/"
+
+
+def socket_path(uds_dir: str, index: int) -> str:
+    return os.path.join(uds_dir, f"w{index}.sock")
+
+
+def add_affinity_routes(app: Starlette, index: int, uds_dir: str):
+    """为 worker 的应用添加转发路由
+
+    SSE 会话保存在建立 GET /sse 连接的 worker 内存中。POST 可能被内核分配给任意 worker，
+    路径中的 worker 编号不是自己时，经 Unix 套接字转发给拥有该会话的 worker。
+    """
+    clients: Dict[int, httpx.AsyncClient] = {}
+
+    def client_for(owner: int) -> httpx.AsyncClient:
+        if owner not in clients:
+            transport = httpx.AsyncHTTPTransport(uds=socket_path(uds_dir, owner))
+            clients[owner] = httpx.AsyncClient(transport=transport, timeout=30.0)
+        return clients[owner]
+
+    async def forward(request: Request) -> Response:
+        owner = request.path_params["worker"]
+        if owner == index:
+            return Response("会话路由错误", status_code=500)
+        headers = [(k, v) for k, v in request.headers.items() if k.lower() not in HOP_HEADERS]
+        try:
+            upstream = await client_for(owner).post(
+                f"http://worker{request.url.path}",
+                params=request.query_params,
+                content=await request.body(),
+                headers=headers,
+            )
+        except httpx.TransportError:
+            return Response("会话所在的 worker 不可用", status_code=503)
+        return Response(upstream.content, status_code=upstream.status_code,
+                        media_type=upstream.headers.get("Content-Type"))
+
+    app.router.routes.append(Route("/messages/w{worker:int}/", forward, methods=["POST"]))
+
+    app_lifespan = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(app):
+        try:
+            async with app_lifespan(app) as state:
+                yield state
+        finally:
+            for client in clients.values():
+                await client.aclose()
+
+    app.router.lifespan_context = lifespan
+
+
+def run_worker(app: Starlette, index: int, fd: int, uds_dir: str, log_level: str, graceful_timeout: float):
+    """在共享的监听套接字和自己的 Unix 套接字上运行一个 worker"""
+    listener = socket.socket(fileno=fd)
+    path = socket_path(uds_dir, index)
+    if os.path.exists(path):
+        os.unlink(path)
+    local = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    local.bind(path)
+    local.listen(128)
+
+    config = uvicorn.Config(app, log_level=log_level, timeout_graceful_shutdown=graceful_timeout)
+    server = uvicorn.Server(config)
+    asyncio.run(server.serve(sockets=[listener, local]))
+
+
+def supervise(script: str, host: str, port: int, workers: int, graceful_timeout: float,
+              mode: str = "http", extra_args: Optional[List[str]] = None) -> int:
+    """启动多个 worker 进程共享同一个监听套接字，并在退出时优雅停止
+
+    收到 SIGINT/SIGTERM 时向所有 worker 发送 SIGTERM：worker 停止接受新连接，
+    等待进行中的请求完成（最多 graceful_timeout 秒）后退出。运行期间意外退出的 worker 会被重启。
+
+    Args:
+        mode: worker 的启动模式，http (SSE) 或 streamable-http
+
+    Returns:
+        进程退出码
+    """
+    listener = socket.create_server((host, port), backlog=2048)
+    listener.set_inheritable(True)
+    uds_dir = tempfile.mkdtemp(prefix="mcp-sse-")
+    stopping = False
+
+    def spawn(index: int) -> subprocess.Popen:
+        command = [sys.executable, script, "--mode", mode, "--workers", str(workers),
+                   "--worker-index", str(index), "--fd", str(listener.fileno()), "--uds-dir", uds_dir]
+        return subprocess.Popen(command + (extra_args or []), pass_fds=[listener.fileno()])
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in processes:
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+
+    processes = [spawn(index) for index in range(workers)]
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    endpoint = "/mcp" if mode == "streamable-http" else "/sse"
+    print(f"已启动 {workers} 个 worker，地址: http://{host}:{port}{endpoint}", file=sys.stderr)
+
+    try:
+        while True:
+            if stopping:
+                deadline = time.monotonic() + graceful_timeout + 5.0
+                for process in processes:
+                    try:
+                        process.wait(timeout=max(0.0, deadline - time.monotonic()))
+                    except subprocess.TimeoutExpired:
+                        process.kill()
+                        process.wait()
+                return 0
+            for index, process in enumerate(processes):
+                if process.poll() is not None and not stopping:
+                    print(f"worker {index} 已退出（{process.returncode}），正在重启", file=sys.stderr)
+                    processes[index] = spawn(index)
+            time.sleep(0.5)
+    finally:
+        listener.close()
+        shutil.rmtree(uds_dir, ignore_errors=True)
@@ -0,0 +1,317 @@
+import asyncio
+import functools
+import inspect
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from mcp.server.fastmcp import FastMCP
+
+from request_builder import canonical_dumps
+from tracing import Tracer, get_tracer
+
+# 执行策略: inline 在事件循环中直接执行；thread 在线程池中执行；process 在独立进程中执行
+EXECUTION_POLICIES = ("inline", "thread", "process")
+
+
+class ToolBusyError(Exception):
+    """等待队列已满，拒绝新的工具调用"""
+
+
+class ToolTimeoutError(Exception):
+    """工具调用超时"""
+
+
+def _worker_main(conn):
+    """进程池工作进程：循环接收 (函数, 参数) 并返回结果"""
+    conn.send("ready")
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        fn, args, kwargs = message
+        try:
+            conn.send((True, fn(*args, **kwargs)))
+        except BaseException as e:
+            try:
+                conn.send((False, e))
+            except Exception:
+                # 异常对象无法序列化时只返回描述
+                conn.send((False, RuntimeError(repr(e))))
+
+
+class _ProcessWorker:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+
+    async def _readable(self, timeout: Optional[float] = None):
+        loop = asyncio.get_running_loop()
+        readable = loop.create_future()
+        fd = self.conn.fileno()
+        loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+        try:
+            await asyncio.wait_for(readable, timeout)
+        finally:
+            loop.remove_reader(fd)
+
+    async def call(self, fn: Callable, args: tuple, kwargs: dict, timeout: Optional[float]) -> Any:
+        if not self.ready:
+            # 等待进程启动完成，启动时间不计入调用超时
+            await self._readable()
+            self.conn.recv()
+            self.ready = True
+        self.conn.send((fn, args, kwargs))
+        await self._readable(timeout)
+        ok, value = self.conn.recv()
+        if not ok:
+            raise value
+        return value
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=1.0)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+class ToolExecutor:
+    """按工具执行策略调度同步工具函数
+
+    thread 策略使用共享线程池，超时只能放弃等待；process 策略使用常驻工作进程，
+    超时会杀掉正在执行的进程并补充新进程，失控的计算不会一直占用 CPU。
+    每种策略的等待队列有上限，队列已满时立即拒绝。
+    """
+
+    def __init__(self, thread_workers: int = 4, process_workers: int = 2, max_queue: int = 64):
+        """
+        Args:
+            thread_workers: 线程池大小
+            process_workers: 工作进程数
+            max_queue: 每种策略最多排队等待的调用数
+        """
+        self.thread_workers = max(1, thread_workers)
+        self.process_workers = max(1, process_workers)
+        self.max_queue = max_queue
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._thread_slots: Optional[asyncio.Semaphore] = None
+        self._idle: Optional[asyncio.Queue] = None
+        self._workers: List[_ProcessWorker] = []
+        # 不使用 fork：stdio 模式下读取 stdin 的线程持有缓冲区锁，fork 出的子进程关闭 stdin 时会死锁
+        methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        self._waiting = {"thread": 0, "process": 0}
+        self._running = {"thread": 0, "process": 0}
+        self.tool_stats: Dict[str, Dict[str, int]] = {}
+
+    def _record(self, tool: str, key: str):
+        stats = self.tool_stats.setdefault(tool, {"calls": 0, "errors": 0, "timeouts": 0, "rejected": 0})
+        stats[key] += 1
+
+    def _admit(self, policy: str, tool: str):
+        if self._waiting[policy] >= self.max_queue:
+            self._record(tool, "rejected")
+            raise ToolBusyError(f"工具 {tool} 的{policy}执行队列已满（{self.max_queue}），请稍后重试")
+
+    async def run(self, policy: str, tool: str, fn: Callable, args: tuple, kwargs: dict,
+                  timeout: Optional[float] = None) -> Any:
+        """按策略执行同步函数
+
+        Raises:
+            ToolBusyError: 等待队列已满
+            ToolTimeoutError: 超过 timeout 秒未完成
+        """
+        self._record(tool, "calls")
+        try:
+            if policy == "thread":
+                return await self._run_thread(tool, fn, args, kwargs, timeout)
+            if policy == "process":
+                return await self._run_process(tool, fn, args, kwargs, timeout)
+            return fn(*args, **kwargs)
+        except ToolBusyError:
+            raise
+        except (asyncio.TimeoutError, ToolTimeoutError):
+            self._record(tool, "timeouts")
+            raise ToolTimeoutError(f"工具 {tool} 执行超时（{timeout} 秒）")
+        except Exception:
+            self._record(tool, "errors")
+            raise
+
+    async def _run_thread(self, tool, fn, args, kwargs, timeout):
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(self.thread_workers, thread_name_prefix="tool")
+            self._thread_slots = asyncio.Semaphore(self.thread_workers)
+        self._admit("thread", tool)
+        self._waiting["thread"] += 1
+        try:
+            await self._thread_slots.acquire()
+        finally:
+            self._waiting["thread"] -= 1
+        self._running["thread"] += 1
+        try:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._threads, functools.partial(fn, *args, **kwargs))
+            # 线程无法被强制终止，超时后放弃等待，线程在函数返回后释放
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._running["thread"] -= 1
+            self._thread_slots.release()
+
+    async def _run_process(self, tool, fn, args, kwargs, timeout):
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            for _ in range(self.process_workers):
+                worker = _ProcessWorker(self._context)
+                self._workers.append(worker)
+                self._idle.put_nowait(worker)
+        self._admit("process", tool)
+        self._waiting["process"] += 1
+        try:
+            worker = await self._idle.get()
+        finally:
+            self._waiting["process"] -= 1
+        self._running["process"] += 1
+        try:
+            result = await worker.call(fn, args, kwargs, timeout)
+        except BaseException:
+            # 超时、取消或进程异常退出：结果已不可用，换一个新进程
+            self._replace(worker)
+            raise
+        else:
+            self._idle.put_nowait(worker)
+            return result
+        finally:
+            self._running["process"] -= 1
+
+    def _replace(self, worker: _ProcessWorker):
+        worker.kill()
+        self._workers.remove(worker)
+        fresh = _ProcessWorker(self._context)
+        self._workers.append(fresh)
+        self._idle.put_nowait(fresh)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """返回各策略的排队数、执行中数量和各工具的调用计数"""
+        return {
+            "queue_depth": dict(self._waiting),
+            "running": dict(self._running),
+            "tools": {name: dict(stats) for name, stats in self.tool_stats.items()},
+        }
+
+    def shutdown(self):
+        """停止工作进程和线程池"""
+        for worker in self._workers:
+            worker.stop()
+        self._workers = []
+        self._idle = None
+        if self._threads is not None:
+            self._threads.shutdown(wait=False, cancel_futures=True)
+            self._threads = None
+
+
+class PolicyFastMCP(FastMCP):
+    """支持按工具指定执行策略的 FastMCP
+
+    用法: @mcp.tool(execution="process", timeout=2.0) 注册同步函数，调用时在工作进程中执行。
+    未指定 execution 时与 FastMCP 相同（inline）。每次工具调用记录一个 server.tool span。
+
+    参数相同（规范化后）的并发调用合并为一次执行（single-flight），所有调用方共享结果。
+    有副作用、不能合并的工具用 @mcp.tool(coalesce=False) 或 coalesce_exclude 排除。
+    """
+
+    def __init__(self, *args, executor: Optional[ToolExecutor] = None, tracer: Optional[Tracer] = None,
+                 coalesce: bool = True, coalesce_exclude: Iterable[str] = (), **kwargs):
+        """
+        Args:
+            executor: thread/process 策略使用的执行池
+            tracer: 记录工具调用 span 的追踪器
+            coalesce: 是否合并相同的并发调用
+            coalesce_exclude: 不参与合并的工具名
+        """
+        super().__init__(*args, **kwargs)
+        self.executor = executor or ToolExecutor()
+        self.tracer = tracer or get_tracer()
+        self.coalesce = coalesce
+        self._no_coalesce: Set[str] = set(coalesce_exclude)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.coalesce_stats: Dict[str, Dict[str, int]] = {}
+        # 启动分析：第一次工具调用完成后记录 {"tool", "started", "seconds"}（perf_counter 时间）并调用回调
+        self.first_call: Optional[Dict[str, Any]] = None
+        self.on_first_call: Optional[Callable[[Dict[str, Any]], None]] = None
+
+    async def call_tool(self, name: str, arguments: Dict[str, Any]) -> Any:
+        started = time.perf_counter()
+        try:
+            return await self._call_tool(name, arguments)
+        finally:
+            if self.first_call is None:
+                self.first_call = {"tool": name, "started": started, "seconds": time.perf_counter() - started}
+                if self.on_first_call:
+                    self.on_first_call(self.first_call)
+
+    async def _call_tool(self, name: str, arguments: Dict[str, Any]) -> Any:
+        with self.tracer.span("server.tool", tool=name) as span:
+            if not self.coalesce or name in self._no_coalesce:
+                return await super().call_tool(name, arguments)
+
+            key = f"{name}:{canonical_dumps(arguments)}"
+            stats = self.coalesce_stats.setdefault(name, {"executions": 0, "coalesced": 0})
+            task = self._inflight.get(key)
+            if task is None:
+                stats["executions"] += 1
+                task = asyncio.ensure_future(super().call_tool(name, arguments))
+                self._inflight[key] = task
+                task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            else:
+                stats["coalesced"] += 1
+                span.set(coalesced=True)
+            # shield: 一个调用方被取消时不影响共享同一次执行的其他调用方
+            return await asyncio.shield(task)
+
+    def get_coalescing_stats(self) -> Dict[str, Any]:
+        """返回各工具的实际执行次数和被合并的调用数"""
+        return {
+            "in_flight": len(self._inflight),
+            "tools": {name: dict(stats) for name, stats in self.coalesce_stats.items()},
+        }
+
+    def tool(self, name: Optional[str] = None, *args, execution: str = "inline",
+             timeout: Optional[float] = None, coalesce: bool = True, **kwargs) -> Callable:
+        if execution not in EXECUTION_POLICIES:
+            raise ValueError(f"未知的执行策略: {execution}，可选 {EXECUTION_POLICIES}")
+        register = super().tool(name, *args, **kwargs)
+
+        def decorator(fn: Callable) -> Callable:
+            tool_name = name or fn.__name__
+            if not coalesce:
+                self._no_coalesce.add(tool_name)
+            if execution == "inline":
+                return register(fn)
+            if inspect.iscoroutinefunction(fn):
+                raise TypeError(f"{fn.__name__}: {execution} 策略只能用于同步函数")
+
+            @functools.wraps(fn)
+            async def dispatch(*call_args, **call_kwargs):
+                return await self.executor.run(execution, tool_name, fn, call_args, call_kwargs, timeout)
+
+            register(dispatch)
+            # 返回原函数，进程策略按模块属性名序列化它
+            return fn
+
+        return decorator
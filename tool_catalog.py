@@ -0,0 +1,102 @@
+import asyncio
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from request_builder import canonical_tools_json
+
+# 导入 mcp 会加载全部传输层，只在收到消息时导入
+if TYPE_CHECKING:
+    from mcp import ClientSession
+    import mcp.types as types
+
+
+class ToolCatalog:
+    """会话级工具目录缓存
+
+    连接时获取一次工具列表，之后只在服务器发送
+    notifications/tools/list_changed 或显式刷新时重新获取。
+    同时缓存 OpenAI 格式的工具列表及其序列化后的 JSON 片段，
+    避免每轮请求都重新构建和编码。
+    """
+
+    def __init__(self):
+        self.tools: List["types.Tool"] = []
+        self.openai_tools: List[Dict[str, Any]] = []
+        self.tools_json: str = "[]"
+        self.stale = True
+        # 每次重建递增，合并多个目录时据此判断是否需要重建
+        self.version = 0
+        self._lock = asyncio.Lock()
+
+    def update(self, tools: List["types.Tool"]):
+        """用新的工具列表重建缓存并标记为最新"""
+        self._rebuild(tools)
+        self.stale = False
+
+    def _rebuild(self, tools: List["types.Tool"]):
+        self.tools = list(tools)
+        self.openai_tools = [{
+            "type": "function",
+            "function": {
+                "name": tool.name,
+                "description": tool.description,
+                "parameters": tool.inputSchema
+            }
+        } for tool in self.tools]
+        self.tools_json = canonical_tools_json(self.openai_tools)
+        self.version += 1
+
+    def invalidate(self):
+        """标记缓存过期，下次使用时重新获取"""
+        self.stale = True
+
+    async def _fetch(self, session: "ClientSession"):
+        """在持有锁的情况下重新获取工具列表
+
+        请求发出前先清除 stale 标记，请求期间到达的 list_changed 通知会重新置位，
+        保证下次使用时再刷新一次，而不会被这次的结果覆盖。
+        """
+        self.stale = False
+        try:
+            response = await session.list_tools()
+        except BaseException:
+            self.stale = True
+            raise
+        self._rebuild(response.tools)
+
+    async def refresh(self, session: "ClientSession"):
+        """从服务器重新获取工具列表"""
+        async with self._lock:
+            await self._fetch(session)
+
+    async def ensure_fresh(self, session: "ClientSession"):
+        """缓存过期时刷新，否则直接返回
+
+        并发调用时只有一个会真正发出 list_tools，其余等待锁后发现缓存已是最新。
+        """
+        if not self.stale:
+            return
+        async with self._lock:
+            if self.stale:
+                await self._fetch(session)
+
+    def has_tool(self, name: str) -> bool:
+        """检查工具是否存在"""
+        return any(tool.name == name for tool in self.tools)
+
+    def get_tool(self, name: str) -> Optional["types.Tool"]:
+        """按名称查找工具"""
+        for tool in self.tools:
+            if tool.name == name:
+                return tool
+        return None
+
+    async def handle_message(self, message: Any):
+        """ClientSession 的 message_handler，收到工具列表变更通知时使缓存过期
+
+        注意: 该回调在会话的接收循环中执行，不能在这里直接调用 list_tools，
+        否则会等待自身处理的响应而死锁，因此只做标记。
+        """
+        import mcp.types as types
+        if isinstance(message, types.ServerNotification) and \
+                isinstance(message.root, types.ToolListChangedNotification):
+            self.invalidate()
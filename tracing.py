@@ -0,0 +1,295 @@
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# 直方图的有效精度：每个 2 的幂区间分为 2**SUB_BUCKET_BITS 个子桶，相对误差小于 1%
+SUB_BUCKET_BITS = 7
+# 导出 Prometheus 直方图时使用的桶上界（秒）
+PROMETHEUS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 追踪文件每累计多少个 span 写出一次
+EXPORT_BATCH_SIZE = 64
+# 以动态名称为键的统计字典导出为带标签的指标：字典键 -> (指标名片段, 标签名)，
+# 如 {"tools": {"calculate": {"calls": 3}}} 导出为 mcp_executor_tool_calls{tool="calculate"} 3
+LABELLED_STATS = {"tools": ("tool", "tool"), "queue_depth": ("queue_depth", "policy"),
+                  "running": ("running", "policy")}
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Histogram:
+    """HDR 风格的延迟直方图
+
+    以微秒为单位记录，每个 2 的幂区间内按固定数量的子桶线性划分，
+    在很宽的取值范围内保持固定的相对精度，内存只与出现过的桶数有关。
+    """
+
+    def __init__(self):
+        self._counts: Dict[Tuple[int, int], int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    @staticmethod
+    def _bucket(micros: int) -> Tuple[int, int]:
+        shift = max(0, micros.bit_length() - SUB_BUCKET_BITS)
+        return shift, micros >> shift
+
+    @staticmethod
+    def _upper(bucket: Tuple[int, int]) -> float:
+        shift, mantissa = bucket
+        return (((mantissa + 1) << shift) - 1) / 1e6
+
+    def record(self, seconds: float):
+        seconds = max(0.0, seconds)
+        bucket = self._bucket(int(seconds * 1e6))
+        self._counts[bucket] = self._counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q: float) -> float:
+        """返回第 q 百分位（0-100）的值（秒），以所在桶的上界表示"""
+        if not self.count:
+            return 0.0
+        rank = max(1, int(round(q / 100.0 * self.count)))
+        seen = 0
+        for bucket in sorted(self._counts):
+            seen += self._counts[bucket]
+            if seen >= rank:
+                return min(self._upper(bucket), self.max)
+        return self.max
+
+    def cumulative(self, bounds: Tuple[float, ...]) -> List[int]:
+        """返回每个上界以内的累计计数"""
+        buckets = sorted(self._counts.items())
+        result = []
+        for bound in bounds:
+            result.append(sum(count for bucket, count in buckets if self._upper(bucket) <= bound))
+        return result
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class Span:
+    """一段被追踪的操作"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set(self, **attributes: Any):
+        """设置属性，值为 None 的属性忽略"""
+        for key, value in attributes.items():
+            if value is not None:
+                self.attributes[key] = value
+
+    def set_usage(self, usage: Optional[Dict[str, Any]]):
+        """记录 LLM 响应的 token 用量"""
+        if not usage:
+            return
+        self.set(prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"),
+                 cached_tokens=(usage.get("prompt_tokens_details") or {}).get("cached_tokens"))
+
+    @property
+    def duration(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e9
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Tracer:
+    """进程内的追踪器
+
+    span 的父子关系通过 contextvars 传递，asyncio 任务创建时继承当前 span。
+    每个 span 结束时按名称记入延迟直方图；配置了 export_path 时按 OTLP JSON 格式
+    （每行一个 ExportTraceServiceRequest）追加写入文件，可由 OpenTelemetry Collector 读取。
+    """
+
+    def __init__(self, service_name: str = "mcp", export_path: Optional[str] = None, enabled: bool = True):
+        """
+        Args:
+            service_name: 导出时的 service.name
+            export_path: OTLP JSON 追踪文件路径，为空时只记录直方图
+            enabled: 为 False 时 span 不做任何记录
+        """
+        self.service_name = service_name
+        self.export_path = export_path
+        self.enabled = enabled
+        self.histograms: Dict[str, Histogram] = {}
+        self._pending: List[Span] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """追踪一段操作，异常会记录在 span 上并继续抛出"""
+        span = Span(name, _current_span.get(), {k: v for k, v in attributes.items() if v is not None})
+        if not self.enabled:
+            yield span
+            return
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            self._finish(span)
+
+    def _finish(self, span: Span):
+        with self._lock:
+            self.histograms.setdefault(span.name, Histogram()).record(span.duration)
+            if self.export_path:
+                self._pending.append(span)
+                if len(self._pending) >= EXPORT_BATCH_SIZE:
+                    self._flush_locked()
+
+    def flush(self):
+        """把尚未写出的 span 写入追踪文件"""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending or not self.export_path:
+            return
+        spans, self._pending = self._pending, []
+        request = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": "mcp-tracing"}, "spans": [span.to_otlp() for span in spans]}],
+        }]}
+        try:
+            with open(self.export_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(request, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"写入追踪文件失败: {str(e)}")
+
+    def summary(self) -> str:
+        """各类 span 的延迟摘要，每类一行"""
+        lines = []
+        for name, histogram in sorted(self.histograms.items()):
+            stats = histogram.summary()
+            lines.append(f"{name}: {stats['count']} 次，p50 {stats['p50'] * 1000:.1f}ms，"
+                         f"p95 {stats['p95'] * 1000:.1f}ms，p99 {stats['p99'] * 1000:.1f}ms，"
+                         f"最大 {stats['max'] * 1000:.1f}ms")
+        return "\n".join(lines)
+
+    def prometheus_text(self, gauges: Optional[Dict[str, Any]] = None) -> str:
+        """导出 Prometheus 文本格式
+
+        Args:
+            gauges: 附加的统计字典，如 {"executor": executor.get_stats()}，
+                嵌套的数值展开为 mcp_<路径> gauge 指标，LABELLED_STATS 中的字典按键展开为标签
+        """
+        lines = ["# TYPE mcp_span_duration_seconds histogram"]
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            for name, histogram in histograms:
+                label = f'span="{name}"'
+                for bound, count in zip(PROMETHEUS_BUCKETS, histogram.cumulative(PROMETHEUS_BUCKETS)):
+                    lines.append(f'mcp_span_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f'mcp_span_duration_seconds_bucket{{{label},le="+Inf"}} {histogram.count}')
+                lines.append(f"mcp_span_duration_seconds_sum{{{label}}} {histogram.total}")
+                lines.append(f"mcp_span_duration_seconds_count{{{label}}} {histogram.count}")
+        # 同名指标的样本必须连续输出，先按指标名分组
+        metrics: Dict[str, List[Tuple[str, float]]] = {}
+        for path, labels, value in _flatten(gauges or {}, "mcp"):
+            metrics.setdefault(path, []).append((labels, value))
+        for path, samples in metrics.items():
+            lines.append(f"# TYPE {path} gauge")
+            lines.extend(f"{path}{labels} {value}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+def _metric_name(prefix: str, key: Any) -> str:
+    return f"{prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', str(key))}"
+
+
+def _label_value(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _flatten(stats: Dict[str, Any], prefix: str, labels: str = "") -> Iterator[Tuple[str, str, float]]:
+    """把嵌套统计展开为 (指标名, 标签文本, 数值)"""
+    for key, value in stats.items():
+        if key in LABELLED_STATS and isinstance(value, dict):
+            part, label = LABELLED_STATS[key]
+            path = _metric_name(prefix, part)
+            for name, item in value.items():
+                item_labels = f'{labels[:-1] + "," if labels else "{"}{label}="{_label_value(name)}"}}'
+                if isinstance(item, dict):
+                    yield from _flatten(item, path, item_labels)
+                elif isinstance(item, (int, float)) and not isinstance(item, bool):
+                    yield path, item_labels, item
+            continue
+        path = _metric_name(prefix, key)
+        if isinstance(value, dict):
+            yield from _flatten(value, path, labels)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, labels, value
+
+
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer(params: Optional[Dict[str, Any]] = None) -> Tracer:
+    """获取进程内共享的追踪器，首次调用时按参数创建
+
+    Args:
+        params: Config.get_tracing_params() 返回的参数字典
+    """
+    global _tracer
+    if _tracer is None:
+        params = params or {}
+        _tracer = Tracer(
+            service_name=params.get("service_name", "mcp"),
+            export_path=params.get("export_path"),
+            enabled=params.get("enabled", True),
+        )
+    return _tracer
@@ -0,0 +1,411 @@
+"""stdio MCP 服务器的预热进程池
+
+常驻的池管理进程预先启动若干个服务器进程并完成 initialize 和 tools/list，
+客户端经 Unix 套接字连接时直接分到一个已预热的进程，省去解释器启动和模块导入的时间。
+池管理进程在套接字和服务器的 stdin/stdout 之间按行转发 JSON-RPC 消息，
+客户端断开后进程回到池中供下一个客户端使用（服务器允许重新 initialize）。
+
+用法:
+    python warm_pool.py                                   # 预热 testsever/main.py
+    python warm_pool.py --size 4 --socket /tmp/mcp.sock -- python testsever/main.py
+    python warm_pool.py -m mcp_server_fetch
+    python mcp_client.py --mode warm-pool /tmp/mcp.sock
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import signal
+import sys
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Set
+
+import anyio
+from mcp import types
+from mcp.shared.message import SessionMessage
+
+# 单条 JSON-RPC 消息（一行）的最大长度
+STREAM_LIMIT = 64 * 1024 * 1024
+# 预热请求的 id，与客户端的整数 id 不会冲突
+WARM_INIT_ID = "warm-pool-initialize"
+WARM_TOOLS_ID = "warm-pool-tools"
+# 预热超时、客户端断开后等待未完成请求的时间和进程启动失败后的重试间隔（秒）
+WARM_TIMEOUT = 60.0
+DRAIN_TIMEOUT = 5.0
+RESPAWN_DELAY = 1.0
+
+
+def process_tree_rss_kb(pid: int) -> int:
+    """进程及其子进程（如服务器的工作进程）的常驻内存合计（KB），非 Linux 系统返回 0"""
+    total = 0
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1])
+                    break
+    except OSError:
+        return 0
+    for path in glob.glob(f"/proc/{pid}/task/*/children"):
+        try:
+            with open(path, "r") as f:
+                total += sum(process_tree_rss_kb(int(child)) for child in f.read().split())
+        except OSError:
+            continue
+    return total
+
+
+def _parse(line: bytes) -> Optional[Dict[str, Any]]:
+    try:
+        message = json.loads(line)
+    except ValueError:
+        return None
+    return message if isinstance(message, dict) else None
+
+
+class WarmProcess:
+    """池中的一个服务器进程"""
+
+    def __init__(self, process: asyncio.subprocess.Process):
+        self.process = process
+        self.calls = 0
+        self.sessions = 0
+        self.client: Optional[asyncio.StreamWriter] = None
+        # 已转发给服务器、尚未收到响应的请求 id
+        self.pending: Set[Any] = set()
+        self.drained = asyncio.Event()
+        self.drained.set()
+        self.ready = asyncio.Event()
+        self.warmed = False
+        self.retiring = False
+        self.reader_task: Optional[asyncio.Task] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.process.returncode is None
+
+    def send(self, message: Dict[str, Any]):
+        self.process.stdin.write((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+
+
+class WarmPool:
+    """预热进程池
+
+    池中保持 size 个空闲的已预热进程；没有空闲进程时为客户端临时冷启动一个，
+    保证不比直接启动更慢。进程在累计 max_calls 次工具调用或内存超过 max_rss_mb 后，
+    于客户端断开时退役并由新进程补充；意外退出的进程同样会被补充。
+    """
+
+    def __init__(self, command: List[str], size: int = 2, max_calls: int = 1000, max_rss_mb: float = 512.0,
+                 cwd: Optional[str] = None):
+        """
+        Args:
+            command: 服务器命令及参数
+            size: 保持预热的空闲进程数
+            max_calls: 单个进程最多处理的工具调用数，0 表示不限制
+            max_rss_mb: 单个进程（含子进程）的内存上限（MB），0 表示不限制
+            cwd: 服务器进程的工作目录
+        """
+        self.command = command
+        self.size = max(0, size)
+        self.max_calls = max_calls
+        self.max_rss_kb = max_rss_mb * 1024
+        self.cwd = cwd
+        self._idle: List[WarmProcess] = []
+        self._spawning = 0
+        self._tasks: Set[asyncio.Task] = set()
+        self._closed = False
+        self.stats = {"spawned": 0, "handed_out": 0, "cold_starts": 0, "recycled": 0, "crashed": 0}
+
+    def _background(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _spawn(self) -> WarmProcess:
+        """启动一个服务器进程并完成预热"""
+        process = await asyncio.create_subprocess_exec(
+            *self.command, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            cwd=self.cwd, limit=STREAM_LIMIT,
+        )
+        warm = WarmProcess(process)
+        warm.reader_task = asyncio.ensure_future(self._pump_stdout(warm))
+        self.stats["spawned"] += 1
+        warm.send({"jsonrpc": "2.0", "id": WARM_INIT_ID, "method": "initialize", "params": {
+            "protocolVersion": types.LATEST_PROTOCOL_VERSION,
+            "capabilities": {},
+            "clientInfo": {"name": "warm-pool", "version": "1.0"},
+        }})
+        warm.send({"jsonrpc": "2.0", "method": "notifications/initialized"})
+        # tools/list 让服务器提前构建工具目录
+        warm.send({"jsonrpc": "2.0", "id": WARM_TOOLS_ID, "method": "tools/list"})
+        try:
+            await asyncio.wait_for(warm.ready.wait(), WARM_TIMEOUT)
+        except asyncio.TimeoutError:
+            await self._retire(warm)
+            raise RuntimeError(f"服务器进程 {process.pid} 未在 {WARM_TIMEOUT} 秒内完成预热")
+        if not warm.alive:
+            raise RuntimeError(f"服务器进程 {process.pid} 启动后退出，退出码 {process.returncode}")
+        return warm
+
+    async def _pump_stdout(self, warm: WarmProcess):
+        """把服务器输出转发给当前客户端，没有客户端时丢弃；输出结束即进程退出"""
+        stdout = warm.process.stdout
+        while True:
+            try:
+                line = await stdout.readline()
+            except (ValueError, asyncio.LimitOverrunError):
+                # 超长的行无法转发，视为进程异常
+                break
+            if not line:
+                break
+            message = _parse(line)
+            if message is not None and "method" not in message and message.get("id") is not None:
+                if message["id"] == WARM_TOOLS_ID:
+                    warm.warmed = True
+                    warm.ready.set()
+                    continue
+                if message["id"] == WARM_INIT_ID:
+                    continue
+                warm.pending.discard(message["id"])
+                if not warm.pending:
+                    warm.drained.set()
+            client = warm.client
+            if client is not None and not client.is_closing():
+                client.write(line)
+        await warm.process.wait()
+        warm.ready.set()
+        warm.drained.set()
+        if warm.client is not None:
+            warm.client.close()
+        # 预热未完成就退出的进程由 _spawn 报错处理
+        if warm.warmed and not warm.retiring:
+            self.stats["crashed"] += 1
+            print(f"服务器进程 {warm.process.pid} 意外退出，退出码 {warm.process.returncode}", file=sys.stderr)
+            if warm in self._idle:
+                self._idle.remove(warm)
+            self._fill()
+
+    def _fill(self):
+        """补充空闲进程到 size 个"""
+        while not self._closed and len(self._idle) + self._spawning < self.size:
+            self._spawning += 1
+            self._background(self._spawn_idle())
+
+    async def _spawn_idle(self):
+        try:
+            while not self._closed:
+                try:
+                    warm = await self._spawn()
+                except Exception as e:
+                    print(f"预热服务器进程失败: {str(e)}", file=sys.stderr)
+                    await asyncio.sleep(RESPAWN_DELAY)
+                    continue
+                if self._closed:
+                    await self._retire(warm)
+                else:
+                    self._idle.append(warm)
+                return
+        finally:
+            self._spawning -= 1
+
+    async def acquire(self) -> WarmProcess:
+        """取出一个空闲进程，没有时冷启动一个"""
+        while self._idle:
+            warm = self._idle.pop(0)
+            if warm.alive:
+                self._fill()
+                self.stats["handed_out"] += 1
+                return warm
+        self._fill()
+        self.stats["cold_starts"] += 1
+        warm = await self._spawn()
+        self.stats["handed_out"] += 1
+        return warm
+
+    async def release(self, warm: WarmProcess):
+        """客户端断开后回收进程：等待未完成的请求，检查调用次数和内存，决定放回池中还是退役"""
+        warm.client = None
+        warm.sessions += 1
+        try:
+            await asyncio.wait_for(warm.drained.wait(), DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+        exhausted = (self.max_calls and warm.calls >= self.max_calls) or \
+            (self.max_rss_kb and process_tree_rss_kb(warm.process.pid) > self.max_rss_kb)
+        if not warm.alive:
+            return
+        if warm.pending or exhausted or self._closed or len(self._idle) >= self.size:
+            # 仍有未完成请求的进程不能交给下一个客户端，否则会收到上一个会话的响应
+            self.stats["recycled"] += 1
+            await self._retire(warm)
+            self._fill()
+            return
+        self._idle.append(warm)
+
+    async def _retire(self, warm: WarmProcess):
+        """关闭 stdin 让服务器正常退出，超时后终止"""
+        warm.retiring = True
+        if warm.alive:
+            try:
+                warm.process.stdin.close()
+                await asyncio.wait_for(warm.process.wait(), DRAIN_TIMEOUT)
+            except (asyncio.TimeoutError, OSError):
+                if warm.alive:
+                    warm.process.kill()
+                    await warm.process.wait()
+        if warm.reader_task is not None:
+            await asyncio.gather(warm.reader_task, return_exceptions=True)
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """一个客户端连接独占一个服务器进程，直到断开"""
+        try:
+            warm = await self.acquire()
+        except Exception as e:
+            print(f"无法为客户端分配服务器进程: {str(e)}", file=sys.stderr)
+            writer.close()
+            return
+        warm.client = writer
+        try:
+            while warm.alive:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = _parse(line)
+                if message is not None and message.get("method") and message.get("id") is not None:
+                    warm.pending.add(message["id"])
+                    warm.drained.clear()
+                    if message["method"] == "tools/call":
+                        warm.calls += 1
+                warm.process.stdin.write(line)
+                await warm.process.stdin.drain()
+        except (ConnectionError, ValueError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+            await self.release(warm)
+
+    async def start(self):
+        self._fill()
+        while self._spawning and not self._idle:
+            await asyncio.sleep(0.05)
+
+    async def close(self):
+        """退役所有空闲进程，停止补充"""
+        self._closed = True
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(self._retire(warm) for warm in idle), return_exceptions=True)
+        for task in list(self._tasks):
+            task.cancel()
+
+    def summary(self) -> str:
+        return (f"启动 {self.stats['spawned']} 个进程，分配 {self.stats['handed_out']} 次"
+                f"（冷启动 {self.stats['cold_starts']} 次），退役 {self.stats['recycled']} 个，"
+                f"意外退出 {self.stats['crashed']} 个")
+
+
+async def serve(pool: WarmPool, socket_path: str):
+    """在 Unix 套接字上运行进程池，收到 SIGINT/SIGTERM 后退出"""
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    await pool.start()
+    server = await asyncio.start_unix_server(pool.handle_client, path=socket_path, limit=STREAM_LIMIT)
+    os.chmod(socket_path, 0o600)
+    print(f"预热进程池已启动: {socket_path}（{pool.size} 个空闲进程）", file=sys.stderr)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        server.close()
+        await pool.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        print(pool.summary(), file=sys.stderr)
+
+
+@asynccontextmanager
+async def warm_pool_client(socket_path: str):
+    """连接预热进程池的客户端传输，用法与 stdio_client 相同
+
+    Yields:
+        (read_stream, write_stream)，可直接交给 ClientSession
+    """
+    reader, writer = await asyncio.open_unix_connection(socket_path, limit=STREAM_LIMIT)
+    read_stream_writer, read_stream = anyio.create_memory_object_stream(0)
+    write_stream, write_stream_reader = anyio.create_memory_object_stream(0)
+
+    async def socket_reader():
+        try:
+            async with read_stream_writer:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    try:
+                        message = types.JSONRPCMessage.model_validate_json(line)
+                    except Exception as exc:
+                        await read_stream_writer.send(exc)
+                        continue
+                    await read_stream_writer.send(SessionMessage(message))
+        except anyio.ClosedResourceError:
+            await anyio.lowlevel.checkpoint()
+
+    async def socket_writer():
+        try:
+            async with write_stream_reader:
+                async for session_message in write_stream_reader:
+                    payload = session_message.message.model_dump_json(by_alias=True, exclude_none=True)
+                    writer.write((payload + "\n").encode("utf-8"))
+                    await writer.drain()
+        except (anyio.ClosedResourceError, ConnectionError):
+            await anyio.lowlevel.checkpoint()
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(socket_reader)
+        tg.start_soon(socket_writer)
+        try:
+            yield read_stream, write_stream
+        finally:
+            writer.close()
+            tg.cancel_scope.cancel()
+            await read_stream.aclose()
+            await write_stream.aclose()
+
+
+def main():
+    from config import get_config
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    params = get_config(os.path.join(root, "config.json")).get_warm_pool_params()
+
+    parser = argparse.ArgumentParser(description="stdio MCP 服务器预热进程池")
+    parser.add_argument("--socket", default=params["socket"], help="客户端连接的 Unix 套接字路径")
+    parser.add_argument("--size", type=int, default=params["size"], help="保持预热的空闲进程数")
+    parser.add_argument("--max-calls", type=int, default=params["max_calls"],
+                        help="单个进程处理多少次工具调用后退役，0 表示不限制")
+    parser.add_argument("--max-rss-mb", type=float, default=params["max_rss_mb"],
+                        help="单个进程内存超过多少 MB 后退役，0 表示不限制")
+    parser.add_argument("-m", "--module", help="以 python -m 方式启动的服务器模块")
+    parser.add_argument("command", nargs=argparse.REMAINDER,
+                        help="服务器命令，默认 python testsever/main.py")
+    args = parser.parse_args()
+
+    command = [arg for arg in args.command if arg != "--"]
+    if args.module:
+        command = [sys.executable, "-m", args.module]
+    elif not command:
+        command = [sys.executable, os.path.join(root, "testsever", "main.py")]
+    elif command[0].endswith(".py"):
+        command = [sys.executable] + command
+
+    pool = WarmPool(command, size=args.size, max_calls=args.max_calls, max_rss_mb=args.max_rss_mb)
+    asyncio.run(serve(pool, args.socket))
+
+
+if __name__ == "__main__":
+    main()